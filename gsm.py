@@ -22,19 +22,21 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
+import os
 import time
 import json
 import logging
 
 from gsm_io         import gsm_io
-from threading      import Thread, Lock
-from queue          import Queue
-
-#                 0-----------------------------------2f
-sms_alpha     = ("@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞ\x1bÆæßÉ"
-                 " !\"#¤%&'()*+,-./0123456789:;<=>?"
-                 "¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§"
-                 "¿abcdefghijklmnopqrstuvwxyzäöñüà")
+from gsm_codec      import encodeGSM7Text, decodeGSM7
+from gsm_pdu        import encodeSubmit, decodeDeliver, decodeStatusReport, pdu_parts, pdu_reports, pdu_status
+from gsm_auth       import gsm_auth
+from gsm_scheduler  import gsm_scheduler
+from gsm_dedup      import gsm_dedup
+from gsm_recorder   import gsm_recorder
+from gsm_capture    import gsm_capture
+from threading      import Thread, Lock, Event
+from queue          import Queue, Empty, Full
 
 class gsm(gsm_io):
 
@@ -48,6 +50,7 @@ class gsm(gsm_io):
     #ATCLCK1 = "AT+CLCK=\"SC\",1,\"0000\""  # enable code pin check, pin=0000
     ATCSCS = "AT+CSCS=\"GSM\""  # force GSM mode for SMS
     ATCMGF = "AT+CMGF=1"  # enable sms in text mode
+    ATCMGF0 = "AT+CMGF=0"  # enable sms in PDU mode
     ATCSDH = "AT+CSDH=1"  # enable more fields in sms read
     ATCMGS = "AT+CMGS="  # send message with prompt
     ATCMGD = "AT+CMGD="  # delete messages: =0,4 -> 4 means ignore the value 0 of index and delete all SMS messages from the message storage area
@@ -58,48 +61,129 @@ class gsm(gsm_io):
     ATCPMS = "AT+CPMS=\"ME\",\"ME\",\"ME\""  # storage is Mobile
     ATCSQ = "AT+CSQ"  # signal strength
     ATCREG = "AT+CREG?"  # registered on network ?
+    ATCPMSQ = "AT+CPMS?"  # storage used and total
     ATCNMI = "AT+CNMI=2,1,0,0,0"  # when sms arrives CMTI send to pc
+    ATCNMI1 = "AT+CNMI=2,1,0,1,0"  # when sms arrives CMTI send to pc, status reports sent with CDS
+    ATCSMP = "AT+CSMP=49,167,0,0"  # text mode sms ask for a status report
+    ATSTATE = "AT+CPIN?;+CMGF?;+CNMI?;+CPMS?"  # state kept by a modem across a gateway restart
+    ATPORTSEL = "AT^PORTSEL=1"  # Huawei: unsolicited result codes sent on the PC UI port
+    CHATTER = (b'^RSSI:', b'^BOOT:', b'^MODE:', b'^SRVST:', b'^SIMST:', b'^HCSQ:', b'^DSFLOWRPT:')  # Huawei status
+
+    SendTimeout = 60.0  # seconds, sending on network may be slow
+    FailuresMax = 3     # consecutive send failures before modem is seen as unhealthy
+    FailuresDelay = 60  # seconds before an unhealthy modem is used again
+    RecoverDelay = 1.0      # seconds before reopening a lost device, doubled at each attempt
+    RecoverDelayMax = 30.0
+    SupervisorPoll = 0.5    # seconds between two checks of the device
+    DeleteDelay = 1.0       # seconds reading goes on before read sms must be acknowledged and deleted
+    AckPoll = 0.05          # seconds between two checks of acknowledgements
+    TelemetryQueries = (("rssi", ATCSQ), ("registration", ATCREG), ("storage", ATCPMSQ))
 
-    def __init__(self, loglevel, name: str, mode: str, device: str, pin: str, auth: str, recv: str, mqtt_client):
+    def __init__(self, loglevel, name: str, mode: str, device: str, pin: str, auth: str, recv: str, mqtt_client, *,
+                 sweep: int = 60, status: str = "sms_status", queue_size: int = 100, overflow: str = "reject",
+                 workers: int = 1, pdu: bool = False, reports: bool = False, rate: float = 0, rate_number: float = 0,
+                 coalesce: float = 0, warm: bool = False, notify: str = "", telemetry: float = 60,
+                 trace: int = gsm_recorder.Size, capture: str = ""):
         self.GsmReaderThread = None
+        self.GsmSenderThreads = []
+        self.GsmSupervisorThread = None
         self.GsmMode = mode
         self.MQTTClient = mqtt_client
         self.ATCPIN = "AT+CPIN=\""+pin+"\""  # set pin code
         self.ATCLCK0 = "AT+CLCK=\"SC\",0,\""+pin+"\""  # disable code pin check, pin=0000
         self.ATCLCK1 = "AT+CLCK=\"SC\",1,\""+pin+"\""  # enable code pin check, pin=0000
-        self.GsmIoOKReceived = None
-        self.GsmIoCMSSReceived = None
         self.GsmPIN = pin
-        self.Auth = auth
+        self.Auth = auth if isinstance(auth, gsm_auth) else gsm_auth(auth)
         self.Recv = recv
         self.Ready = False
         self.Name = name
         self.GsmApiSem = Lock()
-        self.GsmMutex = Lock()
-        self.SMSQueue = Queue()
-        self.GsmIoPrompt = False
-        self.GsmIoSmsIdReceived = False
+        self.NewSmsQueue = Queue()      # storage indexes announced by +CMTI
+        self.Sweep = sweep              # seconds between two CMGL sweeps of the storage
+        self.Status = status
+        self.SendQueue = gsm_scheduler(queue_size, rate, rate_number, coalesce)
+        self.SendOverflow = overflow    # 'reject' new sms or drop 'oldest' one when queue is full
+        self.SendWorkers = workers
+        self.SendStatsSem = Lock()
+        self.SendInFlight = 0
+        self.SendCount = 0
+        self.SendFailed = 0
+        self.SendDropped = 0
+        self.SendFailures = 0           # consecutive failures
+        self.SendFailedAt = 0.0
+        self.SendFailover = None        # set by gsm_pool to move failed sms to another modem
+        self.Journal = None             # set by gsm_pool to keep sms across restarts
+        self.Dedup = None               # set by gsm_pool to drop sms read twice
+        self.Publisher = None           # set by gsm_pool, publish stage of received sms
+        self.InboundSem = Lock()
+        self.InboundUnacked = 0         # received sms published, not yet acknowledged by the broker
+        self.DeletePending = False      # sms read, to be deleted from storage once acknowledged
+        self.DeleteSince = 0.0
+        self.Pdu = pdu                  # PDU mode instead of text mode
+        self.PduReference = 0           # reference of concatenated sms sent
+        self.PduParts = pdu_parts()     # parts of concatenated sms received
+        self.StatusReports = reports    # ask for status reports of sent sms
+        self.Reports = pdu_reports()    # sent sms waiting for their status report
+        self.WarmStart = warm           # keep modem state and stored sms when it is already set up
+        self.DeviceUp = Event()         # cleared while a lost device is being reopened
+        self.DeviceUp.set()
+        self.Recoveries = 0
+        self.TelemetryInterval = telemetry  # seconds between two samples of signal, registration and storage
+        self.Telemetry = {}             # last sample, read without querying the modem
+        self.TelemetryDue = 0.0
+        self.TelemetryPending = []      # queries of the sample in progress
+        self.TelemetryValues = {}
         self.Opened = False
-        self.SmsList = []
-        self.GsmIoCMGLReceived = False
-        self.GsmIoCMGRReceived = False
         # set logger
         # DEBUG INFO WARNING ERROR CRITICAL
         # logging.basicConfig(filename='example.log', encoding='utf-8', level=logging.DEBUG)
         logging.basicConfig(format='%(asctime)s %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p', level=loglevel)
         gsm_io.__init__(self, loglevel, device)  # since inherited, needs to be called explicitly
+        self.MetricsName = name
+        if trace and mode == "modem":
+            self.Recorder = gsm_recorder(name, trace, mqtt_client, status+"/trace")
+        if capture and mode == "modem":
+            self.Capture = gsm_capture(capture)
+        self.GsmIoHandlers[b'+CMTI:'] = self.onGsmCMTI
+        self.GsmIoHandlers[b'+CDS:'] = self.onGsmCDS
+        self.GsmIoHandlers[b'+CDSI:'] = self.onGsmCMTI     # status report in storage, read as an sms
+        self.GsmIoHandlers[b'+CMGL:'] = self.onGsmSmsHeader
+        self.GsmIoHandlers[b'+CMGR:'] = self.onGsmSmsHeader
+        for key in gsm.CHATTER:
+            self.GsmIoHandlers[key] = self.onGsmChatter         # not mixed with lines of a command response
+        self.Notify = None
+        if notify and mode == "modem":
+            # second port of the dongle, only read: unsolicited result codes go to the same handlers,
+            # final result codes only complete commands of the command port
+            self.Notify = gsm_io(loglevel, notify)
+            self.Notify.MetricsName = name
+            self.Notify.Recorder = self.Recorder        # lines of both ports in one trace
+            self.Notify.RecorderRx = gsm_recorder.NOTIFY
+            self.Notify.Capture = self.Capture
+            self.Notify.CaptureRx = "rx2"
+            self.Notify.GsmIoHandlers = {key: handler for key, handler in self.GsmIoHandlers.items()
+                                         if handler != self.onGsmIoFinal}
 
     def __del__(self):
         gsm_io.__del__(self)  # since inherited, needs to be called explicitly
 
+    def open(self):
+        # open and init the device, nothing is published yet: may run while MQTT connects
+        if self.GsmMode == "modem" and not self.Opened:
+            if self.openGsmIoDevice():
+                self.startGsmIoActivity()
+                self.openGsmNotify()
+                self.initGsmDevice()
+
     def start(self):
         if self.GsmMode == "modem":
-            self.Opened = self.openGsmIoDevice()
+            self.open()
             if self.Opened:
-                self.startGsmIoActivity()
-                self.initGsmDevice()
                 self.Ready = True
+                self.replaySms()
                 self.startGsmReader()
+                self.startGsmSender()
+                self.startGsmSupervisor()
             else:
                 self.Ready = False
         else:
@@ -107,91 +191,326 @@ class gsm(gsm_io):
 
     def stop(self):
         if self.Ready:
+            self.stopGsmSupervisor()
+            self.stopGsmSender()
             self.stopGsmReader()
             self.stopGsmIoActivity()
             if self.GsmMode == "modem":
                 self.closeGsmIoDevice()
+                self.closeGsmNotify()
+        if self.Capture is not None:
+            self.Capture.close()
         self.Ready = False
 
+    # Flows are generators yielding (frame, payload, timeout) for each AT command and receiving its at_command,
+    # they are run by runFlow here, and by the event loop in gsm_async
+
+    def runFlow(self, flow):
+        # run flow commands one after the other, returns flow result
+        self.GsmApiSem.acquire()
+        held = time.monotonic()
+        try:
+            command = None
+            while True:
+                frame, payload, timeout = flow.send(command)
+                command = self.writeCommandAndWaitOK(frame, payload, timeout)
+        except StopIteration as stop:
+            return stop.value
+        finally:
+            if self.Metrics is not None:
+                self.Metrics.observe("gsm_api_lock_seconds", time.monotonic() - held, modem=self.Name)
+            self.GsmApiSem.release()
+
+    def initGsmFlow(self, wipe: bool = True):
+        logging.debug("Init GSM device")
+        commands = [gsm.ATZ, gsm.ATE0, self.ATCPIN, gsm.ATCMGF0 if self.Pdu else gsm.ATCMGF,
+                    gsm.ATCNMI1 if self.StatusReports else gsm.ATCNMI,
+                    gsm.ATCSCS, gsm.ATCPMS, gsm.ATCLIP, gsm.ATCSDH]
+        if wipe:
+            commands.append(gsm.ATCMGD+"0,4")
+        if self.StatusReports and not self.Pdu:
+            commands.append(gsm.ATCSMP)
+        if self.notifyOpened():
+            commands.append(gsm.ATPORTSEL)
+        for data in commands:
+            yield bytes(data, 'ascii'), None, None
+            logging.debug(f"... %s sent", data)
+        logging.debug("... Init GSM device done")
+
+    def warmInitGsmFlow(self):
+        # modem state is queried in one command line, settings differing from it are sent in another one,
+        # no reset and sms stored while the gateway was down are kept for the first sweep
+        logging.debug("Warm init GSM device")
+        yield bytes(gsm.ATE0, 'ascii'), None, None
+        state = yield bytes(gsm.ATSTATE, 'ascii'), None, None
+        if not state.ok:
+            logging.warning(f"... modem state unknown (%s), resetting it", state.Error)
+            yield from self.initGsmFlow(wipe=False)
+            return
+        if state.value(b'+CPIN:') != b'READY':
+            yield bytes(self.ATCPIN, 'ascii'), None, None
+        wanted = [gsm.ATCMGF0 if self.Pdu else gsm.ATCMGF, gsm.ATCNMI1 if self.StatusReports else gsm.ATCNMI]
+        settings = [setting for setting in wanted if not gsm.isSet(state, setting)]
+        if (state.value(b'+CPMS:') or b'').split(b',')[0::3] != [b'"ME"'] * 3:
+            settings.append(gsm.ATCPMS)
+        # not queried, set in the same command line
+        settings += [gsm.ATCSCS, gsm.ATCSDH]
+        if self.StatusReports and not self.Pdu:
+            settings.append(gsm.ATCSMP)
+        command = yield bytes("AT" + ";".join(setting[2:] for setting in settings), 'ascii'), None, None
+        if not command.ok:
+            for setting in settings:
+                yield bytes(setting, 'ascii'), None, None
+        if self.notifyOpened():
+            # Huawei only, other modems send them on their own port, read as well
+            yield bytes(gsm.ATPORTSEL, 'ascii'), None, None
+        logging.debug(f"... Warm init GSM device done, %d setting(s) sent", len(settings))
+
+    @staticmethod
+    def isSet(state, setting: str) -> bool:
+        # AT+CMGF=1 is set if state lines have +CMGF: 1
+        name, value = setting[2:].split('=')
+        return state.value(bytes(name+':', 'ascii')) == bytes(value, 'ascii')
+
+    def openGsmNotify(self):
+        # reader of the notification port, commands never wait behind unsolicited result codes
+        if self.Notify is not None:
+            if self.Notify.openGsmIoDevice():
+                self.Notify.startGsmIoActivity()
+            else:
+                logging.warning(f"... notifications read on %s only", self.GsmDevice)
+
+    def closeGsmNotify(self):
+        if self.Notify is not None:
+            if self.Notify.Opened:
+                self.Notify.stopGsmIoActivity()
+                self.Notify.closeGsmIoDevice()
+            self.Notify.resetGsmIo()
+
+    def notifyOpened(self) -> bool:
+        return self.Notify is not None and self.Notify.Opened
+
     def initGsmDevice(self):
         if self.Opened:
-            logging.debug("Init GSM device")
-            self.GsmApiSem.acquire()
-            frame = bytes(gsm.ATZ, 'ascii')
-            self.writeCommandAndWaitOK(frame)
-            logging.debug("... ATZ sent")
-            frame = bytes(gsm.ATE0, 'ascii')
-            self.writeCommandAndWaitOK(frame)
-            logging.debug("... ATE0 sent")
-            frame = bytes(self.ATCPIN, 'ascii')
-            self.writeCommandAndWaitOK(frame)
-            logging.debug("... ATCPIN sent")
-            frame = bytes(gsm.ATCMGF, 'ascii')
-            self.writeCommandAndWaitOK(frame)
-            logging.debug("... ATCMGF sent")
-            frame = bytes(gsm.ATCNMI, 'ascii')
-            self.writeCommandAndWaitOK(frame)
-            logging.debug("... ATCNMI sent")
-            frame = bytes(gsm.ATCSCS, 'ascii')
-            self.writeCommandAndWaitOK(frame)
-            logging.debug("... ATCSCS sent")
-            frame = bytes(gsm.ATCPMS, 'ascii')
-            self.writeCommandAndWaitOK(frame)
-            logging.debug("... ATCPMS sent")
-            frame = bytes(gsm.ATCLIP, 'ascii')
-            self.writeCommandAndWaitOK(frame)
-            logging.debug("... ATCLIP sent")
-            frame = bytes(gsm.ATCSDH, 'ascii')
-            self.writeCommandAndWaitOK(frame)
-            logging.debug("... ATCSDH sent")
-            frame = bytes(gsm.ATCMGD+"0,4", 'ascii')
-            self.writeCommandAndWaitOK(frame)
-            logging.debug("... ATCMGD sent")
-            self.GsmApiSem.release()
-            logging.debug("... Init GSM device done")
+            self.runFlow(self.warmInitGsmFlow() if self.WarmStart else self.initGsmFlow())
         else:
             logging.error("Init GSM device, not opened !")
 
-    def sendSmsToNumber(self, number, message):
-        if self.Opened:
-            # message is string utf-8
-            # has to be converted to bytes to be sent on modem
-            logging.info(f"... Send SMS")
-            self.GsmApiSem.acquire()
-            self.GsmMutex.acquire()
-            self.GsmIoSmsIdReceived = False
-            self.GsmIoCMSSReceived = False
-            self.GsmIoPrompt = False
-            self.GsmMutex.release()
-            data = gsm.ATCMGW+"\""+number+"\""
-            frame = bytes(data, 'utf-8')
-            self.writeCommandAndWaitOK(frame)           # writes bytes on modem
-            logging.debug("... ATCMGW sent")
-            while not self.GsmIoPromptReceived:
-                time.sleep(0.001)
-            # prepare (encode) and send message
-            self.GsmIoOKReceived = False
-            self.GsmIoSmsIdReceived = False
-            frame = self.encodeUTF8toGSM7(message)     # encode utf-8 to gsm-7
-            self.GsmIoSmsIdReceived = False
-            self.writeData(frame)
-            # wait transmission
-            while not self.GsmIoOKReceived:
-                time.sleep(0.001)
-            while not self.GsmIoSmsIdReceived:
-                time.sleep(0.001)
-            logging.debug("... id received")
-            # Id received is bytes
-            data = gsm.ATCMSS+self.GsmIoMessageId.decode('ascii')
-            frame = bytes(data, 'utf-8')               # writes bytes on modem
-            self.writeCommandAndWaitOK(frame)
-            logging.debug("... ATCMSS sent")
-            # cmss will arrive before 'ok'
-            self.GsmApiSem.release()
+    def sendSmsFlow(self, to, message, sms_id=None):
+        # to is a number, or a list of numbers for a broadcast
+        if self.Pdu:
+            numbers = to if isinstance(to, list) else [to]
+            sent = 0
+            for number in numbers:
+                sent += yield from self.sendSmsPduFlow(number, message, sms_id)
+            return sent == len(numbers)
+        if isinstance(to, list):
+            return (yield from self.sendSmsToNumbersFlow(to, message, sms_id))
+        return (yield from self.sendSmsToNumberFlow(to, message, sms_id))
+
+    def sendSmsToNumberFlow(self, number, message, sms_id=None):
+        # message is string utf-8
+        # has to be converted to bytes to be sent on modem
+        logging.info(f"... Send SMS")
+        payload = self.encodeUTF8toGSM7(message)     # encode utf-8 to gsm-7
+        data = gsm.ATCMGS+"\""+number+"\""
+        # text is written after prompt, +CMGS: <mr> is received before 'ok'
+        command = yield bytes(data, 'utf-8'), payload, gsm.SendTimeout
+        logging.debug("... ATCMGS sent")
+        if command.ok:
+            self.trackReport(sms_id, number, [command.value(b'+CMGS:')])
             logging.info(f"...... SMS sent")
             logging.info("")
+            return True
+        logging.error(f"...... SMS not sent: %s", command.Error)
+        return False
+
+    def sendSmsToNumbersFlow(self, numbers, message, sms_id=None):
+        # broadcast: text is stored once, sent to each number, then deleted
+        logging.info(f"... Send SMS to %d numbers", len(numbers))
+        payload = self.encodeUTF8toGSM7(message)     # encode utf-8 to gsm-7
+        sent = 0
+        data = gsm.ATCMGW+"\""+numbers[0]+"\""
+        # text is written after prompt, id is received before 'ok'
+        command = yield bytes(data, 'utf-8'), payload, gsm.SendTimeout
+        logging.debug("... ATCMGW sent")
+        message_id = command.value(b'+CMGW:') if command.ok else None
+        if command.ok and message_id is None:
+            # OK without +CMGW: index, nothing to send with AT+CMSS nor to delete
+            logging.error(f"...... SMS stored without index, not sent")
+        elif command.ok:
+            message_id = message_id.decode('ascii')
+            for number in numbers:
+                data = gsm.ATCMSS+message_id+",\""+number+"\""
+                # cmss will arrive before 'ok'
+                command = yield bytes(data, 'utf-8'), None, gsm.SendTimeout
+                logging.debug("... ATCMSS sent")
+                if command.ok:
+                    sent += 1
+                    self.trackReport(sms_id, number, [command.value(b'+CMSS:')])
+                else:
+                    logging.error(f"...... SMS to %s not sent: %s", number, command.Error)
+            yield bytes(gsm.ATCMGD+message_id+",0", 'ascii'), None, None
         else:
-            logging.error("GSM device, not opened !")
+            logging.error(f"...... SMS not stored: %s", command.Error)
+        logging.info(f"...... SMS sent to %d of %d numbers", sent, len(numbers))
+        logging.info("")
+        return sent == len(numbers)
+
+    def sendSmsPduFlow(self, number, message, sms_id=None):
+        # GSM-7 or UCS-2, concatenated sms when too long
+        logging.info(f"... Send SMS in PDU mode")
+        self.PduReference = (self.PduReference + 1) & 0xff
+        pdus = encodeSubmit(number, message, self.PduReference, self.StatusReports)
+        references = []
+        for length, pdu in pdus:
+            frame = bytes(gsm.ATCMGS+str(length), 'ascii')
+            command = yield frame, bytes(pdu, 'ascii') + b'\x1A', gsm.SendTimeout
+            logging.debug("... ATCMGS sent")
+            if not command.ok:
+                logging.error(f"...... SMS not sent: %s", command.Error)
+                return False
+            references.append(command.value(b'+CMGS:'))
+        self.trackReport(sms_id, number, references)
+        logging.info(f"...... SMS sent in %d part(s)", len(pdus))
+        logging.info("")
+        return True
+
+    def sendSms(self, to, message, sms_id=None):
+        if self.Opened:
+            return self.runFlow(self.sendSmsFlow(to, message, sms_id))
+        logging.error("GSM device, not opened !")
+        return False
+
+    def sendSmsToNumber(self, number, message):
+        return self.sendSms(number, message)
+
+    def sendSmsToNumbers(self, numbers, message):
+        return self.sendSms(numbers, message)
+
+    def queueSms(self, number, message, sms_id=None, priority="normal", replay=False):
+        # called from MQTT callback, sms is sent later by a sender thread.
+        # replay: sms accepted before (journal, failover) goes past the queue bound, it is never rejected
+        try:
+            if not self.SendQueue.put(number, message, sms_id, priority, bounded=not replay):
+                logging.info(f"... same SMS to %s already queued, coalesced", number)
+                if self.Metrics is not None:
+                    self.Metrics.inc("sms_coalesced_total", modem=self.Name)
+                self.ackSms(sms_id)
+                return True
+        except Full:
+            if self.SendOverflow == "oldest":
+                try:
+                    dropped = self.SendQueue.dropOldest()
+                    logging.error(f"... Send queue full, dropping oldest SMS to %s", dropped[0])
+                    self.ackSms(dropped[2], False)
+                except Empty:
+                    pass
+                with self.SendStatsSem:
+                    self.SendDropped += 1
+                if self.Metrics is not None:
+                    self.Metrics.inc("sms_dropped_total", modem=self.Name)
+                return self.queueSms(number, message, sms_id, priority)
+            logging.error(f"... Send queue full, rejecting SMS to %s", number)
+            with self.SendStatsSem:
+                self.SendDropped += 1
+            if self.Metrics is not None:
+                self.Metrics.inc("sms_dropped_total", modem=self.Name)
+            self.publishSendStatus()
+            return False
+        self.publishSendStatus()
+        return True
+
+    @property
+    def Healthy(self):
+        # a failing modem gets traffic again after a while
+        if not self.DeviceUp.is_set() or self.Telemetry.get("registered") is False:
+            return False
+        return self.SendFailures < gsm.FailuresMax or time.monotonic() - self.SendFailedAt > gsm.FailuresDelay
+
+    def publishSendStatus(self):
+        with self.SendStatsSem:
+            status = {"queued": self.SendQueue.qsize(), "in_flight": self.SendInFlight,
+                      "sent": self.SendCount, "failed": self.SendFailed, "dropped": self.SendDropped,
+                      "coalesced": self.SendQueue.Coalesced, "priorities": self.SendQueue.stats()}
+        status["modem"] = self.Name
+        self.MQTTClient.publish(self.Status, json.dumps(status), retain=True)
+
+    # Start sender threads
+    def startGsmSender(self):
+        if self.Opened:
+            logging.debug("Starting GSM Sender")
+            for i in range(self.SendWorkers):
+                sender = Thread(target=self.runGsmSenderThread, args=(i,))
+                sender.daemon = True
+                sender.isRunning = True
+                self.GsmSenderThreads.append(sender)
+                sender.start()
+            logging.debug("... GSM Sender started")
+
+    # Stop sender threads
+    def stopGsmSender(self):
+        if self.GsmSenderThreads:
+            logging.debug("Stopping GSM Sender")
+            for sender in self.GsmSenderThreads:
+                sender.isRunning = False
+            for sender in self.GsmSenderThreads:
+                sender.join()
+            self.GsmSenderThreads = []
+            logging.debug("... GSM Sender stopped")
+
+    def runGsmSenderThread(self, worker):
+        # drain send queue to the modem
+        sender = self.GsmSenderThreads[worker]
+        while getattr(sender, "isRunning", True):
+            if not self.DeviceUp.wait(1.0):
+                continue
+            try:
+                number, message, sms_id, priority, queued = self.SendQueue.get(timeout=1.0)
+            except Empty:
+                continue
+            self.sendStarted(priority, queued)
+            sent = self.sendSms(number, message, sms_id)
+            self.sendDone(number, message, sent, sms_id, priority)
+
+    def sendStarted(self, priority="normal", queued=None):
+        with self.SendStatsSem:
+            self.SendInFlight += 1
+        if self.Metrics is not None and queued is not None:
+            self.Metrics.observe("sms_queue_wait_seconds", time.monotonic() - queued, modem=self.Name,
+                                 priority=priority)
+        self.publishSendStatus()
+
+    def sendDone(self, number, message, sent, sms_id=None, priority="normal"):
+        if not sent and self.lostGsmDevice():
+            # not a send failure, sms is sent again once the device is back
+            with self.SendStatsSem:
+                self.SendInFlight -= 1
+            self.SendQueue.requeue(number, message, sms_id, priority)
+            return
+        with self.SendStatsSem:
+            self.SendInFlight -= 1
+            if sent:
+                self.SendCount += 1
+                self.SendFailures = 0
+            else:
+                self.SendFailed += 1
+                self.SendFailures += 1
+                self.SendFailedAt = time.monotonic()
+        if self.Metrics is not None:
+            self.Metrics.inc("sms_sent_total" if sent else "sms_send_failed_total", modem=self.Name)
+        self.publishSendStatus()
+        if not sent and self.SendFailover is not None and self.SendFailover(self, number, message, sms_id, priority):
+            return
+        self.ackSms(sms_id, sent)
+
+    def ackSms(self, sms_id, sent: bool = True):
+        # outbound sms is done with: sent, failed or dropped
+        if self.Journal is not None and sms_id is not None:
+            self.Journal.ackOutbox(sms_id)
+        if not sent and self.Dedup is not None and sms_id is not None:
+            # a request sent again with the same id is a retry, not a repeat
+            self.Dedup.forget("out:"+sms_id)
 
     # Start activity thread
     def startGsmReader(self):
@@ -205,222 +524,543 @@ class gsm(gsm_io):
 
     # Stop activity thread
     def stopGsmReader(self):
-        if self.Opened:
+        if self.GsmReaderThread is not None:
             logging.debug("Stopping GSM Reader")
             self.GsmReaderThread.isRunning = False
             self.GsmReaderThread.join()
             logging.debug("... GSM Reader stopped")
 
+    def onGsmCMTI(self, line: bytes):
+        # +CMTI: "ME",<index> announces a new sms, called from reader thread
+        index = line.split(b',')[-1].strip().decode('ascii')
+        logging.debug(f"... +CMTI received for index %s", index)
+        self.NewSmsQueue.put(index)
+
+    def onGsmSmsHeader(self, line: bytes):
+        # +CMGL: / +CMGR: header of a stored sms, the next line is its text or pdu even when it reads OK or ERROR,
+        # which would end the listing and leave the other sms marked as read. Text mode status reports
+        # (<fo>,<mr> after <stat> instead of "<oa>") have no such line
+        command = self.GsmIoCommand
+        if command is None:
+            return None
+        command.Lines.append(line)
+        fields = line.split(b',')
+        oa = 2 if line.startswith(b'+CMGL:') else 1
+        if self.Pdu or (len(fields) > oa and fields[oa].startswith(b'"')):
+            return self.onGsmSmsText
+        return None
+
+    def onGsmSmsText(self, line: bytes):
+        command = self.GsmIoCommand
+        if command is not None:
+            command.Lines.append(line)
+
+    def onGsmChatter(self, line: bytes):
+        # periodic status of Huawei dongles (^RSSI, ^BOOT, ...), dropped
+        pass
+
     def runGsmReaderThread(self):
         # SMS Reader, will post to MQTT
+        # new sms are read as soon as announced by +CMTI, storage is swept now and then as safety net.
+        # Read sms are deleted from storage once the broker acknowledged them all, a sweep waits for it
+        next_sweep = 0
+        recoveries = self.Recoveries
         while getattr(self.GsmReaderThread, "isRunning", True):
-            new_sms = self.readNewSms()
-            # {'Id': message_id, 'Number': number, 'Status': status, 'Msg': msg}
-            if new_sms is not None:
-                logging.info("")
-                logging.info("Receiving SMS as GSM-7 bytes string")
-                new_sms['Msg'] = self.decodeGSM7toUTF8(new_sms['Msg'])
-                logging.info(f"... Decoded to UTF-8 string: %s", new_sms['Msg'])
-                new_sms['Msg'] = self.encodeUTF8toJSON(new_sms['Msg'])
-                json_message = {"from": new_sms['Number'], "txt": new_sms['Msg']}
-                logging.info("...... Publishing it to mqtt as JSON on topic sms_received")
-                logging.debug(json_message)
-                self.MQTTClient.publish(self.Recv, json.dumps(json_message))
-            time.sleep(1)
+            if not self.DeviceUp.wait(1.0):
+                continue
+            if recoveries != self.Recoveries:
+                # sms received while the device was lost
+                recoveries, next_sweep = self.Recoveries, 0
+            if self.DeletePending and self.inboundAcked() and not self.lostGsmDevice():
+                self.deleteReadSms()
+                self.DeletePending = False
+            if self.inboundFull() or self.deleteOverdue():
+                # storage is freed before more sms are read
+                time.sleep(gsm.AckPoll)
+                continue
+            if time.monotonic() >= next_sweep and not self.DeletePending:
+                # the whole batch is published, deleted once acknowledged
+                for new_sms in self.readNewSms():
+                    self.publishSms(new_sms)
+                self.smsRead()
+                next_sweep = time.monotonic() + self.Sweep
+            for new_sms in self.PduParts.expired():
+                logging.warning(f"... Incomplete SMS from %s, %d part(s) received", new_sms['Number'], new_sms['Part'])
+                self.publishSms(new_sms)
+            # acknowledgements are checked often while sms wait for deletion
+            wait = gsm.AckPoll if self.DeletePending else min(1.0, max(0.0, next_sweep - time.monotonic()))
+            try:
+                index = self.NewSmsQueue.get(timeout=wait)
+            except Empty:
+                continue
+            self.publishSms(self.readSmsByIndex(index))
+            self.smsRead()
+
+    def setGsmIoLost(self, reason: str):
+        # senders and reader stop at once, supervisor reopens the device
+        gsm_io.setGsmIoLost(self, reason)
+        self.DeviceUp.clear()
+
+    def lostGsmDevice(self) -> bool:
+        return self.GsmIoLost.is_set() or not self.DeviceUp.is_set()
+
+    # Supervisor thread: reopens the device after a serial error, commands without response
+    # or device path gone (dongle reset), and samples telemetry while the modem is idle (a task with gsm_async)
+
+    def startGsmSupervisor(self):
+        if self.Opened:
+            self.GsmSupervisorThread = Thread(target=self.runGsmSupervisorThread)
+            self.GsmSupervisorThread.daemon = True
+            self.GsmSupervisorThread.Stop = Event()
+            self.GsmSupervisorThread.start()
+
+    def stopGsmSupervisor(self):
+        if self.GsmSupervisorThread is not None:
+            self.GsmSupervisorThread.Stop.set()
+            if not self.DeviceUp.is_set():
+                # recovery in progress is given up, its commands end at once
+                self.setGsmIoLost("stopped while recovering")
+                self.failGsmIoCommands()
+            self.GsmSupervisorThread.join()
+            self.GsmSupervisorThread = None
+
+    def runGsmSupervisorThread(self):
+        supervisor = self.GsmSupervisorThread
+        while not supervisor.Stop.wait(gsm.SupervisorPoll):
+            if self.checkGsmDevice():
+                self.recoverGsmDevice(supervisor)
+            elif self.TelemetryInterval:
+                self.sampleTelemetry()
+
+    def checkGsmDevice(self) -> bool:
+        # True when the device is lost and has to be reopened
+        if not self.GsmIoLost.is_set() and not os.path.exists(self.GsmDevice):
+            self.setGsmIoLost("device disappeared")
+        if not self.GsmIoLost.is_set() and self.Notify is not None and self.Notify.GsmIoLost.is_set():
+            self.setGsmIoLost("notification port lost")
+        return self.GsmIoLost.is_set()
+
+    def recoverGsmDevice(self, supervisor):
+        # queues are kept: senders and reader wait for DeviceUp, sms in flight are queued again
+        self.releaseGsmDevice()
+        delay = gsm.RecoverDelay
+        while not supervisor.Stop.wait(delay):
+            if self.reopenGsmDevice():
+                self.runFlow(self.warmInitGsmFlow())
+                if self.recoveredGsmDevice():
+                    return
+            delay = min(delay * 2, gsm.RecoverDelayMax)
+
+    def releaseGsmDevice(self):
+        self.DeviceUp.clear()
+        self.failGsmIoCommands()
+        self.stopGsmIoActivity()
+        self.closeGsmIoDevice()
+        self.closeGsmNotify()
+
+    def reopenGsmDevice(self) -> bool:
+        # a by-id path is resolved again, the dongle may come back on another tty
+        if os.path.exists(self.GsmDevice) and self.openGsmIoDevice():
+            logging.info(f"... %s reopened on %s", self.GsmDevice, os.path.realpath(self.GsmDevice))
+            self.resetGsmIo()
+            self.startGsmIoActivity()
+            self.openGsmNotify()
+            return True
+        return False
+
+    def recoveredGsmDevice(self) -> bool:
+        # after the set up of a reopened device, closed again when it failed
+        if not self.GsmIoLost.is_set():
+            self.Recoveries += 1
+            if self.Metrics is not None:
+                self.Metrics.inc("gsm_device_recoveries_total", modem=self.Name)
+            logging.info(f"... %s recovered", self.Name)
+            self.DeviceUp.set()
+            return True
+        self.failGsmIoCommands()
+        self.stopGsmIoActivity()
+        self.closeGsmIoDevice()
+        self.closeGsmNotify()
+        return False
+
+    def flowBusy(self) -> bool:
+        return self.GsmApiSem.locked()
+
+    def modemIdle(self) -> bool:
+        # no exchange in progress, no sms being sent or ready to be sent
+        if self.SendInFlight or self.flowBusy():
+            return False
+        delay = self.SendQueue.nextDelay()
+        return delay is None or delay > gsm.SupervisorPoll
+
+    def sampleTelemetry(self):
+        # one query per call and only when idle: a send waits at most for one query
+        query = self.nextTelemetryQuery()
+        if query is not None:
+            name, query = query
+            self.telemetryValue(name, self.runFlow(self.readTelemetryFlow(query)))
+
+    def nextTelemetryQuery(self):
+        # (name, query) to run now, None when telemetry is not due or the modem is busy
+        if not self.TelemetryPending:
+            if time.monotonic() < self.TelemetryDue:
+                return None
+            self.TelemetryPending = list(gsm.TelemetryQueries)
+            self.TelemetryValues = {}
+        if not self.modemIdle():
+            return None
+        return self.TelemetryPending.pop(0)
+
+    def telemetryValue(self, name, value):
+        self.TelemetryValues[name] = value
+        if not self.TelemetryPending:
+            self.TelemetryDue = time.monotonic() + self.TelemetryInterval
+            self.updateTelemetry(self.parseTelemetry(self.TelemetryValues))
 
     @staticmethod
-    def encodeUTF8toJSON(bytes_message):
-        # Be sure to escape " characters with \"
-        logging.debug('... Encode UTF-8 to JSON')
-        logging.debug(list(bytes_message))
-        result = []
-        for b in bytes_message:
-            if b == '"':
-                result.append('\\')
-            result.append(b)
-        return ''.join(result)
+    def readTelemetryFlow(query: str):
+        # value of the response line, None on error: AT+CREG? -> b'0,1'
+        command = yield bytes(query, 'ascii'), None, None
+        return command.value(bytes(query[2:].rstrip('?') + ':', 'ascii')) if command.ok else None
+
+    @staticmethod
+    def parseTelemetry(values):
+        # +CSQ: <rssi>,<ber>, rssi 0..31 is -113..-51 dBm, 99 is unknown
+        # +CREG: <n>,<stat>[,...], stat 1 home or 5 roaming is registered
+        # +CPMS: <mem1>,<used>,<total>,...
+        sample = {"rssi": None, "registered": None, "registration": None, "storage_used": None,
+                  "storage_total": None}
+        try:
+            if values.get("rssi") is not None:
+                rssi = int(values["rssi"].split(b',')[0])
+                sample["rssi"] = None if rssi == 99 else -113 + 2 * rssi
+            if values.get("registration") is not None:
+                sample["registration"] = int(values["registration"].split(b',')[1])
+                sample["registered"] = sample["registration"] in (1, 5)
+            if values.get("storage") is not None:
+                fields = values["storage"].split(b',')
+                sample["storage_used"], sample["storage_total"] = int(fields[1]), int(fields[2])
+        except (ValueError, IndexError):
+            logging.warning(f"... invalid telemetry: %s", values)
+        return sample
+
+    def updateTelemetry(self, sample):
+        # snapshot replaced at once, published (retained) only when a value changed
+        answered = any(value is not None for value in self.TelemetryValues.values())
+        last_ok = time.time() if answered else self.Telemetry.get("last_ok")
+        changed = any(self.Telemetry.get(name) != value for name, value in sample.items())
+        sample["last_ok"] = last_ok
+        self.Telemetry = sample
+        if changed:
+            if sample["registered"] is False:
+                logging.warning(f"... %s not registered on network (%s)", self.Name, sample["registration"])
+            telemetry = dict(sample, modem=self.Name)
+            self.MQTTClient.publish(self.Status+"/telemetry", json.dumps(telemetry), retain=True)
+
+    def trackReport(self, sms_id, number, references):
+        # message references (+CMGS: <mr>) of a sent sms, its status report is published when received
+        if not self.StatusReports:
+            return
+        try:
+            references = [int(reference) for reference in references]
+        except (TypeError, ValueError):
+            logging.warning(f"... no message reference for SMS to %s", number)
+            return
+        for record in self.Reports.track(sms_id, number, references):
+            self.publishReport(record)
+
+    def onGsmCDS(self, line: bytes):
+        # +CDS: <fo>,<mr>,[<ra>],[<tora>],<scts>,<dt>,<st> in text mode, +CDS: <length> followed by pdu in PDU mode
+        fields = line[5:].split(b',')
+        if len(fields) == 1:
+            return self.onGsmCDSPdu
+        try:
+            self.onStatusReport(int(fields[1]), int(fields[-1]))
+        except ValueError:
+            logging.error(f"... invalid status report: %s", line)
+
+    def onGsmCDSPdu(self, line: bytes):
+        if not line:
+            return self.onGsmCDSPdu     # empty line before the pdu
+        report = self.parseReportPdu(line)
+        if report is not None:
+            self.onStatusReport(report['Reference'], report['Status'])
+
+    @staticmethod
+    def parseReportPdu(line: bytes):
+        try:
+            return decodeStatusReport(line.decode('ascii'))
+        except (ValueError, IndexError):
+            logging.error(f"... invalid status report PDU: %s", line)
+            return None
+
+    def onStatusReport(self, reference: int, status: int):
+        logging.debug(f"... status report %d for reference %d", status, reference)
+        record = self.Reports.report(reference, status)
+        if record is not None:
+            self.publishReport(record)
+        for record in self.Reports.expired():
+            self.publishReport(record)
+
+    def publishReport(self, record):
+        report = {"id": record['Id'], "to": record['Number'], "status": record['Status'],
+                  "latency": round(record['Latency'], 1), "modem": self.Name}
+        logging.info(f"... SMS to %s %s after %.1f s", record['Number'], record['Status'], record['Latency'])
+        if self.Metrics is not None:
+            self.Metrics.inc("sms_reports_total", modem=self.Name, status=record['Status'])
+            self.Metrics.observe("sms_report_seconds", record['Latency'], modem=self.Name)
+        self.MQTTClient.publish(self.Status+"/report", json.dumps(report))
+
+    def publishSms(self, new_sms, replay: bool = False):
+        # {'Id': message_id, 'Number': number, 'Status': status, 'Msg': msg}
+        if new_sms is not None:
+            logging.info("")
+            logging.info("Receiving SMS")
+            logging.info(f"... Decoded to UTF-8 string: %s", new_sms['Msg'])
+            json_message = {"from": new_sms['Number'], "txt": new_sms['Msg'], "modem": self.Name}
+            journal_ids = new_sms.get('Journal', [])
+            if self.Dedup is not None:
+                # same sms read again (notification and sweep, storage not deleted before restart),
+                # sms replayed from journal were not acknowledged by the broker
+                key = gsm_dedup.smsKey(new_sms)
+                json_message["id"] = key
+                if self.Dedup.seen("in:"+key) and not replay:
+                    logging.warning(f"... SMS from %s already published, ignored", new_sms['Number'])
+                    if self.Metrics is not None:
+                        self.Metrics.inc("sms_duplicates_total", direction="in")
+                    for sms_id in journal_ids:
+                        self.Journal.ackInbox(sms_id)
+                    return
+            logging.info("...... Publishing it to mqtt as JSON on topic sms_received")
+            logging.debug(json_message)
+            with self.InboundSem:
+                self.InboundUnacked += 1
+
+            def done():
+                # acknowledged by the broker: journal entry and storage may go
+                for sms_id in journal_ids:
+                    self.Journal.ackInbox(sms_id)
+                with self.InboundSem:
+                    self.InboundUnacked -= 1
+
+            payload = json.dumps(json_message)
+            if self.Publisher is not None:
+                self.Publisher.put(self.Recv, payload, done)
+            else:
+                self.MQTTClient.publish(self.Recv, payload, qos=1)
+                done()
+            if self.Metrics is not None:
+                self.Metrics.inc("sms_received_total", modem=self.Name)
+
+    def inboundAcked(self) -> bool:
+        # every sms read from the modem was acknowledged by the broker
+        return self.InboundUnacked == 0
+
+    def smsRead(self):
+        # sms read from storage, deleted once all are acknowledged
+        if not self.DeletePending:
+            self.DeletePending, self.DeleteSince = True, time.monotonic()
+
+    def deleteOverdue(self) -> bool:
+        # under steady traffic acknowledgements lag behind reads, reading pauses until storage is freed
+        return self.DeletePending and time.monotonic() - self.DeleteSince > gsm.DeleteDelay
+
+    def inboundFull(self) -> bool:
+        # publish stage full, sms are left in modem storage for now
+        return self.Publisher is not None and self.Publisher.full()
+
+    def keepSms(self, messages):
+        # journal received sms before they are deleted from storage, sms already in journal are left out
+        if self.Journal is None:
+            return messages
+        kept = []
+        for sms in messages:
+            sms_id = self.Journal.addInbox(self.Name, sms)
+            if sms_id is not None:
+                sms['Journal'] = [sms_id]
+                kept.append(sms)
+        self.Journal.flush()
+        return kept
+
+    def replaySms(self):
+        # sms journaled but not published by previous run
+        if self.Journal is not None:
+            for sms in self.Journal.inbox(self.Name):
+                if sms.get('Parts', 1) > 1:
+                    sms = self.PduParts.add(sms)
+                self.publishSms(sms, replay=True)
 
     @staticmethod
     def decodeGSM7toUTF8(bytes_message):
-        logging.debug('... Decoding GSM-7 to UTF-8')
-        logging.debug(list(bytes_message))
-        result = []
-        for b in bytes_message:         # b is code value of character
-            result.append(sms_alpha[b])
-        return ''.join(result)
+        return decodeGSM7(bytes_message)
 
     @staticmethod
     def encodeUTF8toGSM7(message):
-        # UTF-8 double byte character will be replaced by specific
-        # GSM alphabet code
-        message_list = list(bytes(message, 'utf-8'))
-        logging.debug('...... Encoding UTF-8 to GSM-7')
-        waitCode195 = False
-        waitCode194 = False
-        waitCode206 = False
-        result = bytes("", 'utf-8')
-        for c in message_list:
-            if waitCode195 is True:
-                waitCode195 = False
-                if c == 132:
-                    result += b'\x5b'   # --> Ä
-                elif c == 133:
-                    result += b'\x0e'   # --> Å
-                elif c == 135:
-                    result += b'\x09'   # --> Ç
-                elif c == 137:
-                    result += b'\x1f'   # --> É
-                elif c == 145:
-                    result += b'\x5d'   # --> Ñ
-                elif c == 150:
-                    result += b'\x5c'   # --> Ö
-                elif c == 152:
-                    result += b'\x0b'   # --> Ø
-                elif c == 156:
-                    result += b'\x5e'   # --> Ü
-                elif c == 159:
-                    result += b'\x1e'   # --> ß
-                elif c == 160:
-                    result += b'\x7f'   # --> à
-                elif c == 164:
-                    result += b'\x7b'   # --> ä
-                elif c == 165:
-                    result += b'\x0f'   # --> å
-                elif c == 166:
-                    result += b'\x1d'   # --> æ
-                elif c == 167:
-                    result += b'\x63'   # --> c pour ç
-                elif c == 168:
-                    result += b'\x04'   # --> è
-                elif c == 169:
-                    result += b'\x05'   # --> é
-                elif c == 172:
-                    result += b'\x07'   # --> ì
-                elif c == 177:
-                    result += b'\x7d'   # --> ñ
-                elif c == 178:
-                    result += b'\x08'   # --> ò
-                elif c == 182:
-                    result += b'\x7c'   # --> ö
-                elif c == 184:
-                    result += b'\x0c'   # --> ø
-                elif c == 185:
-                    result += b'\x06'   # --> ù
-                else:
-                    pass
-            elif waitCode194 is True:
-                waitCode194 = False
-                if c == 161:
-                    result += b'\x40'  # --> ¡
-                elif c == 163:
-                    result += b'\x01'  # --> £
-                elif c == 164:
-                    result += b'\x24'  # --> ¤
-                elif c == 165:
-                    result += b'\x03'  # --> §
-                elif c == 167:
-                    result += b'\x5f'  # --> §
-                elif c == 191:
-                    result += b'\x60'  # --> ¿
-                else:
-                    pass
-            elif waitCode206 is True:
-                waitCode206 = False
-                if c == 147:
-                    result += b'\x13'  # --> Γ
-                elif c == 148:
-                    result += b'\x10'  # --> Δ
-                elif c == 152:
-                    result += b'\x19'  # --> Θ
-                elif c == 155:
-                    result += b'\x14'  # --> Λ
-                elif c == 158:
-                    result += b'\x1a'  # --> Ξ
-                elif c == 160:
-                    result += b'\x16'  # --> Π
-                elif c == 163:
-                    result += b'\x18'  # --> Σ
-                elif c == 166:
-                    result += b'\x12'  # --> Φ
-                elif c == 168:
-                    result += b'\x17'  # --> Ψ
-                elif c == 169:
-                    result += b'\x15'  # --> Ω
-                else:
-                    pass
-            else:
-                if c == 195:
-                    waitCode195 = True
-                elif c == 194:
-                    waitCode194 = True
-                elif c == 206:
-                    waitCode206 = True
-                else:
-                    if c == 64:
-                        result += b'\x00'   # --> @
-                    elif c == 36:
-                        result += b'\x02'   # --> $
-                    elif c == 95:
-                        result += b'\x11'   # --> _
-                    else:
-                        result += bytes([c])
-        logging.debug(result)
-        sms = result + b'\x1A'
-        return sms
+        # text mode payload: extension characters sent as close ones ('€' as 'EUR'), others outside GSM-7 as '?'
+        return encodeGSM7Text(message) + b'\x1A'
 
     def isAuthorized(self, number):
-        logging.debug(f"... isAuthorized: %s", number)
-        if number in self.Auth:
-            logging.debug("...... True")
-            return True
-        logging.debug("...... False")
-        return False
+        return self.Auth.isAuthorized(number)
 
-    def readNewSms(self):
-        # Read for MQTT in JSON
+    def reloadAuth(self):
+        return self.Auth.reload()
+
+    @staticmethod
+    def parseCMGR(index, lines):
+        # +CMGR: <stat>,<oa>,... line followed by sms text
+        fields = lines[0].decode('ascii', 'replace').split(',')
+        status = fields[0].split(': ')[1][1:-1]     # remove both "
+        number = fields[1][1:-1]                    # remove both "
+        timestamp = (fields[3]+","+fields[4]).strip('"') if len(fields) > 4 else ""
+        return {'Id': index, 'Number': number, 'Status': status, 'Timestamp': timestamp,
+                'Msg': gsm.decodeGSM7toUTF8(b'\r\n'.join(lines[1:]))}
+
+    def parseReport(self, lines):
+        # (reference, status) when +CMGR lines are a status report, else None
+        if self.Pdu:
+            report = self.parseReportPdu(lines[1]) if len(lines) > 1 else None
+            return (report['Reference'], report['Status']) if report is not None else None
+        # +CMGR: <stat>,<fo>,<mr>,[<ra>],[<tora>],<scts>,<dt>,<st>
+        fields = lines[0].split(b',')
+        if len(fields) > 2 and fields[1].strip().isdigit():
+            try:
+                return int(fields[2]), int(fields[-1])
+            except ValueError:
+                return None
+        return None
+
+    @staticmethod
+    def parsePdu(index, status, pdu):
+        # SMS-DELIVER pdu, None for other pdus (status reports)
+        try:
+            sms = decodeDeliver(pdu)
+        except (ValueError, IndexError):
+            logging.error(f"... invalid PDU at index %s", index)
+            return None
+        if sms is not None:
+            sms['Id'] = index
+            sms['Status'] = pdu_status.get(status, status)
+        return sms
+
+    def readSmsByIndexFlow(self, index):
+        # Read only the sms stored at index, marked as read by modem and deleted with deleteReadSms once published
         result = None
+        command = yield bytes(gsm.ATCMGR+index, 'ascii'), None, None
+        if command.ok and command.Lines and command.Lines[0].startswith(b'+CMGR:'):
+            report = self.parseReport(command.Lines)
+            if report is not None:
+                # status report announced by +CDSI
+                self.onStatusReport(*report)
+                yield bytes(gsm.ATCMGD+index+",0", 'ascii'), None, None
+                return None
+            if self.Pdu:
+                # +CMGR: <stat>,[<alpha>],<length> line followed by pdu
+                status = command.Lines[0][6:].decode('ascii').split(',')[0].strip()
+                sms = self.parsePdu(index, status, command.Lines[1].decode('ascii'))
+            else:
+                sms = self.parseCMGR(index, command.Lines)
+            if sms is not None and sms['Status'] in ("REC UNREAD", "REC READ") and self.isAuthorized(sms['Number']):
+                for sms in self.keepSms([sms]):
+                    result = sms if not self.Pdu else self.PduParts.add(sms)
+        return result
+
+    def readSmsByIndex(self, index):
         if self.Opened:
-            # logging.debug("... readNewSMS")
-            self.GsmApiSem.acquire()
-            self.SmsList = []
-            self.GsmIoCMGLReceived = False
-            frame = bytes(gsm.ATCMGL+"\"ALL\"", 'ascii')
-            self.writeCommandAndWaitOK(frame)
-            for sms in self.SmsList:
-                # retrieve sms id
-                message_id = sms['Id']
-                number = sms['Number']
-                status = sms['Status']
-                # read sms from id
-                self.GsmIoCMGRReceived = False
-                frame = bytes(gsm.ATCMGR+message_id, 'ascii')
-                self.writeCommandAndWaitOK(frame)
-                while not self.GsmIoCMGRReceived:
-                    time.sleep(0.001)
-                while self.RecordSmsText:
-                    time.sleep(0.001)
-                # retrieve sms text
-                if self.isAuthorized(number):
-                    sms = self.LastSmsText
-                    self.SMSQueue.put({'Id': message_id, 'Number': number, 'Status': status, 'Msg': sms})
-                # delete sms according to id
-                frame = bytes(gsm.ATCMGD+message_id+",0", 'ascii')
-                self.writeCommandAndWaitOK(frame)
-            self.GsmApiSem.release()
-            try:
-                message = self.SMSQueue.get(False)
-                try:
-                    if message['Status'] == "STO SENT":
-                        result = None
-                    elif message['Status'] != "REC UNREAD" and message['Status'] != "REC READ":
-                        result = None
-                    else:
-                        result = message
-                except (Exception,):
-                    result = None
-            except (Exception,):
-                result = None
+            return self.runFlow(self.readSmsByIndexFlow(index))
+        logging.error("... readSmsByIndex, device not opened")
+        return None
+
+    @staticmethod
+    def parseCMGL(lines):
+        # +CMGL: <index>,<stat>,<oa>,[<alpha>],[<scts>][,<tooa>,<length>] lines, each followed by sms text
+        result = []
+        text = None
+        for line in lines:
+            if line.startswith(b'+CMGL:'):
+                fields = line.decode('ascii', 'replace').split(',')
+                message_id = fields[0].split(': ')[1]
+                number = fields[2][1:-1]    # remove both "
+                status = fields[1][1:-1]    # remove both "
+                timestamp = (fields[4]+","+fields[5]).strip('"') if len(fields) > 5 else ""
+                text = []
+                result.append({'Id': message_id, 'Number': number, 'Status': status, 'Timestamp': timestamp,
+                               'Msg': text})
+            elif text is not None:
+                text.append(line)
+        for sms in result:
+            sms['Msg'] = gsm.decodeGSM7toUTF8(b'\r\n'.join(sms['Msg']))
+        return result
+
+    @staticmethod
+    def parseCMGLPdu(lines):
+        # +CMGL: <index>,<stat>,[<alpha>],<length> lines, each followed by pdu
+        result = []
+        for i, line in enumerate(lines[:-1]):
+            if line.startswith(b'+CMGL:'):
+                fields = line[6:].decode('ascii').split(',')
+                result.append((fields[0].strip(), fields[1].strip(), lines[i+1].decode('ascii')))
+        return result
+
+    def readNewSmsFlow(self):
+        # Read all stored sms in one CMGL exchange, returns the list to publish for MQTT in JSON
+        # listed sms are marked as read by modem, they are deleted with deleteReadSms once published
+        result = []
+        if self.Pdu:
+            command = yield bytes(gsm.ATCMGL+"4", 'ascii'), None, None
+            messages = [self.parsePdu(message_id, status, pdu)
+                        for message_id, status, pdu in self.parseCMGLPdu(command.Lines)]
         else:
-            logging.error("... readNewSMS, device not opened")
-            return result
+            command = yield bytes(gsm.ATCMGL+"\"ALL\"", 'ascii'), None, None
+            messages = self.parseCMGL(command.Lines)
+        self.dropNewSmsIndexes({sms['Id'] for sms in messages if sms is not None})
+        messages = [sms for sms in messages if sms is not None and sms['Status'] in ("REC UNREAD", "REC READ")
+                    and self.isAuthorized(sms['Number'])]
+        for sms in self.keepSms(messages):
+            if self.Pdu:
+                sms = self.PduParts.add(sms)
+            if sms is not None:
+                result.append(sms)
         return result
+
+    def dropNewSmsIndexes(self, indexes):
+        # +CMTI indexes listed by a sweep are already published, CMGR would read them again as REC READ.
+        # Reader is the only consumer, other indexes are queued back in order
+        if not indexes:
+            return
+        kept = []
+        while True:
+            try:
+                index = self.NewSmsQueue.get_nowait()
+            except Empty:
+                break
+            if index not in indexes:
+                kept.append(index)
+        for index in kept:
+            self.NewSmsQueue.put(index)
+
+    def readNewSms(self):
+        if self.Opened:
+            return self.runFlow(self.readNewSmsFlow())
+        logging.error("... readNewSMS, device not opened")
+        return []
+
+    def attachMetrics(self, metrics):
+        self.Metrics = metrics
+        if self.Notify is not None:
+            self.Notify.Metrics = metrics
+        metrics.set("sms_send_queue", self.SendQueue.qsize, modem=self.Name)
+        metrics.set("sms_send_in_flight", lambda: self.SendInFlight, modem=self.Name)
+        metrics.set("sms_receive_queue", self.NewSmsQueue.qsize, modem=self.Name)
+        # read from the telemetry snapshot, the modem is not queried for metrics
+        metrics.set("gsm_signal_dbm", lambda: self.Telemetry.get("rssi"), modem=self.Name)
+        metrics.set("gsm_registered", lambda: {True: 1, False: 0}.get(self.Telemetry.get("registered")),
+                    modem=self.Name)
+        metrics.set("sms_storage_used", lambda: self.Telemetry.get("storage_used"), modem=self.Name)
+
+    def deleteReadSmsFlow(self):
+        # delete read, sent and unsent sms, sms received since last CMGL are unread and kept
+        yield bytes(gsm.ATCMGD+"0,3", 'ascii'), None, None
+
+    def deleteReadSms(self):
+        if self.Opened:
+            self.runFlow(self.deleteReadSmsFlow())
@@ -0,0 +1,240 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024  Helios  helios14_75@hotmail.fr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import time
+import logging
+import requests
+import xmltodict
+
+from gsm            import gsm
+from requests.adapters import HTTPAdapter
+
+
+class gsm_api(gsm):
+    # Huawei HiLink dongle (no AT port), same interface as gsm over the HTTP API of the dongle.
+    # One requests.Session keeps the connection alive, the session token is fetched once
+    # and again only when the dongle rejects it. No +CMTI, inbox is polled every InboxPoll seconds
+    # (sms-count only, sms-list when it is not empty).
+
+    DefaultUrl = "http://192.168.8.1"
+    Timeout = (3.0, 15.0)           # seconds, connect and read
+    ReadCount = 50                  # sms per sms-list page, also per delete-sms request
+    InboxPoll = 5.0                 # seconds, GSM_Sweep if shorter
+    TokenErrors = ("100003", "108003", "125001", "125002", "125003")     # token or session rejected
+
+    def __init__(self, *args, **kwargs):
+        gsm.__init__(self, *args, **kwargs)  # since inherited, needs to be called explicitly
+        self.ApiUrl = self.GsmDevice.rstrip('/') if self.GsmDevice.startswith("http") else gsm_api.DefaultUrl
+        self.ApiSession = None
+        self.ApiToken = None
+        self.ApiError = None            # <code> of last <error> reply
+        self.ApiRead = []           # indexes listed by last readNewSms, deleted by deleteReadSms
+        self.Sweep = min(self.Sweep, gsm_api.InboxPoll)
+        if self.StatusReports:
+            logging.warning("... status reports are not available in api mode")
+            self.StatusReports = False
+
+    def open(self):
+        if not self.Opened:
+            self.Opened = self.openApi()
+
+    def start(self):
+        self.open()
+        if self.Opened:
+            self.Ready = True
+            self.replaySms()
+            self.startGsmReader()
+            self.startGsmSender()
+        else:
+            self.Ready = False
+
+    def stop(self):
+        if self.Ready:
+            self.stopGsmSender()
+            self.stopGsmReader()
+            self.ApiSession.close()
+        self.Opened = False
+        self.Ready = False
+
+    def openApi(self):
+        logging.info('... trying to open HiLink API on '+self.ApiUrl)
+        self.ApiSession = requests.Session()
+        # sender and reader share the connection, one at a time under GsmApiSem
+        self.ApiSession.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        self.ApiSession.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        with self.GsmApiSem:
+            if self.getToken():
+                logging.info('...... HiLink API is opened on '+self.ApiUrl)
+                return True
+        logging.error('...... HiLink API not available on '+self.ApiUrl)
+        return False
+
+    # HTTP exchanges, GsmApiSem must be held
+
+    def getToken(self):
+        # <SesInfo>SessionID=...</SesInfo><TokInfo>...</TokInfo>
+        response = self.exchange("GET", "/api/webserver/SesTokInfo")
+        if response is None or 'TokInfo' not in response:
+            self.ApiToken = None
+            return False
+        session = response.get('SesInfo') or ""
+        if session.startswith("SessionID="):
+            self.ApiSession.cookies.set("SessionID", session[len("SessionID="):])
+        self.ApiToken = response['TokInfo']
+        return True
+
+    def exchange(self, method: str, path: str, request=None):
+        # returns content of <response>, None on error
+        headers = {}
+        data = None
+        if request is not None:
+            data = xmltodict.unparse({'request': request})
+            headers["Content-Type"] = "application/x-www-form-urlencoded; charset=UTF-8"
+        if self.ApiToken is not None:
+            headers["__RequestVerificationToken"] = self.ApiToken
+        started = time.monotonic()
+        try:
+            reply = self.ApiSession.request(method, self.ApiUrl + path, data=data, headers=headers,
+                                            timeout=gsm_api.Timeout)
+            content = xmltodict.parse(reply.content)
+            # some firmwares give the token of next request with each reply
+            token = reply.headers.get("__RequestVerificationToken")
+            if token:
+                self.ApiToken = token.split('#')[0]
+        except (requests.RequestException, ValueError) as error:
+            logging.error(f"... %s failed: %s", path, error)
+            content = {'error': {'code': 'exception'}}
+        if self.Metrics is not None:
+            self.Metrics.command(self.MetricsName, bytes(path, 'ascii'), time.monotonic() - started,
+                                 'error' not in content)
+        if 'error' in content:
+            self.ApiError = (content['error'] or {}).get('code')
+            return None
+        self.ApiError = None
+        response = content.get('response')
+        return response if response is not None else {}
+
+    def request(self, method: str, path: str, request=None):
+        # exchange with a new token when the dongle rejects the cached one
+        with self.GsmApiSem:
+            held = time.monotonic()
+            try:
+                if self.ApiToken is None:
+                    self.getToken()
+                response = self.exchange(method, path, request)
+                if response is None and self.ApiError in gsm_api.TokenErrors:
+                    logging.debug(f"... token rejected (%s), fetching a new one", self.ApiError)
+                    if self.getToken():
+                        response = self.exchange(method, path, request)
+                if response is None:
+                    logging.error(f"... %s error %s", path, self.ApiError)
+                return response
+            finally:
+                if self.Metrics is not None:
+                    self.Metrics.observe("gsm_api_lock_seconds", time.monotonic() - held, modem=self.Name)
+
+    # gsm interface
+
+    def initGsmDevice(self):
+        with self.GsmApiSem:
+            self.getToken()
+
+    def sendSms(self, to, message, sms_id=None):
+        # one request for all numbers of a broadcast
+        numbers = to if isinstance(to, list) else [to]
+        logging.info(f"... Send SMS to %d number(s) with HiLink API", len(numbers))
+        request = {'Index': -1, 'Phones': {'Phone': numbers}, 'Sca': '', 'Content': message,
+                   'Length': len(message), 'Reserved': 1, 'Date': time.strftime("%Y-%m-%d %H:%M:%S")}
+        if self.request("POST", "/api/sms/send-sms", request) is None:
+            logging.error(f"...... SMS not sent")
+            return False
+        logging.info(f"...... SMS sent")
+        logging.info("")
+        return True
+
+    @staticmethod
+    def asList(value):
+        # xmltodict gives a dict for one element, a list for several
+        if value is None:
+            return []
+        return value if isinstance(value, list) else [value]
+
+    def readNewSms(self):
+        # whole inbox in pages of ReadCount, unread first, returns sms to publish
+        count = self.request("GET", "/api/sms/sms-count")
+        if count is None or str(count.get('LocalInbox', '1')) == '0':
+            return []
+        messages = []
+        page = 1
+        while True:
+            request = {'PageIndex': page, 'ReadCount': gsm_api.ReadCount, 'BoxType': 1, 'SortType': 0,
+                       'Ascending': 0, 'UnreadPreferred': 1}
+            response = self.request("POST", "/api/sms/sms-list", request)
+            if response is None:
+                break
+            listed = self.asList((response.get('Messages') or {}).get('Message'))
+            messages.extend(listed)
+            if len(listed) < gsm_api.ReadCount:
+                break
+            page += 1
+        result = []
+        for message in messages:
+            if message['Index'] in self.ApiRead:
+                continue                # listed again as pages moved
+            self.ApiRead.append(message['Index'])
+            sms = {'Id': message['Index'], 'Number': message.get('Phone') or '',
+                   'Status': "REC UNREAD" if message.get('Smstat') == '0' else "REC READ",
+                   'Timestamp': message.get('Date') or '', 'Msg': message.get('Content') or ''}
+            if self.isAuthorized(sms['Number']):
+                result.append(sms)
+        return self.keepSms(result)
+
+    def readSmsByIndex(self, index):
+        return None
+
+    def deleteReadSms(self):
+        # listed sms deleted in batches
+        while self.ApiRead:
+            indexes = self.ApiRead[:gsm_api.ReadCount]
+            if self.request("POST", "/api/sms/delete-sms", {'Index': indexes}) is None:
+                # kept, listed again but not published, deleted on next attempt
+                return
+            self.ApiRead = self.ApiRead[len(indexes):]
+
+    def attachMetrics(self, metrics):
+        gsm.attachMetrics(self, metrics)
+        metrics.poll(self.readSignal)
+
+    def readSignal(self):
+        # <rssi>-73dBm</rssi>
+        response = self.request("GET", "/api/device/signal") if self.Ready else None
+        signal = None
+        if response is not None:
+            try:
+                signal = int(str(response.get('rssi') or '').strip('<>=dBm'))     # '-73dBm', '>=-51dBm'
+            except ValueError:
+                signal = None
+        if self.Metrics is not None:
+            self.Metrics.set("gsm_signal_dbm", signal, modem=self.Name)
+        return signal
@@ -0,0 +1,498 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024  Helios  helios14_75@hotmail.fr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import os
+import time
+import errno
+import asyncio
+import termios
+import logging
+import threading
+import paho.mqtt.client as mqtt
+
+from gsm            import gsm
+from gsm_recorder   import gsm_recorder
+from threading      import Thread, Lock
+from queue          import Empty
+
+
+class gsm_async(gsm):
+    # gsm running on one asyncio event loop, shared by all modems and the MQTT client:
+    # non-blocking serial fd, AT commands awaited as futures, reader and senders run as tasks.
+    # gsm methods (sendSms, readNewSms, ...) stay synchronous for callers outside of the loop.
+
+    Loop = None
+    LoopThread = None
+    LoopSem = Lock()
+
+    @staticmethod
+    def getLoop():
+        with gsm_async.LoopSem:
+            if gsm_async.Loop is None:
+                gsm_async.Loop = asyncio.new_event_loop()
+                gsm_async.LoopThread = Thread(target=gsm_async.Loop.run_forever, name="gsm_async")
+                gsm_async.LoopThread.daemon = True
+                gsm_async.LoopThread.start()
+        return gsm_async.Loop
+
+    def __init__(self, *args, **kwargs):
+        gsm.__init__(self, *args, **kwargs)  # since inherited, needs to be called explicitly
+        self.Loop = gsm_async.getLoop()
+        self.GsmFd = -1
+        self.NotifyFd = -1
+        self.WriteBuffer = bytearray()
+        self.FlowLock = asyncio.Lock()      # one flow at a time on the modem, as GsmApiSem
+        self.SendEvent = asyncio.Event()
+        self.NewSmsEvent = asyncio.Event()
+        self.ReaderTask = None
+        self.SenderTasks = []
+        self.SupervisorTask = None
+        self.SendRunning = False
+
+    @staticmethod
+    def inLoop():
+        return threading.current_thread() is gsm_async.LoopThread
+
+    def runInLoop(self, coroutine):
+        # run coroutine on the event loop and wait for its result
+        if gsm_async.inLoop():
+            coroutine.close()
+            raise RuntimeError("gsm_async synchronous call from event loop")
+        return asyncio.run_coroutine_threadsafe(coroutine, self.Loop).result()
+
+    def callInLoop(self, function):
+        # run function on the event loop, at once from a task of the loop
+        if gsm_async.inLoop():
+            return function()
+
+        async def call():
+            return function()
+        return self.runInLoop(call())
+
+    # Serial transport over the tty fd
+
+    @staticmethod
+    def openTty(device: str) -> int:
+        # raw 115200 8N1 non-blocking fd, raises OSError or termios.error
+        fd = os.open(device, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+        try:
+            attributes = termios.tcgetattr(fd)
+            attributes[0] = 0                                                   # iflag: raw input
+            attributes[1] = 0                                                   # oflag: raw output
+            attributes[2] = termios.CS8 | termios.CREAD | termios.CLOCAL        # 8N1, no flow control
+            attributes[3] = 0                                                   # lflag: no echo, no canonical
+            attributes[4] = termios.B115200
+            attributes[5] = termios.B115200
+            attributes[6][termios.VMIN] = 0
+            attributes[6][termios.VTIME] = 0
+            termios.tcsetattr(fd, termios.TCSANOW, attributes)
+            termios.tcflush(fd, termios.TCIOFLUSH)
+        except termios.error:
+            os.close(fd)
+            raise
+        return fd
+
+    def openGsmIoDevice(self):
+        try:
+            logging.info('... trying to open device on '+self.GsmDevice)
+            self.GsmFd = self.openTty(self.GsmDevice)
+            self.Opened = True
+            logging.info('...... device is opened on '+self.GsmDevice)
+        except (OSError, termios.error):
+            self.Opened = False
+            logging.error('...... device exception while opening '+self.GsmDevice)
+        return self.Opened
+
+    def closeGsmIoDevice(self):
+        logging.info('... trying to close GSM device')
+        if self.GsmFd >= 0:
+            try:
+                os.close(self.GsmFd)
+            except OSError:
+                logging.error('... exception while closing '+self.GsmDevice)
+            self.GsmFd = -1
+        self.Opened = False
+        logging.info('... Gsm is closed ')
+
+    def startGsmIoActivity(self):
+        if self.Opened:
+            self.Loop.call_soon_threadsafe(self.Loop.add_reader, self.GsmFd, self.onGsmIoReadable)
+
+    def stopGsmIoActivity(self):
+        if self.Opened:
+            self.callInLoop(self.removeGsmFd)
+
+    def removeGsmFd(self):
+        self.Loop.remove_reader(self.GsmFd)
+        self.Loop.remove_writer(self.GsmFd)
+
+    def openGsmNotify(self):
+        # notification port read by the event loop, lines dispatched by the gsm_io of gsm
+        if self.Notify is None:
+            return
+        try:
+            logging.info('... trying to open device on '+self.Notify.GsmDevice)
+            self.NotifyFd = self.openTty(self.Notify.GsmDevice)
+        except (OSError, termios.error):
+            logging.error('...... device exception while opening '+self.Notify.GsmDevice)
+            logging.warning(f"... notifications read on %s only", self.GsmDevice)
+            return
+        self.Notify.Opened = True
+        logging.info('...... device is opened on '+self.Notify.GsmDevice)
+        self.Loop.call_soon_threadsafe(self.Loop.add_reader, self.NotifyFd, self.onGsmNotifyReadable)
+
+    def closeGsmNotify(self):
+        if self.NotifyFd >= 0:
+            self.callInLoop(self.removeNotifyFd)
+            try:
+                os.close(self.NotifyFd)
+            except OSError:
+                logging.error('... exception while closing '+self.Notify.GsmDevice)
+            self.NotifyFd = -1
+        if self.Notify is not None:
+            self.Notify.Opened = False
+            self.Notify.resetGsmIo()
+
+    def removeNotifyFd(self):
+        self.Loop.remove_reader(self.NotifyFd)
+
+    def onGsmNotifyReadable(self):
+        try:
+            data = os.read(self.NotifyFd, 4096)
+        except BlockingIOError:
+            return
+        except OSError as error:
+            self.Loop.remove_reader(self.NotifyFd)
+            self.Notify.setGsmIoLost("read error: %s" % error)
+            return
+        if not data:
+            self.Loop.remove_reader(self.NotifyFd)
+            self.Notify.setGsmIoLost("end of file")
+            return
+        self.Notify.feedGsmIoData(data)
+
+    def flowBusy(self) -> bool:
+        return self.FlowLock.locked()
+
+    def resetGsmIo(self):
+        gsm.resetGsmIo(self)
+        self.WriteBuffer.clear()
+
+    def onGsmIoReadable(self):
+        try:
+            data = os.read(self.GsmFd, 4096)
+        except BlockingIOError:
+            return
+        except OSError as error:
+            self.Loop.remove_reader(self.GsmFd)
+            self.setGsmIoLost("read error: %s" % error)
+            return
+        if not data:
+            # hang up, device is gone
+            self.Loop.remove_reader(self.GsmFd)
+            self.setGsmIoLost("end of file")
+            return
+        self.feedGsmIoData(data)
+
+    def writeData(self, frame: bytes):
+        if self.Metrics is not None:
+            self.Metrics.inc("gsm_serial_bytes_out_total", len(frame), modem=self.MetricsName)
+        if self.Recorder is not None:
+            self.Recorder.record(gsm_recorder.TX, frame)
+        if self.Capture is not None:
+            self.Capture.record("tx", frame)
+        if gsm_async.inLoop():
+            self.writeGsmFd(frame)
+        else:
+            self.Loop.call_soon_threadsafe(self.writeGsmFd, frame)
+
+    def writeGsmFd(self, frame: bytes):
+        # non-blocking write, what remains is written when fd is writable again
+        if self.WriteBuffer:
+            self.WriteBuffer += frame
+            return
+        try:
+            written = os.write(self.GsmFd, frame)
+        except BlockingIOError:
+            written = 0
+        except OSError as error:
+            self.setGsmIoLost("write error: %s" % error)
+            return
+        if written < len(frame):
+            self.WriteBuffer += frame[written:]
+            self.Loop.add_writer(self.GsmFd, self.onGsmIoWritable)
+
+    def onGsmIoWritable(self):
+        try:
+            written = os.write(self.GsmFd, self.WriteBuffer)
+        except OSError as error:
+            if error.errno == errno.EAGAIN:
+                return
+            self.setGsmIoLost("write error: %s" % error)
+            written = len(self.WriteBuffer)
+        del self.WriteBuffer[:written]
+        if not self.WriteBuffer:
+            self.Loop.remove_writer(self.GsmFd)
+
+    # AT commands as futures
+
+    def startNextCommand(self):
+        gsm.startNextCommand(self)
+        command = self.GsmIoCommand
+        if command is not None:
+            # deadline is checked by a timer instead of the reader loop (loop.time() is time.monotonic())
+            self.Loop.call_soon_threadsafe(self.Loop.call_at, command.Deadline, self.checkCommandDeadline)
+
+    async def command(self, frame: bytes, payload: bytes = None, timeout: float = None):
+        command = self.writeCommand(frame, payload, timeout)
+        future = self.Loop.create_future()
+        command.addDoneCallback(lambda done: self.Loop.call_soon_threadsafe(gsm_async.resolve, future))
+        await future
+        if not command.ok:
+            logging.error(f"... %s failed: %s", gsm_recorder.mask(frame).decode('ascii', 'replace'), command.Error)
+        return command
+
+    @staticmethod
+    def resolve(future):
+        if not future.done():
+            future.set_result(None)
+
+    async def runFlowAsync(self, flow):
+        async with self.FlowLock:
+            command = None
+            held = time.monotonic()
+            try:
+                while True:
+                    frame, payload, timeout = flow.send(command)
+                    command = await self.command(frame, payload, timeout)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                if self.Metrics is not None:
+                    self.Metrics.observe("gsm_api_lock_seconds", time.monotonic() - held, modem=self.Name)
+
+    def runFlow(self, flow):
+        # synchronous facade of gsm
+        return self.runInLoop(self.runFlowAsync(flow))
+
+    # Reader and senders as tasks
+
+    def onGsmCMTI(self, line: bytes):
+        gsm.onGsmCMTI(self, line)
+        self.NewSmsEvent.set()
+
+    def queueSms(self, number, message, sms_id=None, priority="normal", replay=False):
+        queued = gsm.queueSms(self, number, message, sms_id, priority, replay)
+        self.Loop.call_soon_threadsafe(self.SendEvent.set)
+        return queued
+
+    def startGsmReader(self):
+        if self.Opened:
+            logging.debug("Starting GSM Reader")
+            self.ReaderTask = asyncio.run_coroutine_threadsafe(self.runGsmReader(), self.Loop)
+            logging.debug("... GSM Reader started")
+
+    def stopGsmReader(self):
+        if self.ReaderTask is not None:
+            logging.debug("Stopping GSM Reader")
+            self.ReaderTask.cancel()
+            self.ReaderTask = None
+            logging.debug("... GSM Reader stopped")
+
+    def startGsmSender(self):
+        if self.Opened:
+            logging.debug("Starting GSM Sender")
+            self.SendRunning = True
+            for i in range(self.SendWorkers):
+                self.SenderTasks.append(asyncio.run_coroutine_threadsafe(self.runGsmSender(), self.Loop))
+            logging.debug("... GSM Sender started")
+
+    def stopGsmSender(self):
+        if self.SenderTasks:
+            logging.debug("Stopping GSM Sender")
+            # sms being sent are not cut in the middle of their prompt, others stay queued
+            self.SendRunning = False
+            self.Loop.call_soon_threadsafe(self.SendEvent.set)
+            for sender in self.SenderTasks:
+                try:
+                    sender.result(timeout=gsm.SendTimeout)
+                except Exception:
+                    sender.cancel()
+            self.SenderTasks = []
+            logging.debug("... GSM Sender stopped")
+
+    async def runGsmReader(self):
+        # as runGsmReaderThread, waiting on +CMTI event instead of a queue
+        next_sweep = 0
+        recoveries = self.Recoveries
+        while True:
+            if not self.DeviceUp.is_set():
+                await asyncio.sleep(gsm.SupervisorPoll)
+                continue
+            if recoveries != self.Recoveries:
+                # sms received while the device was lost
+                recoveries, next_sweep = self.Recoveries, 0
+            if self.DeletePending and self.inboundAcked() and not self.lostGsmDevice():
+                await self.runFlowAsync(self.deleteReadSmsFlow())
+                self.DeletePending = False
+            if self.inboundFull() or self.deleteOverdue():
+                # storage is freed before more sms are read
+                await asyncio.sleep(gsm.AckPoll)
+                continue
+            if time.monotonic() >= next_sweep and not self.DeletePending:
+                # the whole batch is published, deleted once acknowledged
+                for new_sms in await self.runFlowAsync(self.readNewSmsFlow()):
+                    self.publishSms(new_sms)
+                self.smsRead()
+                next_sweep = time.monotonic() + self.Sweep
+            for new_sms in self.PduParts.expired():
+                logging.warning(f"... Incomplete SMS from %s, %d part(s) received", new_sms['Number'], new_sms['Part'])
+                self.publishSms(new_sms)
+            # acknowledgements are checked often while sms wait for deletion
+            wait = gsm.AckPoll if self.DeletePending else min(self.PduParts.Timeout, max(0.0, next_sweep - time.monotonic()))
+            if self.NewSmsQueue.empty():
+                try:
+                    await asyncio.wait_for(self.NewSmsEvent.wait(), wait)
+                except asyncio.TimeoutError:
+                    continue
+            self.NewSmsEvent.clear()
+            while not self.inboundFull() and not self.deleteOverdue():
+                try:
+                    index = self.NewSmsQueue.get_nowait()
+                except Empty:
+                    break
+                self.publishSms(await self.runFlowAsync(self.readSmsByIndexFlow(index)))
+                self.smsRead()
+
+    async def runGsmSender(self):
+        # as runGsmSenderThread, waiting on queueSms event instead of the queue
+        while self.SendRunning:
+            if not self.DeviceUp.is_set():
+                await asyncio.sleep(gsm.SupervisorPoll)
+                continue
+            try:
+                number, message, sms_id, priority, queued = self.SendQueue.get_nowait()
+            except Empty:
+                # queue empty, or sms waiting for rate limits
+                self.SendEvent.clear()
+                try:
+                    await asyncio.wait_for(self.SendEvent.wait(), self.SendQueue.nextDelay())
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self.sendStarted(priority, queued)
+            sent = await self.runFlowAsync(self.sendSmsFlow(number, message, sms_id))
+            self.sendDone(number, message, sent, sms_id, priority)
+
+    # Supervisor as a task: device checks, recovery and telemetry queries await the loop instead of a thread
+
+    def startGsmSupervisor(self):
+        if self.Opened:
+            self.SupervisorTask = self.callInLoop(lambda: self.Loop.create_task(self.runGsmSupervisor()))
+
+    def stopGsmSupervisor(self):
+        if self.SupervisorTask is not None:
+            if not self.DeviceUp.is_set():
+                # recovery in progress is given up, its commands end at once
+                self.setGsmIoLost("stopped while recovering")
+                self.failGsmIoCommands()
+            # device is closed by stop once the task is over, as after joining the thread
+            self.runInLoop(self.cancelTask(self.SupervisorTask))
+            self.SupervisorTask = None
+
+    @staticmethod
+    async def cancelTask(task):
+        task.cancel()
+        await asyncio.wait([task])
+
+    async def runGsmSupervisor(self):
+        while True:
+            await asyncio.sleep(gsm.SupervisorPoll)
+            if self.checkGsmDevice():
+                await self.recoverGsmDeviceAsync()
+            elif self.TelemetryInterval:
+                query = self.nextTelemetryQuery()
+                if query is not None:
+                    name, query = query
+                    self.telemetryValue(name, await self.runFlowAsync(self.readTelemetryFlow(query)))
+
+    async def recoverGsmDeviceAsync(self):
+        # as recoverGsmDevice, cancelled by stopGsmSupervisor
+        self.releaseGsmDevice()
+        delay = gsm.RecoverDelay
+        while True:
+            await asyncio.sleep(delay)
+            if self.reopenGsmDevice():
+                await self.runFlowAsync(self.warmInitGsmFlow())
+                if self.recoveredGsmDevice():
+                    # reader and senders may be waiting for an event
+                    self.NewSmsEvent.set()
+                    self.SendEvent.set()
+                    return
+            delay = min(delay * 2, gsm.RecoverDelayMax)
+
+    # MQTT network on the same loop
+
+    @staticmethod
+    def attachMqtt(client):
+        # to be called before connect, replaces loop_forever/loop_start
+        loop = gsm_async.getLoop()
+        misc = []
+        reconnecting = []
+
+        async def runMisc():
+            while client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+                await asyncio.sleep(1)
+
+        async def reconnect():
+            # as loop_forever, with backoff, on_connect subscribes again
+            delay = gsm.RecoverDelay
+            while True:
+                await asyncio.sleep(delay)
+                try:
+                    await loop.run_in_executor(None, client.reconnect)
+                    break
+                except OSError as error:
+                    logging.error(f"... MQTT reconnect failed: %s", error)
+                    delay = min(delay * 2, gsm.RecoverDelayMax)
+            reconnecting.clear()
+
+        def onOpen(sock):
+            loop.add_reader(sock, client.loop_read)
+            misc.append(loop.create_task(runMisc()))
+
+        def onClose(sock):
+            loop.remove_reader(sock)
+            while misc:
+                misc.pop().cancel()
+            if not reconnecting:
+                logging.warning("... MQTT connection lost, reconnecting")
+                reconnecting.append(loop.create_task(reconnect()))
+
+        client.on_socket_open = lambda c, userdata, sock: loop.call_soon_threadsafe(onOpen, sock)
+        client.on_socket_close = lambda c, userdata, sock: loop.call_soon_threadsafe(onClose, sock)
+        client.on_socket_register_write = \
+            lambda c, userdata, sock: loop.call_soon_threadsafe(loop.add_writer, sock, client.loop_write)
+        client.on_socket_unregister_write = \
+            lambda c, userdata, sock: loop.call_soon_threadsafe(loop.remove_writer, sock)
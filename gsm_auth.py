@@ -0,0 +1,111 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024  Helios  helios14_75@hotmail.fr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import logging
+
+from threading      import Lock
+
+AUTH_END = ''       # trie key marking the end of a prefix rule
+
+
+class gsm_auth:
+    # Authorized numbers: exact numbers in a set, prefix rules ('+3361*') in a trie, '!' denies.
+    # Numbers are normalized to E.164 ('06..' -> '+336..' for country 33) before any lookup.
+
+    def __init__(self, auth: str, country: str = "33", path: str = ""):
+        self.Country = country.lstrip('+')
+        self.Path = path
+        self.AuthSem = Lock()
+        self.Auth = auth
+        self.Index = (frozenset(), {}, frozenset(), {})     # allowed, allowed prefixes, denied, denied prefixes
+        self.reload()
+
+    def normalize(self, number: str) -> str:
+        number = number.strip()
+        digits = ''.join(char for char in number if char.isdigit())
+        if not digits or any(char.isalpha() for char in number):
+            return number                           # alphanumeric sender, kept as is
+        if number.startswith('+'):
+            return '+' + digits
+        if digits.startswith('00'):
+            return '+' + digits[2:]
+        if digits.startswith('0'):
+            return '+' + self.Country + digits[1:]  # national number
+        return '+' + digits
+
+    def parse(self, rules):
+        allowed, allowed_prefixes, denied, denied_prefixes = set(), {}, set(), {}
+        for rule in rules:
+            rule = rule.split('#')[0].strip()
+            if not rule:
+                continue
+            numbers, prefixes = allowed, allowed_prefixes
+            if rule.startswith('!'):
+                numbers, prefixes = denied, denied_prefixes
+                rule = rule[1:].strip()
+            if rule.endswith('*'):
+                prefix = rule[:-1].strip()
+                node = prefixes
+                for char in self.normalize(prefix) if prefix else '':
+                    node = node.setdefault(char, {})
+                node[AUTH_END] = True
+            else:
+                numbers.add(self.normalize(rule))
+        return frozenset(allowed), allowed_prefixes, frozenset(denied), denied_prefixes
+
+    def reload(self):
+        # rules from GSM_AUTH, then from file, one rule per line or comma separated
+        rules = self.Auth.split(',')
+        if self.Path:
+            try:
+                with open(self.Path, encoding='utf-8') as auth_file:
+                    for line in auth_file:
+                        rules.extend(line.split(','))
+            except OSError as error:
+                logging.error(f"... cannot read authorized numbers from %s: %s", self.Path, error)
+                return False
+        index = self.parse(rules)
+        with self.AuthSem:
+            self.Index = index
+        logging.info(f"... %d authorized numbers, %d denied numbers", len(index[0]), len(index[2]))
+        return True
+
+    @staticmethod
+    def matchPrefix(node, number: str) -> bool:
+        if AUTH_END in node:
+            return True
+        for char in number:
+            node = node.get(char)
+            if node is None:
+                return False
+            if AUTH_END in node:
+                return True
+        return False
+
+    def isAuthorized(self, number: str) -> bool:
+        allowed, allowed_prefixes, denied, denied_prefixes = self.Index
+        number = self.normalize(number)
+        if number in denied or self.matchPrefix(denied_prefixes, number):
+            return False
+        return number in allowed or self.matchPrefix(allowed_prefixes, number)
@@ -0,0 +1,79 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024  Helios  helios14_75@hotmail.fr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import time
+import logging
+
+from threading      import Lock
+from gsm_recorder   import gsm_recorder
+
+
+class gsm_capture:
+    # Raw serial bytes of a modem as read and written, one chunk per line: "<seconds> <rx|rx2|tx> <bytes>",
+    # bytes escaped as in a Python string (\r\n, \x1a). Transcripts are replayed into the reader by
+    # tools/replay_serial.py, the ones of tools/corpus check the reader and measure it.
+
+    def __init__(self, path: str):
+        self.Path = path
+        self.CaptureSem = Lock()
+        self.File = None
+        self.Start = time.monotonic()
+        try:
+            self.File = open(path, "w", encoding="ascii", buffering=1)    # each chunk kept if the gateway dies
+        except OSError as error:
+            logging.error(f"... serial capture to %s not started: %s", path, error)
+        else:
+            logging.info(f"... serial capture to %s", path)
+
+    @staticmethod
+    def escape(data: bytes) -> str:
+        return data.decode('latin-1').encode('unicode_escape').decode('ascii')
+
+    @staticmethod
+    def unescape(text: str) -> bytes:
+        return text.encode('ascii').decode('unicode_escape').encode('latin-1')
+
+    def record(self, direction: str, data: bytes):
+        # pin codes masked, as in flight recorder dumps
+        line = f"{time.monotonic() - self.Start:.6f} {direction} {self.escape(gsm_recorder.mask(data))}\n"
+        with self.CaptureSem:
+            if self.File is not None:
+                self.File.write(line)
+
+    def close(self):
+        with self.CaptureSem:
+            if self.File is not None:
+                self.File.close()
+                self.File = None
+
+    @staticmethod
+    def read(path: str):
+        # (seconds, direction, bytes) of each chunk, '#' lines are comments
+        with open(path, encoding="ascii") as transcript:
+            for line in transcript:
+                line = line.rstrip('\n')
+                if not line or line.startswith('#'):
+                    continue
+                seconds, direction, text = line.split(' ', 2)
+                yield float(seconds), direction, gsm_capture.unescape(text)
@@ -0,0 +1,106 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024  Helios  helios14_75@hotmail.fr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import codecs
+
+# GSM 03.38 default alphabet, index is the septet value
+#                 0-----------------------------------2f
+sms_alpha     = ("@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞ\x1bÆæßÉ"
+                 " !\"#¤%&'()*+,-./0123456789:;<=>?"
+                 "¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§"
+                 "¿abcdefghijklmnopqrstuvwxyzäöñüà")
+
+# GSM 03.38 extension table, septet value following escape 0x1b
+sms_alpha_ext = {0x0a: "\f", 0x14: "^", 0x28: "{", 0x29: "}", 0x2f: "\\",
+                 0x3c: "[", 0x3d: "~", 0x3e: "]", 0x40: "|", 0x65: "€"}
+
+# characters not in the alphabet but sent as a close one
+sms_alias     = {"ç": "c"}
+
+# text mode: escape 0x1b written after the '> ' prompt cancels the sms (3GPP 27.005),
+# extension characters are sent as close characters of the alphabet instead (PDU mode sends them escaped)
+sms_alias_text = {"€": "EUR", "[": "(", "]": ")", "{": "(", "}": ")", "~": "-", "\\": "/", "^": "'", "|": "/",
+                  "\f": " "}
+
+SMS_ESCAPE = "\x1b"
+SMS_UNKNOWN = "?"
+
+
+class _EncodeTable(dict):
+    # str.translate table, characters outside GSM-7 become '?'
+    def __missing__(self, key):
+        return SMS_UNKNOWN
+
+
+# code point -> septet(s) as latin-1 characters, used with str.translate
+_encode_table = _EncodeTable()
+for _septet, _char in enumerate(sms_alpha):
+    _encode_table[ord(_char)] = chr(_septet)
+for _septet, _char in sms_alpha_ext.items():
+    _encode_table[ord(_char)] = SMS_ESCAPE + chr(_septet)
+for _char, _alias in sms_alias.items():
+    _encode_table[ord(_char)] = _encode_table[ord(_alias)]
+_encode_table[ord(SMS_ESCAPE)] = SMS_UNKNOWN         # escape alone is not a character
+
+_encode_table_text = _EncodeTable(_encode_table)
+for _char, _alias in sms_alias_text.items():
+    _encode_table_text[ord(_char)] = _alias.translate(_encode_table)
+
+# septet -> character, bytes above 0x7f are not septets
+_decode_table = sms_alpha + SMS_UNKNOWN * 128
+
+sms_charset = frozenset(sms_alpha.replace(SMS_ESCAPE, "")) | frozenset(sms_alpha_ext.values())
+sms_charset_ext = tuple(sms_alpha_ext.values())
+
+
+def encodeGSM7(text: str) -> bytes:
+    # one byte per septet, extension characters are escaped
+    return text.translate(_encode_table).encode('latin-1')
+
+
+def encodeGSM7Text(text: str) -> bytes:
+    # one byte per septet without any escape, for the text written after the prompt in text mode
+    return text.translate(_encode_table_text).encode('latin-1')
+
+
+def decodeGSM7(data: bytes) -> str:
+    text = codecs.charmap_decode(data, 'strict', _decode_table)[0]
+    if SMS_ESCAPE not in text:
+        return text
+    # resolve extension characters
+    parts = text.split(SMS_ESCAPE)
+    result = [parts[0]]
+    for part in parts[1:]:
+        if part:
+            # unknown extension is displayed as the default alphabet character
+            char = sms_alpha_ext.get(sms_alpha.find(part[0]))
+            result.append(part if char is None else char + part[1:])
+    return ''.join(result)
+
+
+def lengthGSM7(text: str):
+    # number of septets needed for text, None if text is not GSM-7 representable
+    if not sms_charset.issuperset(text):
+        return None
+    return len(text) + sum(text.count(char) for char in sms_charset_ext)
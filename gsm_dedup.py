@@ -0,0 +1,80 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024  Helios  helios14_75@hotmail.fr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import time
+import hashlib
+import logging
+
+from collections    import OrderedDict
+from threading      import Lock
+
+
+class gsm_dedup:
+    # Keys seen recently, outbound 'id' of MQTT requests and hash of received sms contents:
+    # a key seen again within ttl seconds is a repeat (MQTT redelivery, storage read twice).
+    # Least recently seen keys are dropped first when full, kept in the journal across restarts if any.
+
+    KeysMax = 10000
+
+    def __init__(self, ttl: float, journal=None, size: int = KeysMax):
+        self.Ttl = ttl
+        self.Size = size
+        self.Sem = Lock()
+        self.Keys = OrderedDict()       # key -> expiry (epoch seconds), least recently seen first
+        self.Repeats = 0
+        self.Journal = journal
+        if journal is not None:
+            for key, expires in journal.seen():
+                self.Keys[key] = expires
+            logging.info(f"... dedup: %d keys loaded from journal", len(self.Keys))
+
+    @staticmethod
+    def smsKey(sms) -> str:
+        # received sms have no id: sender, timestamp of service center and text
+        content = "\x00".join(str(sms.get(field, '')) for field in ('Number', 'Timestamp', 'Msg'))
+        return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+    def seen(self, key: str) -> bool:
+        # True when key was seen within ttl, key is remembered (again) anyway
+        now = time.time()
+        with self.Sem:
+            expires = self.Keys.pop(key, None)
+            repeat = expires is not None and expires > now
+            self.Keys[key] = now + self.Ttl
+            # expiries follow insertion order: expired keys are at the front
+            evicted = []
+            while self.Keys and (len(self.Keys) > self.Size or next(iter(self.Keys.values())) <= now):
+                evicted.append(self.Keys.popitem(last=False)[0])
+            if repeat:
+                self.Repeats += 1
+        if self.Journal is not None:
+            self.Journal.addSeen(key, now + self.Ttl, evicted)
+        return repeat
+
+    def forget(self, key: str):
+        # request not taken (queue full): a new attempt is not a repeat
+        with self.Sem:
+            self.Keys.pop(key, None)
+        if self.Journal is not None:
+            self.Journal.addSeen(None, 0, [key])
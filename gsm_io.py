@@ -22,36 +22,107 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
-from    threading   import Thread, Lock
+from    threading   import Thread, Lock, Event
+from    collections import deque
 import  serial
 import  serial.tools.list_ports
 import  time
 import  logging
 
+from    gsm_recorder    import gsm_recorder
+
+
+class at_command:
+    # AT command in progress, completed by the reader thread when the final result code arrives
+
+    def __init__(self, frame: bytes, payload: bytes = None, timeout: float = 10.0):
+        self.Frame      = frame             # command without trailing cr
+        self.Payload    = payload           # written after '> ' prompt (sms text ended by ctrl-z)
+        self.Timeout    = timeout           # seconds, counted from the time command is written
+        self.Deadline   = None
+        self.Lines      = []                # intermediate lines (+CMGW: 3, +CMGL: ..., sms text)
+        self.Result     = None              # final result code (b'OK', b'ERROR', b'+CME ERROR: 10')
+        self.Error      = None              # None if OK, else error line, 'timeout' or 'cancelled'
+        self.Cancelled  = False
+        self.Done       = Event()
+        self.Callbacks  = []
+
+    @property
+    def ok(self):
+        return self.Done.is_set() and self.Error is None
+
+    def complete(self, result, error=None):
+        if not self.Done.is_set():
+            self.Result = result
+            self.Error = error
+            self.Done.set()
+            for callback in self.Callbacks:
+                callback(self)
+
+    def addDoneCallback(self, callback):
+        # callback(command) is called once completed, at once if already completed
+        self.Callbacks.append(callback)
+        if self.Done.is_set():
+            callback(self)
+
+    def cancel(self):
+        # not yet written: will be skipped, in progress: its response will be swallowed
+        self.Cancelled = True
+        self.complete(None, 'cancelled')
+
+    def wait(self, timeout=None):
+        # wait for completion, returns True if command ended with OK
+        limit = None if timeout is None else time.monotonic() + timeout
+        while not self.Done.wait(0.5):
+            now = time.monotonic()
+            if self.Deadline is not None and now > self.Deadline + 1.0:
+                # reader did not enforce the deadline (thread stopped)
+                self.complete(None, 'timeout')
+            elif limit is not None and now > limit:
+                return False
+        return self.Error is None
+
+    def value(self, prefix: bytes):
+        # value of first intermediate line starting with prefix: b'+CMGW: 3' -> b'3'
+        for line in self.Lines:
+            if line.startswith(prefix):
+                return line[len(prefix):].strip()
+        return None
+
+
 class gsm_io:
 
+    DefaultTimeout = 10.0
+    TimeoutsMax = 3         # consecutive timeouts before the device is seen as lost
+
     def __init__(self, loglevel, device):
         self.GsmSerial              = serial.Serial()
         self.GsmDevice              = device
         self.GsmIoProtocolSem       = Lock()
-        self.GsmIoReadyToSend       = True
         self.CommandSem             = Lock()
-        self.WaitingOk              = False
-        self.RecordSmsText          = False
-        self.GsmIoCMSSId            = -1
-        self.GsmIoCMSSReceived      = False
-        self.GsmIoOKReceived        = False
-        self.GsmIoPromptReceived    = False
-        self.SmsText: bytes         = b''
-        self.LastSmsText: bytes     = b''
-        self.GsmIoMessageId: bytes  = b''
+        self.GsmIoCommands          = deque()   # commands waiting to be written
+        self.GsmIoCommand           = None      # command written, waiting for final result code
         self.GsmIoActivityThread    = None
-        self.SmsList                = None
-        self.GsmIoCMGLReceived      = False
-        self.GsmIoSmsIdReceived     = False
-        self.GsmIoCMGRReceived      = False
         self.Opened                 = False
-        self.Debug                  = False
+        self.GsmIoBuffer            = bytearray()
+        self.GsmIoScanPos           = 0
+        # response handlers, keyed on full line or on '+XXX:' prefix
+        # lines without handler are intermediate lines of command in progress
+        self.GsmIoHandlers          = {
+            b'OK':           self.onGsmIoFinal,
+            b'ERROR':        self.onGsmIoFinal,
+            b'+CME ERROR:':  self.onGsmIoFinal,
+            b'+CMS ERROR:':  self.onGsmIoFinal,
+        }
+        self.GsmIoNextLine          = None      # handler of the line following a header (+CDS pdu, +CMGL text)
+        self.GsmIoLost              = Event()   # set on serial error or no response, cleared when reopened
+        self.GsmIoTimeouts          = 0         # consecutive commands without response
+        self.Metrics                = None      # gsm_metrics when metrics are on
+        self.MetricsName            = device    # modem label of metrics
+        self.Recorder               = None      # gsm_recorder when the flight recorder is on
+        self.RecorderRx             = gsm_recorder.RX
+        self.Capture                = None      # gsm_capture when raw serial bytes are captured to a file
+        self.CaptureRx              = "rx"
         # logging.basicConfig(filename='example.log', encoding='utf-8', level=logging.DEBUG)
         logging.basicConfig(format='%(asctime)s %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p', level=loglevel)
 
@@ -73,6 +144,7 @@ class gsm_io:
             self.GsmSerial.xonxoff = False
             self.GsmSerial.rtscts = False
             self.GsmSerial.dsrdtr = False
+            self.GsmSerial.timeout = 0.1    # reader blocks at most 100ms when modem is idle
             self.GsmSerial.open()
             self.GsmSerial.flush()
             if self.GsmSerial.is_open:
@@ -87,24 +159,110 @@ class gsm_io:
 
     def closeGsmIoDevice(self):
         logging.info('... trying to close GSM device')
-        self.GsmSerial.close()
+        try:
+            self.GsmSerial.close()
+        except (serial.SerialException, OSError):
+            logging.error('... exception while closing '+self.GsmDevice)
         if self.GsmSerial.is_open:
             logging.error('... Gsm is still opened ')
         else:
             self.Opened = False
             logging.info('... Gsm is closed ')
 
-    def writeCommandAndWaitOK(self, frame: bytes):
-        # frame is bytes
-        self.GsmIoOKReceived = False
-        data = frame + b'\r'
-        self.writeData(data)
-        while not self.GsmIoOKReceived:
-            time.sleep(0.01)
-        self.GsmIoOKReceived = False
+    def writeCommand(self, frame: bytes, payload: bytes = None, timeout: float = None):
+        # queue command, returns at_command to wait on
+        command = at_command(frame, payload, timeout or gsm_io.DefaultTimeout)
+        with self.CommandSem:
+            self.GsmIoCommands.append(command)
+            if self.GsmIoCommand is None:
+                self.startNextCommand()
+        return command
+
+    def writeCommandAndWaitOK(self, frame: bytes, payload: bytes = None, timeout: float = None):
+        command = self.writeCommand(frame, payload, timeout)
+        if not command.wait():
+            logging.error(f"... %s failed: %s", gsm_recorder.mask(frame).decode('ascii', 'replace'), command.Error)
+        return command
+
+    def startNextCommand(self):
+        # CommandSem must be held
+        while self.GsmIoCommands:
+            command = self.GsmIoCommands.popleft()
+            if command.Cancelled:
+                continue
+            if not self.GsmIoLost.is_set():
+                self.GsmIoCommand = command
+                command.Deadline = time.monotonic() + command.Timeout
+                self.writeData(command.Frame + b'\r')
+                if not self.GsmIoLost.is_set():
+                    return
+                self.GsmIoCommand = None
+            command.complete(None, 'device lost')
+
+    def finishCommand(self, result, error=None):
+        with self.CommandSem:
+            command = self.GsmIoCommand
+            self.GsmIoCommand = None
+            self.GsmIoTimeouts = self.GsmIoTimeouts + 1 if error == 'timeout' else 0
+            if self.GsmIoTimeouts >= gsm_io.TimeoutsMax:
+                self.setGsmIoLost("no response to %d commands" % self.GsmIoTimeouts)
+            if command is not None:
+                while command.Lines and command.Lines[-1] == b'':
+                    command.Lines.pop()                 # remove empty line before final result code
+                seconds = time.monotonic() - command.Deadline + command.Timeout
+                if self.Metrics is not None:
+                    self.Metrics.command(self.MetricsName, command.Frame, seconds, error is None)
+                if self.Recorder is not None:
+                    self.Recorder.record(gsm_recorder.DONE if error is None else gsm_recorder.FAILED,
+                                         command.Frame, seconds)
+                command.complete(result, error)
+            self.startNextCommand()
+
+    def checkCommandDeadline(self):
+        command = self.GsmIoCommand
+        if command is not None and time.monotonic() > command.Deadline:
+            frame = gsm_recorder.mask(command.Frame).decode('ascii', 'replace')
+            logging.error(f"... %s timeout", frame)
+            if command.Payload is not None:
+                self.writeData(b'\x1b')                 # abort a pending prompt
+            self.finishCommand(None, 'timeout')
+            self.dumpTrace(frame+" timeout")
 
     def writeData(self, frame: bytes):
-        self.GsmSerial.write(frame)
+        if self.Metrics is not None:
+            self.Metrics.inc("gsm_serial_bytes_out_total", len(frame), modem=self.MetricsName)
+        if self.Recorder is not None:
+            self.Recorder.record(gsm_recorder.TX, frame)
+        if self.Capture is not None:
+            self.Capture.record("tx", frame)
+        try:
+            self.GsmSerial.write(frame)
+        except (serial.SerialException, OSError) as error:
+            self.setGsmIoLost("write error: %s" % error)
+
+    def setGsmIoLost(self, reason: str):
+        # may be called with CommandSem held, pending commands are failed by failGsmIoCommands
+        if not self.GsmIoLost.is_set():
+            logging.error(f"... device %s lost: %s", self.GsmDevice, reason)
+            self.GsmIoLost.set()
+
+    def failGsmIoCommands(self):
+        # device lost: command in progress and waiting ones end at once
+        with self.CommandSem:
+            commands = [self.GsmIoCommand] if self.GsmIoCommand is not None else []
+            commands += self.GsmIoCommands
+            self.GsmIoCommand = None
+            self.GsmIoCommands.clear()
+        for command in commands:
+            command.complete(None, 'device lost')
+
+    def resetGsmIo(self):
+        # device reopened, nothing left from previous connection
+        self.GsmIoBuffer.clear()
+        self.GsmIoScanPos = 0
+        self.GsmIoNextLine = None
+        self.GsmIoTimeouts = 0
+        self.GsmIoLost.clear()
 
     # Start activity thread
     def startGsmIoActivity(self):
@@ -121,66 +279,80 @@ class gsm_io:
             self.GsmIoActivityThread.join()
 
     def runGsmIoActivityThread(self):
-        frame: bytes = b''
         while getattr(self.GsmIoActivityThread, "isRunning", True):
-            time.sleep(0.001)
-            if self.GsmSerial.in_waiting >= 1:
-                # some data available
-                data: bytes = self.GsmSerial.read(1)
-                frame += data
-                if '> ' in frame.decode("ascii"):
-                    self.GsmIoOKReceived = True
-                    self.GsmIoPromptReceived = True
-                    frame = b''
-                if '\r\n' in frame.decode("ascii"):
-                    # received response
-                    if 'OK\r\n' in frame.decode("ascii"):
-                        self.GsmIoOKReceived = True
-                        if self.RecordSmsText:
-                            self.SmsText = self.SmsText[:-4]    # remove 2 last crlf
-                            self.LastSmsText = self.SmsText
-                            self.SmsText = b''
-                            self.RecordSmsText = False
-                    elif '+CMGL:' in frame.decode("ascii"):
-                        sms_line = frame[0:len(frame)-1].decode("ascii")
-                        message_id = sms_line.split(',')[0].split(': ')[1]
-                        number = sms_line.split(',')[2][1:-1]  # remove both "
-                        status = sms_line.split(',')[1][1:-1]  # remove both "
-                        self.SmsList.append({'Id': message_id, 'Number': number, 'Status': status})
-                        self.GsmIoCMGLReceived = True
-                        # do not clear Waiting Response at this time
-                        # frame = b''
-                    elif 'ATZ\r\r\n' in frame.decode("ascii"):
-                        pass
-                    elif 'ATE0\r\r\n' in frame.decode("ascii"):
-                        pass
-                    elif '+CME ERROR:' in frame.decode("ascii"):
-                        # logging.debug(f"............ %s", frame.decode("ascii"))
-                        # logging.debug(f"............ not critical")
-                        self.GsmIoOKReceived = True
-                    elif '+CMGW:' in frame.decode("ascii"):
-                        self.GsmIoMessageId = frame[7:len(frame)-2]
-                        self.GsmIoSmsIdReceived = True
-                        # do not clear Waiting Response at this time
-                    elif '+CMSS:' in frame.decode("ascii"):
-                        self.GsmIoCMSSId = frame[7:len(frame)-2]
-                        self.GsmIoCMSSReceived = True
-                        # do not clear Waiting Response at this time
-                    elif '+CPMS:' in frame.decode("ascii"):
-                        # do not clear Waiting Response at this time
-                        pass
-                    elif '+CLIP:' in frame.decode("ascii"):
-                        # do not clear Waiting Response at this time
-                        pass
-                    elif '+CMGR:' in frame.decode("ascii"):
-                        # Now sms text will follow
-                        self.RecordSmsText = True
-                        self.GsmIoCMGRReceived = True
-                    elif '\r\n' in frame.decode("ascii"):
-                        if self.RecordSmsText:
-                            self.SmsText = self.SmsText+frame
-                        else:
-                            pass
-                    else:
-                        pass
-                    frame = b''
+            # read everything already received, or block (up to serial timeout) for the next byte
+            try:
+                data: bytes = self.GsmSerial.read(max(1, self.GsmSerial.in_waiting))
+            except (serial.SerialException, OSError) as error:
+                self.setGsmIoLost("read error: %s" % error)
+                break
+            if data:
+                self.feedGsmIoData(data)
+            self.checkCommandDeadline()
+
+    def feedGsmIoData(self, data: bytes):
+        # split received bytes into lines, each complete line goes to its response handler
+        if self.Metrics is not None:
+            self.Metrics.inc("gsm_serial_bytes_in_total", len(data), modem=self.MetricsName)
+        if self.Capture is not None:
+            self.Capture.record(self.CaptureRx, data)
+        buffer = self.GsmIoBuffer
+        buffer += data
+        start = 0
+        end = buffer.find(b'\r\n', self.GsmIoScanPos)
+        while end >= 0:
+            self.dispatchGsmIoLine(bytes(buffer[start:end]))
+            start = end + 2
+            end = buffer.find(b'\r\n', start)
+        if start:
+            del buffer[:start]
+        if buffer == b'> ':
+            # prompt is not followed by crlf
+            buffer.clear()
+            self.onGsmIoPrompt(b'> ')
+        # next search restarts on last byte, in case crlf is split between two reads
+        self.GsmIoScanPos = max(0, len(buffer) - 1)
+
+    def dispatchGsmIoLine(self, line: bytes):
+        if self.Recorder is not None and line:
+            self.Recorder.record(self.RecorderRx, line)
+        if self.GsmIoNextLine is not None:
+            # whatever the line reads, even empty, OK or ERROR (sms text)
+            handler, self.GsmIoNextLine = self.GsmIoNextLine, None
+            self.GsmIoNextLine = handler(line)
+            return
+        key = line
+        if line[:1] in (b'+', b'^'):
+            colon = line.find(b':')
+            if colon > 0:
+                key = line[:colon+1]
+        handler = self.GsmIoHandlers.get(key)
+        if handler is None and line == b'> ':
+            # prompt followed by an unsolicited result code in the same read
+            handler = self.onGsmIoPrompt
+        if handler is not None:
+            # a handler may return the handler of the next line (+CDS: <length> followed by its pdu)
+            self.GsmIoNextLine = handler(line)
+            return
+        command = self.GsmIoCommand
+        if command is not None and (line or command.Lines):
+            if command.Lines or line.rstrip(b'\r') != command.Frame:    # skip echo
+                command.Lines.append(line)
+        # anything else (empty lines, unhandled unsolicited codes) is ignored
+
+    def onGsmIoFinal(self, line: bytes):
+        self.finishCommand(line, None if line == b'OK' else line.decode('ascii', 'replace'))
+        if line.startswith(b'+CME ERROR:'):
+            self.dumpTrace(line.decode('ascii', 'replace'))
+
+    def dumpTrace(self, reason: str, force: bool = False):
+        # flight recorder to the log (and MQTT), on errors or on demand (SIGUSR1)
+        if self.Recorder is not None:
+            self.Recorder.dump(reason, force)
+
+    def onGsmIoPrompt(self, line: bytes):
+        command = self.GsmIoCommand
+        if command is not None and command.Payload is not None:
+            self.writeData(command.Payload)
+        else:
+            self.writeData(b'\x1b')     # unexpected prompt, escape it
@@ -0,0 +1,194 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024  Helios  helios14_75@hotmail.fr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import json
+import time
+import uuid
+import hashlib
+import sqlite3
+import logging
+
+from threading      import Thread, Lock, Event
+
+
+class gsm_journal:
+    # Outbound sms not sent yet and inbound sms not published yet, kept in SQLite (WAL) across restarts.
+    # Writes are buffered and committed together, one fsync per batch instead of one per sms.
+
+    FlushDelay = 0.2        # seconds a write may wait for others before commit
+    CompactEvery = 1000     # acknowledged entries between two compactions
+
+    def __init__(self, path: str, flush: float = FlushDelay):
+        self.Path = path
+        self.FlushDelay = flush
+        self.JournalSem = Lock()        # pending writes and ids
+        self.DatabaseSem = Lock()       # connection
+        self.Pending = []               # (sql, parameters) waiting for commit
+        self.OutboxIds = set()
+        self.InboxIds = set()
+        self.Acked = 0
+        self.Database = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.Database.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self.Database.execute("PRAGMA journal_mode=WAL")
+        self.Database.execute("PRAGMA synchronous=FULL")
+        self.Database.execute("CREATE TABLE IF NOT EXISTS outbox (id TEXT PRIMARY KEY, number TEXT, message TEXT, created REAL, "
+                              "priority TEXT DEFAULT 'normal')")
+        self.Database.execute("CREATE TABLE IF NOT EXISTS inbox (id TEXT PRIMARY KEY, modem TEXT, sms TEXT, created REAL)")
+        self.Database.execute("CREATE TABLE IF NOT EXISTS seen (key TEXT PRIMARY KEY, expires REAL)")
+        self.OutboxIds.update(row[0] for row in self.Database.execute("SELECT id FROM outbox"))
+        self.InboxIds.update(row[0] for row in self.Database.execute("SELECT id FROM inbox"))
+        logging.info(f"... journal %s: %d SMS to send, %d SMS to publish", path, len(self.OutboxIds), len(self.InboxIds))
+        self.FlushEvent = Event()
+        self.Running = True
+        self.FlushThread = Thread(target=self.runFlushThread, name="gsm_journal")
+        self.FlushThread.daemon = True
+        self.FlushThread.start()
+
+    def close(self):
+        self.Running = False
+        self.FlushEvent.set()
+        self.FlushThread.join()
+        self.flush()
+        self.compact()
+        with self.DatabaseSem:
+            self.Database.close()
+
+    @staticmethod
+    def newId() -> str:
+        return uuid.uuid4().hex
+
+    @staticmethod
+    def smsId(modem: str, sms) -> str:
+        # inbound sms have no id, same content read twice from storage gives the same id
+        key = "\x00".join(str(sms.get(field, '')) for field in ('Number', 'Timestamp', 'Reference', 'Part', 'Msg'))
+        return hashlib.sha1((modem + "\x00" + key).encode('utf-8')).hexdigest()
+
+    def write(self, sql: str, parameters):
+        with self.JournalSem:
+            self.Pending.append((sql, parameters))
+        self.FlushEvent.set()
+
+    def addOutbox(self, sms_id: str, number, message: str, priority: str = "normal") -> bool:
+        # False when an sms with this id is already waiting to be sent
+        with self.JournalSem:
+            if sms_id in self.OutboxIds:
+                return False
+            self.OutboxIds.add(sms_id)
+        self.write("INSERT OR IGNORE INTO outbox VALUES (?, ?, ?, ?, ?)",
+                   (sms_id, json.dumps(number), message, time.time(), priority))
+        return True
+
+    def ackOutbox(self, sms_id: str):
+        # sms sent, failed for good or dropped
+        with self.JournalSem:
+            self.OutboxIds.discard(sms_id)
+            self.Acked += 1
+        self.write("DELETE FROM outbox WHERE id = ?", (sms_id,))
+
+    def outbox(self):
+        # sms left to send by previous run, oldest first
+        with self.DatabaseSem:
+            rows = self.Database.execute("SELECT id, number, message, priority FROM outbox ORDER BY created").fetchall()
+        return [(sms_id, json.loads(number), message, priority) for sms_id, number, message, priority in rows]
+
+    def addInbox(self, modem: str, sms):
+        # id of the sms to acknowledge once published, None when it is already waiting to be published
+        sms_id = self.smsId(modem, sms)
+        with self.JournalSem:
+            if sms_id in self.InboxIds:
+                return None
+            self.InboxIds.add(sms_id)
+        self.write("INSERT OR IGNORE INTO inbox VALUES (?, ?, ?, ?)", (sms_id, modem, json.dumps(sms), time.time()))
+        return sms_id
+
+    def ackInbox(self, sms_id: str):
+        with self.JournalSem:
+            self.InboxIds.discard(sms_id)
+            self.Acked += 1
+        self.write("DELETE FROM inbox WHERE id = ?", (sms_id,))
+
+    def inbox(self, modem: str):
+        # sms received by modem and not published by previous run, oldest first
+        with self.DatabaseSem:
+            rows = self.Database.execute("SELECT id, sms FROM inbox WHERE modem = ? ORDER BY created", (modem,)).fetchall()
+        result = []
+        for sms_id, sms in rows:
+            sms = json.loads(sms)
+            sms['Journal'] = [sms_id]
+            result.append(sms)
+        return result
+
+    def addSeen(self, key: str, expires: float, evicted=()):
+        # dedup cache: key remembered until expires, evicted keys forgotten
+        if key is not None:
+            self.write("INSERT OR REPLACE INTO seen VALUES (?, ?)", (key, expires))
+        for old_key in evicted:
+            self.write("DELETE FROM seen WHERE key = ?", (old_key,))
+        with self.JournalSem:
+            self.Acked += len(evicted)
+
+    def seen(self):
+        # dedup cache keys not expired, least recently seen first
+        with self.DatabaseSem:
+            self.Database.execute("DELETE FROM seen WHERE expires <= ?", (time.time(),))
+            return self.Database.execute("SELECT key, expires FROM seen ORDER BY expires").fetchall()
+
+    def flush(self):
+        # commit pending writes in one transaction, waits for the fsync
+        with self.JournalSem:
+            pending, self.Pending = self.Pending, []
+        if not pending:
+            return
+        with self.DatabaseSem:
+            try:
+                self.Database.execute("BEGIN")
+                for sql, parameters in pending:
+                    self.Database.execute(sql, parameters)
+                self.Database.execute("COMMIT")
+            except sqlite3.Error as error:
+                logging.error(f"... journal write failed: %s", error)
+                if self.Database.in_transaction:
+                    self.Database.execute("ROLLBACK")
+
+    def compact(self):
+        # give back the space of acknowledged entries, WAL file truncated
+        with self.JournalSem:
+            self.Acked = 0
+        with self.DatabaseSem:
+            try:
+                self.Database.execute("PRAGMA incremental_vacuum").fetchall()
+                self.Database.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            except sqlite3.Error as error:
+                logging.error(f"... journal compaction failed: %s", error)
+
+    def runFlushThread(self):
+        while self.Running:
+            self.FlushEvent.wait()
+            if not self.Running:
+                break
+            time.sleep(self.FlushDelay)     # let other writes join the batch
+            self.FlushEvent.clear()
+            self.flush()
+            if self.Acked >= gsm_journal.CompactEvery:
+                self.compact()
@@ -0,0 +1,195 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024  Helios  helios14_75@hotmail.fr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import json
+import bisect
+import logging
+
+from threading      import Thread, Lock, Event
+from http.server    import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class gsm_metrics:
+    # counters, gauges and histograms of the gateway, Prometheus text on HTTP /metrics and JSON on an MQTT topic.
+    # gsm objects hold None instead of a gsm_metrics when metrics are off, nothing is measured then.
+
+    Buckets = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)    # seconds
+    Interval = 60       # seconds between two MQTT publications and signal quality polls
+
+    def __init__(self, port: int = 0, topic: str = "", mqtt_client=None):
+        self.Port = port
+        self.Topic = topic
+        self.MQTTClient = mqtt_client
+        self.MetricsSem = Lock()
+        self.Counters = {}          # (name, labels) -> value
+        self.Gauges = {}            # (name, labels) -> value, or function returning it
+        self.Histograms = {}        # (name, labels) -> [count per bucket ..., +Inf count, sum]
+        self.Polls = []             # functions run before each publication (AT+CSQ)
+        self.Server = None
+        self.PublisherThread = None
+        self.Stopped = Event()
+
+    @staticmethod
+    def key(name: str, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = self.key(name, labels)
+        with self.MetricsSem:
+            self.Counters[key] = self.Counters.get(key, 0) + value
+
+    def set(self, name: str, value, **labels):
+        # value may be a function, called when metrics are read (queue depths)
+        key = self.key(name, labels)
+        with self.MetricsSem:
+            self.Gauges[key] = value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = self.key(name, labels)
+        with self.MetricsSem:
+            histogram = self.Histograms.get(key)
+            if histogram is None:
+                histogram = self.Histograms[key] = [0] * (len(gsm_metrics.Buckets) + 2)
+            histogram[bisect.bisect_left(gsm_metrics.Buckets, seconds)] += 1
+            histogram[-1] += seconds
+
+    def poll(self, function):
+        self.Polls.append(function)
+
+    # AT command layer
+
+    def command(self, modem: str, frame: bytes, seconds: float, ok: bool):
+        # AT+CMGS="+336..." and AT+CMGS=25 are both AT+CMGS
+        name = frame.split(b'=')[0].split(b'?')[0].decode('ascii', 'replace')
+        self.observe("gsm_at_command_seconds", seconds, modem=modem, command=name)
+        if not ok:
+            self.inc("gsm_at_command_errors_total", modem=modem, command=name)
+
+    # Reading
+
+    def collect(self):
+        # (name, labels, value, family, type) of every metric, grouped by family,
+        # histograms as cumulative buckets, sum and count
+        with self.MetricsSem:
+            counters = list(self.Counters.items())
+            gauges = list(self.Gauges.items())
+            histograms = [(key, list(histogram)) for key, histogram in self.Histograms.items()]
+        result = [(name, labels, value, name, "counter") for (name, labels), value in counters]
+        for (name, labels), value in gauges:
+            try:
+                result.append((name, labels, value() if callable(value) else value, name, "gauge"))
+            except Exception as error:
+                logging.debug(f"... metric %s not read: %s", name, error)
+        for (name, labels), histogram in histograms:
+            total = 0
+            for bound, count in zip(gsm_metrics.Buckets + ("+Inf",), histogram[:-1]):
+                total += count
+                result.append((name+"_bucket", labels + (("le", str(bound)),), total, name, "histogram"))
+            result.append((name+"_sum", labels, histogram[-1], name, "histogram"))
+            result.append((name+"_count", labels, total, name, "histogram"))
+        result.sort(key=lambda metric: metric[3])
+        return result
+
+    @staticmethod
+    def labelled(name: str, labels) -> str:
+        if not labels:
+            return name
+        return name+"{"+",".join(f'{key}="{value}"' for key, value in labels)+"}"
+
+    def render(self) -> str:
+        # Prometheus text exposition format
+        lines = []
+        family = None
+        for name, labels, value, metric_family, metric_type in self.collect():
+            if value is None:
+                continue
+            if metric_family != family:
+                family = metric_family
+                lines.append(f"# TYPE {family} {metric_type}\n")
+            lines.append(f"{self.labelled(name, labels)} {value:g}\n")
+        return "".join(lines)
+
+    def snapshot(self):
+        # metrics for MQTT, histograms as sum and count only
+        result = {}
+        for name, labels, value, family, metric_type in self.collect():
+            if name.endswith("_bucket") or value is None:
+                continue
+            result[self.labelled(name, labels)] = round(value, 4) if isinstance(value, float) else value
+        return result
+
+    # HTTP /metrics and MQTT publication
+
+    def start(self):
+        if self.Port:
+            metrics = self
+
+            class handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path != "/metrics":
+                        self.send_error(404)
+                        return
+                    body = metrics.render().encode('utf-8')
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    pass
+
+            try:
+                self.Server = ThreadingHTTPServer(("", self.Port), handler)
+            except OSError as error:
+                logging.error(f"... metrics HTTP server not started on port %d: %s", self.Port, error)
+            else:
+                self.Server.daemon_threads = True
+                Thread(target=self.Server.serve_forever, name="gsm_metrics_http", daemon=True).start()
+                logging.info(f"... metrics on http://:%d/metrics", self.Port)
+        self.PublisherThread = Thread(target=self.runPublisherThread, name="gsm_metrics")
+        self.PublisherThread.daemon = True
+        self.PublisherThread.start()
+
+    def stop(self):
+        self.Stopped.set()
+        if self.Server is not None:
+            self.Server.shutdown()
+            self.Server.server_close()
+            self.Server = None
+        if self.PublisherThread is not None:
+            self.PublisherThread.join()
+            self.PublisherThread = None
+
+    def runPublisherThread(self):
+        while True:
+            for function in self.Polls:
+                try:
+                    function()
+                except Exception as error:
+                    logging.debug(f"... metrics poll failed: %s", error)
+            if self.Topic and self.MQTTClient is not None:
+                self.MQTTClient.publish(self.Topic, json.dumps(self.snapshot()))
+            if self.Stopped.wait(gsm_metrics.Interval):
+                break
@@ -0,0 +1,327 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024  Helios  helios14_75@hotmail.fr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import time
+
+from gsm_codec      import encodeGSM7, decodeGSM7, lengthGSM7
+from collections    import OrderedDict
+from threading      import Lock
+
+# TP-DCS alphabets
+PDU_GSM7 = 0
+PDU_8BIT = 1
+PDU_UCS2 = 2
+
+# user data sizes, single sms and part of a concatenated sms (6 octets UDH)
+PDU_GSM7_SINGLE = 160       # septets
+PDU_GSM7_PART = 153
+PDU_UCS2_SINGLE = 140       # octets (70 characters)
+PDU_UCS2_PART = 134
+
+# <stat> of +CMGL / +CMGR in PDU mode, as text mode strings
+pdu_status = {'0': "REC UNREAD", '1': "REC READ", '2': "STO UNSENT", '3': "STO SENT", '4': "ALL"}
+
+# TP-ST of status reports, as published
+REPORT_DELIVERED = "delivered"
+REPORT_PENDING = "pending"      # service centre still trying, not final
+REPORT_FAILED = "failed"
+REPORT_EXPIRED = "expired"      # no final report in time
+
+
+def packSeptets(septets: bytes, padding: int = 0) -> bytes:
+    # 7 bits septets packed in octets, after padding bits to align on a septet boundary
+    result = bytearray()
+    value = 0
+    bits = padding
+    for septet in septets:
+        value |= (septet & 0x7f) << bits
+        bits += 7
+        while bits >= 8:
+            result.append(value & 0xff)
+            value >>= 8
+            bits -= 8
+    if bits:
+        result.append(value & 0xff)
+    return bytes(result)
+
+
+def unpackSeptets(data: bytes, count: int, padding: int = 0) -> bytes:
+    value = int.from_bytes(data, 'little') >> padding
+    return bytes((value >> (7 * i)) & 0x7f for i in range(count))
+
+
+def swapDigits(data: bytes) -> str:
+    # semi-octets, low nibble first
+    digits = data.hex()
+    return ''.join(digits[i+1] + digits[i] for i in range(0, len(digits), 2))
+
+
+def encodeNumber(number: str) -> bytes:
+    toa = 0x81                  # unknown numbering
+    if number.startswith('+'):
+        toa = 0x91              # international numbering
+    digits = ''.join(char for char in number if char.isdigit())
+    padded = digits + 'F' * (len(digits) % 2)
+    return bytes([len(digits), toa]) + bytes.fromhex(swapDigits(bytes.fromhex(padded)))
+
+
+def decodeNumber(data: bytes, pos: int):
+    # address field at pos, returns number and position after it
+    length = data[pos]
+    toa = data[pos+1]
+    octets = (length + 1) // 2
+    field = data[pos+2:pos+2+octets]
+    if toa & 0x70 == 0x50:
+        # alphanumeric sender
+        number = decodeGSM7(unpackSeptets(field, length * 4 // 7))
+    else:
+        number = swapDigits(field).rstrip('Ff')
+        if toa & 0x70 == 0x10:
+            number = '+' + number
+    return number, pos + 2 + octets
+
+
+def decodeTimestamp(data: bytes) -> str:
+    # service centre time stamp as in text mode: yy/MM/dd,hh:mm:ss+zz
+    values = [(octet & 0x0f) * 10 + (octet >> 4) for octet in data[:6]]
+    zone = ((data[6] & 0x07) * 10 + (data[6] >> 4))
+    sign = '-' if data[6] & 0x08 else '+'
+    return "%02d/%02d/%02d,%02d:%02d:%02d%s%02d" % (*values, sign, zone)
+
+
+def dataCoding(dcs: int) -> int:
+    if dcs & 0xc0 in (0x00, 0x40):
+        return (dcs >> 2) & 0x03 if (dcs >> 2) & 0x03 != 3 else PDU_GSM7
+    if dcs & 0xf0 == 0xf0:
+        return PDU_8BIT if dcs & 0x04 else PDU_GSM7
+    if dcs & 0xf0 == 0xe0:
+        return PDU_UCS2
+    return PDU_GSM7
+
+
+def splitGSM7(data: bytes, size: int):
+    # never split an escape sequence between two parts
+    chunks = []
+    while len(data) > size:
+        cut = size - 1 if data[size-1] == 0x1b else size
+        chunks.append(data[:cut])
+        data = data[cut:]
+    chunks.append(data)
+    return chunks
+
+
+def splitUCS2(data: bytes, size: int):
+    # never split a surrogate pair between two parts
+    chunks = []
+    while len(data) > size:
+        cut = size - 2 if 0xd8 <= data[size-2] <= 0xdb else size
+        chunks.append(data[:cut])
+        data = data[cut:]
+    chunks.append(data)
+    return chunks
+
+
+def encodeSubmit(number: str, text: str, reference: int = 0, status_report: bool = False):
+    # SMS-SUBMIT pdus for text, GSM-7 when possible else UCS-2, concatenated when too long
+    # returns list of (tpdu length for AT+CMGS, hex pdu with empty SMSC)
+    if lengthGSM7(text) is not None:
+        alphabet = PDU_GSM7
+        data = encodeGSM7(text)
+        chunks = [data] if len(data) <= PDU_GSM7_SINGLE else splitGSM7(data, PDU_GSM7_PART)
+    else:
+        alphabet = PDU_UCS2
+        data = text.encode('utf-16-be')
+        chunks = [data] if len(data) <= PDU_UCS2_SINGLE else splitUCS2(data, PDU_UCS2_PART)
+    destination = encodeNumber(number)
+    dcs = 0x00 if alphabet == PDU_GSM7 else 0x08
+    pdus = []
+    for i, chunk in enumerate(chunks):
+        first = 0x01                        # SMS-SUBMIT
+        header = b''
+        if status_report:
+            first |= 0x20
+        if len(chunks) > 1:
+            first |= 0x40                   # user data header present
+            header = bytes([5, 0x00, 3, reference & 0xff, len(chunks), i+1])
+        if alphabet == PDU_GSM7:
+            padding = (7 - len(header) * 8 % 7) % 7
+            length = (len(header) * 8 + padding) // 7 + len(chunk)
+            user_data = header + packSeptets(chunk, padding)
+        else:
+            length = len(header) + len(chunk)
+            user_data = header + chunk
+        tpdu = bytes([first, 0x00]) + destination + bytes([0x00, dcs, length]) + user_data
+        pdus.append((len(tpdu), '00' + tpdu.hex().upper()))
+    return pdus
+
+
+def decodeDeliver(pdu: str):
+    # SMS-DELIVER pdu as received with +CMGL / +CMGR, None if pdu is not a deliver
+    data = bytes.fromhex(pdu)
+    pos = data[0] + 1                       # skip SMSC
+    first = data[pos]
+    if first & 0x03 != 0:
+        return None
+    number, pos = decodeNumber(data, pos + 1)
+    dcs = data[pos+1]
+    timestamp = decodeTimestamp(data[pos+2:pos+9])
+    length = data[pos+9]
+    user_data = data[pos+10:]
+    alphabet = dataCoding(dcs)
+    reference, parts, part = 0, 1, 1
+    header_length = 0
+    if first & 0x40:
+        header_length = user_data[0] + 1
+        header = user_data[1:header_length]
+        i = 0
+        while i + 1 < len(header):
+            iei, iel = header[i], header[i+1]
+            if iei == 0x00 and iel == 3:
+                reference, parts, part = header[i+2], header[i+3], header[i+4]
+            elif iei == 0x08 and iel == 4:
+                reference, parts, part = (header[i+2] << 8) | header[i+3], header[i+4], header[i+5]
+            i += 2 + iel
+    if alphabet == PDU_GSM7:
+        header_septets = (header_length * 8 + 6) // 7
+        text = decodeGSM7(unpackSeptets(user_data, length)[header_septets:])
+    elif alphabet == PDU_UCS2:
+        text = user_data[header_length:length].decode('utf-16-be', 'replace')
+    else:
+        text = user_data[header_length:length].decode('latin-1')
+    return {'Number': number, 'Timestamp': timestamp, 'Msg': text,
+            'Reference': reference, 'Parts': parts, 'Part': part}
+
+
+def decodeStatusReport(pdu: str):
+    # SMS-STATUS-REPORT pdu as received with +CDS / +CMGR, None if pdu is not a status report
+    data = bytes.fromhex(pdu)
+    pos = data[0] + 1                       # skip SMSC
+    if data[pos] & 0x03 != 0x02:
+        return None
+    reference = data[pos+1]
+    number, pos = decodeNumber(data, pos + 2)
+    return {'Reference': reference, 'Number': number, 'Timestamp': decodeTimestamp(data[pos:pos+7]),
+            'Discharge': decodeTimestamp(data[pos+7:pos+14]), 'Status': data[pos+14]}
+
+
+def reportStatus(status: int) -> str:
+    # TP-ST: 0x00-0x1f transaction completed, 0x20-0x3f still trying, above failed for good
+    if status < 0x20:
+        return REPORT_DELIVERED
+    if status < 0x40:
+        return REPORT_PENDING
+    return REPORT_FAILED
+
+
+class pdu_parts:
+    # parts of concatenated sms waiting for the others, bounded in size and time
+
+    def __init__(self, size: int = 32, timeout: float = 300.0):
+        self.Size = size
+        self.Timeout = timeout
+        self.Pending = OrderedDict()        # (number, reference, parts) -> (first time, sms, {part: text}, journal ids)
+        self.Evicted = []
+
+    def add(self, sms):
+        # returns the whole sms when its last part arrives, else None
+        if sms['Parts'] <= 1:
+            return sms
+        key = (sms['Number'], sms['Reference'], sms['Parts'])
+        if key not in self.Pending:
+            if len(self.Pending) >= self.Size:
+                self.Evicted.append(self.Pending.popitem(last=False)[1])
+            self.Pending[key] = (time.monotonic(), sms, {}, [])
+        texts = self.Pending[key][2]
+        texts[sms['Part']] = sms['Msg']
+        self.Pending[key][3].extend(sms.get('Journal', []))
+        if len(texts) < sms['Parts']:
+            return None
+        return self.join(self.Pending.pop(key))
+
+    def expired(self):
+        # incomplete sms evicted or waiting for too long, with the parts received
+        result = [self.join(entry) for entry in self.Evicted]
+        self.Evicted = []
+        limit = time.monotonic() - self.Timeout
+        while self.Pending and next(iter(self.Pending.values()))[0] < limit:
+            result.append(self.join(self.Pending.popitem(last=False)[1]))
+        return result
+
+    @staticmethod
+    def join(entry):
+        sms = dict(entry[1])
+        texts = entry[2]
+        sms['Msg'] = ''.join(texts[part] for part in sorted(texts))
+        sms['Part'] = len(texts)
+        if entry[3]:
+            sms['Journal'] = entry[3]
+        return sms
+
+
+class pdu_reports:
+    # sent sms waiting for their status reports, by message reference (TP-MR), bounded in size and time
+
+    def __init__(self, size: int = 256, timeout: float = 86400.0):
+        self.Size = size
+        self.Timeout = timeout
+        self.Sem = Lock()
+        self.Pending = OrderedDict()        # reference -> sms record, shared by the parts of an sms
+
+    def track(self, sms_id, number: str, references):
+        # returns records evicted to make room or waiting for too long
+        record = {'Id': sms_id, 'Number': number, 'Sent': time.monotonic(), 'Parts': len(references),
+                  'Status': REPORT_DELIVERED}
+        with self.Sem:
+            for reference in references:
+                self.Pending.pop(reference, None)       # reference reused, older sms gets no report
+                self.Pending[reference] = record
+            return self.expired()
+
+    def report(self, reference: int, status: int):
+        # returns the record of the sms when its status is final for all its parts, else None
+        with self.Sem:
+            record = self.Pending.get(reference)
+            if record is None or reportStatus(status) == REPORT_PENDING:
+                return None
+            del self.Pending[reference]
+            if record['Status'] == REPORT_EXPIRED:
+                return None
+            if reportStatus(status) == REPORT_FAILED:
+                record['Status'] = REPORT_FAILED
+            record['Parts'] -= 1
+            if record['Parts'] > 0:
+                return None
+        record['Latency'] = time.monotonic() - record['Sent']
+        return record
+
+    def expired(self):
+        result = []
+        limit = time.monotonic() - self.Timeout
+        while self.Pending and (len(self.Pending) > self.Size or next(iter(self.Pending.values()))['Sent'] < limit):
+            record = self.Pending.popitem(last=False)[1]
+            if record['Status'] != REPORT_EXPIRED:
+                record['Status'] = REPORT_EXPIRED
+                record['Latency'] = time.monotonic() - record['Sent']
+                result.append(record)
+        return result
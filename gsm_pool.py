@@ -0,0 +1,194 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024  Helios  helios14_75@hotmail.fr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import logging
+
+from gsm            import gsm
+from gsm_auth       import gsm_auth
+from gsm_async      import gsm_async
+from gsm_dedup      import gsm_dedup
+from gsm_api        import gsm_api
+from gsm_journal    import gsm_journal
+from gsm_metrics    import gsm_metrics
+from gsm_publisher  import gsm_publisher
+from gsm_recorder   import gsm_recorder
+from threading      import Lock, Thread
+
+
+class gsm_pool:
+    # Several modems seen as one gateway, outbound sms are spread across healthy modems
+
+    def __init__(self, loglevel, mode: str, devices: str, pins: str, auth: str, recv: str, status: str, mqtt_client, *,
+                 sweep: int = 60, queue_size: int = 100, overflow: str = "reject", workers: int = 1,
+                 schedule: str = "least", pdu: bool = False, country: str = "33", auth_file: str = "",
+                 engine: str = "thread", journal: str = "", reports: bool = False,
+                 metrics_port: int = 0, metrics_topic: str = "", rate: float = 0, rate_number: float = 0,
+                 coalesce: float = 0, warm: bool = False, dedup: float = 0, notify: str = "",
+                 telemetry: float = 60, recv_qos: int = 1, recv_window: int = gsm_publisher.Window,
+                 trace: int = gsm_recorder.Size, capture: str = ""):
+        device_list = [device.strip() for device in devices.split(',') if device.strip()]
+        pin_list = [pin.strip() for pin in pins.split(',')]
+        notify_list = [port.strip() for port in notify.split(',')]     # notification port of each modem, if any
+        self.Schedule = schedule        # 'least' queue depth or 'round' robin
+        self.PoolSem = Lock()
+        self.NextModem = 0
+        self.Modems = []
+        self.Auth = gsm_auth(auth, country, auth_file)     # shared by all modems
+        self.Journal = gsm_journal(journal) if journal else None
+        self.Dedup = gsm_dedup(dedup, self.Journal) if dedup else None    # shared by all modems
+        self.Publisher = gsm_publisher(mqtt_client, recv_qos, recv_window)  # received sms of all modems
+        self.Metrics = gsm_metrics(metrics_port, metrics_topic, mqtt_client) if metrics_port or metrics_topic else None
+        if self.Metrics is not None:
+            self.Publisher.attachMetrics(self.Metrics)
+        for i, device in enumerate(device_list):
+            pin = pin_list[i] if i < len(pin_list) else pin_list[-1]
+            notify_port = notify_list[i] if i < len(notify_list) else ""
+            name = "modem"+str(i+1)
+            # each modem publishes its own send status when there are several
+            modem_status = status if len(device_list) == 1 else status+"/"+name
+            modem_capture = capture if len(device_list) == 1 or not capture else capture+"."+name
+            modem_class = gsm_api if mode == "api" else gsm_async if engine == "asyncio" else gsm
+            modem = modem_class(loglevel, name, mode, device, pin, self.Auth, recv, mqtt_client,
+                                sweep=sweep, status=modem_status, queue_size=queue_size, overflow=overflow,
+                                workers=workers, pdu=pdu, reports=reports, rate=rate, rate_number=rate_number,
+                                coalesce=coalesce, warm=warm, notify=notify_port, telemetry=telemetry, trace=trace,
+                                capture=modem_capture)
+            if len(device_list) > 1:
+                modem.SendFailover = self.failover
+            modem.Journal = self.Journal
+            modem.Dedup = self.Dedup
+            modem.Publisher = self.Publisher
+            if self.Metrics is not None:
+                modem.attachMetrics(self.Metrics)
+            self.Modems.append(modem)
+        logging.basicConfig(format='%(asctime)s %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p', level=loglevel)
+
+    @property
+    def Ready(self):
+        return any(modem.Ready for modem in self.Modems)
+
+    def open(self):
+        # modems are initialized at the same time
+        openers = [Thread(target=modem.open) for modem in self.Modems]
+        for modem, opener in zip(self.Modems, openers):
+            logging.info('... opening '+modem.Name+' on '+modem.GsmDevice)
+            opener.start()
+        for opener in openers:
+            opener.join()
+
+    def start(self):
+        self.open()
+        self.Publisher.start()
+        for modem in self.Modems:
+            logging.info('... starting '+modem.Name+' on '+modem.GsmDevice)
+            modem.start()
+            if not modem.Ready:
+                logging.error('...... '+modem.Name+' is not ready')
+        self.replaySms()
+        if self.Metrics is not None:
+            self.Metrics.start()
+
+    def stop(self):
+        if self.Metrics is not None:
+            self.Metrics.stop()
+        for modem in self.Modems:
+            modem.stop()
+        self.Publisher.stop()
+        if self.Journal is not None:
+            self.Journal.close()
+
+    def replaySms(self):
+        # sms left in journal by previous run are sent again
+        if self.Journal is None:
+            return
+        for sms_id, number, message, priority in self.Journal.outbox():
+            modem = self.selectModem()
+            if modem is None:
+                logging.error(f"... No modem ready, SMS to %s kept in journal", number)
+                break
+            modem.queueSms(number, message, sms_id, priority, replay=True)
+
+    def reloadAuth(self):
+        return self.Auth.reload()
+
+    def dumpTrace(self, reason: str = "on demand"):
+        for modem in self.Modems:
+            modem.dumpTrace(reason, True)
+
+    def healthyModems(self, exclude=None):
+        modems = [modem for modem in self.Modems if modem.Ready and modem is not exclude]
+        healthy = [modem for modem in modems if modem.Healthy]
+        return healthy or modems
+
+    def selectModem(self, exclude=None):
+        modems = self.healthyModems(exclude)
+        if not modems:
+            return None
+        if self.Schedule == "round":
+            with self.PoolSem:
+                self.NextModem += 1
+                return modems[self.NextModem % len(modems)]
+        return min(modems, key=lambda modem: modem.SendQueue.qsize() + modem.SendInFlight)
+
+    def queueSms(self, number, message, sms_id=None, priority="normal"):
+        modem = self.selectModem()
+        if modem is None:
+            logging.error(f"... No modem ready, rejecting SMS to %s", number)
+            return False
+        # an id given in the request makes it idempotent: MQTT redelivery or client retry sends once
+        if sms_id and self.Dedup is not None and self.Dedup.seen("out:"+sms_id):
+            logging.warning(f"... SMS %s to %s already requested, ignored", sms_id, number)
+            if self.Metrics is not None:
+                self.Metrics.inc("sms_duplicates_total", direction="out")
+            return True
+        if self.Journal is not None:
+            sms_id = sms_id or self.Journal.newId()
+            if not self.Journal.addOutbox(sms_id, number, message, priority):
+                logging.warning(f"... SMS %s to %s already queued, ignored", sms_id, number)
+                return True
+        logging.debug(f"... SMS to %s queued on %s with %s priority", number, modem.Name, priority)
+        if modem.queueSms(number, message, sms_id, priority):
+            return True
+        if self.Journal is not None:
+            self.Journal.ackOutbox(sms_id)
+        if sms_id and self.Dedup is not None:
+            self.Dedup.forget("out:"+sms_id)
+        return False
+
+    def failover(self, failed, number, message, sms_id=None, priority="normal"):
+        # called by a sender thread of failed modem when a send did not succeed
+        modem = self.selectModem(exclude=failed)
+        if modem is None:
+            logging.error(f"... No other modem to send SMS to %s", number)
+            return False
+        logging.info(f"... SMS to %s moved from %s to %s", number, failed.Name, modem.Name)
+        moved = modem.queueSms(number, message, sms_id, priority, replay=True)
+        if not failed.Healthy:
+            # modem is failing, move its waiting sms to the others
+            for number, message, sms_id, priority, queued in failed.SendQueue.drain():
+                modem = self.selectModem(exclude=failed)
+                logging.info(f"... SMS to %s moved from %s to %s", number, failed.Name, modem.Name)
+                modem.queueSms(number, message, sms_id, priority, replay=True)
+            failed.publishSendStatus()
+        return moved
@@ -0,0 +1,142 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024  Helios  helios14_75@hotmail.fr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import time
+import logging
+import paho.mqtt.client as mqtt
+
+from collections    import deque
+from threading      import Thread, Condition
+
+
+class gsm_publisher:
+    # Publish stage of received sms: modem readers queue messages and go on reading, one thread publishes them
+    # with a window of messages not yet acknowledged by the broker. done() of a message is called on its PUBACK
+    # (PUBCOMP with QoS 2, once written with QoS 0): modem storage and journal entry are freed only then.
+
+    QueueSize = 1000        # messages waiting, readers stop reading the modem beyond
+    Window = 20             # messages published and not yet acknowledged
+    RetryDelay = 1.0        # seconds before publishing again a message the client did not take (QoS 0, not connected)
+    DrainTimeout = 5.0      # seconds given on stop to messages not yet acknowledged
+
+    def __init__(self, mqtt_client, qos: int = 1, window: int = Window, size: int = QueueSize):
+        self.MQTTClient = mqtt_client
+        self.Qos = qos
+        self.Window = max(1, window)
+        self.Size = size
+        self.Sem = Condition()
+        self.Waiting = deque()          # (topic, payload, done, queued) not yet published
+        self.Unacked = {}               # mid -> (done, queued)
+        self.Early = set()              # mids acknowledged before publish() returned
+        self.Publishing = False
+        self.Published = 0
+        self.Acked = 0
+        self.Metrics = None
+        self.PublisherThread = None
+        self.Stopped = False
+        mqtt_client.on_publish = self.onPublish
+
+    def attachMetrics(self, metrics):
+        self.Metrics = metrics
+        metrics.set("sms_publish_queue", lambda: len(self.Waiting))
+        metrics.set("sms_publish_unacked", lambda: len(self.Unacked))
+
+    def put(self, topic: str, payload: str, done):
+        # never blocks, readers check full() before reading more sms
+        with self.Sem:
+            self.Waiting.append((topic, payload, done, time.monotonic()))
+            self.Sem.notify_all()
+
+    def full(self) -> bool:
+        return len(self.Waiting) >= self.Size
+
+    def idle(self) -> bool:
+        return not self.Waiting and not self.Unacked
+
+    def start(self):
+        self.Stopped = False
+        self.PublisherThread = Thread(target=self.runPublisherThread, name="gsm_publisher")
+        self.PublisherThread.daemon = True
+        self.PublisherThread.start()
+
+    def stop(self):
+        # messages not acknowledged in time are published again on next start (journal) or sweep (storage)
+        deadline = time.monotonic() + gsm_publisher.DrainTimeout
+        with self.Sem:
+            while not self.idle() and time.monotonic() < deadline:
+                self.Sem.wait(0.1)
+            if not self.idle():
+                logging.warning(f"... %d received SMS not acknowledged by MQTT broker",
+                                len(self.Waiting) + len(self.Unacked))
+            self.Stopped = True
+            self.Sem.notify_all()
+        if self.PublisherThread is not None:
+            self.PublisherThread.join()
+            self.PublisherThread = None
+
+    def runPublisherThread(self):
+        while True:
+            with self.Sem:
+                while not self.Stopped and (not self.Waiting or len(self.Unacked) >= self.Window):
+                    self.Sem.wait()
+                if self.Stopped:
+                    return
+                topic, payload, done, queued = self.Waiting[0]
+                self.Publishing = True
+            # not under Sem: paho calls on_publish with its own locks held
+            info = self.MQTTClient.publish(topic, payload, qos=self.Qos)
+            with self.Sem:
+                self.Publishing = False
+                acked = info.mid in self.Early
+                self.Early.clear()
+                # not connected: a QoS 1/2 message is kept by the client and sent once connected again
+                if info.rc != mqtt.MQTT_ERR_SUCCESS and (self.Qos == 0 or info.rc != mqtt.MQTT_ERR_NO_CONN):
+                    logging.debug(f"... publish on %s not taken (%d), retrying", topic, info.rc)
+                    self.Sem.wait(gsm_publisher.RetryDelay)
+                    continue
+                self.Waiting.popleft()
+                self.Published += 1
+                if not acked:
+                    self.Unacked[info.mid] = (done, queued)
+                    continue
+            self.acknowledged(done, queued)
+
+    def onPublish(self, client, userdata, mid, reason_code=None, properties=None):
+        # paho network thread, for every message of the client
+        with self.Sem:
+            entry = self.Unacked.pop(mid, None)
+            if entry is None:
+                if self.Publishing:
+                    self.Early.add(mid)
+                return
+            self.Sem.notify_all()
+        self.acknowledged(*entry)
+
+    def acknowledged(self, done, queued):
+        with self.Sem:
+            self.Acked += 1
+            self.Sem.notify_all()
+        if self.Metrics is not None:
+            self.Metrics.observe("sms_publish_seconds", time.monotonic() - queued)
+        done()
@@ -0,0 +1,108 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024  Helios  helios14_75@hotmail.fr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import re
+import json
+import time
+import logging
+
+from array          import array
+from threading      import Lock
+
+
+class gsm_recorder:
+    # Flight recorder of a modem: last lines written to and read from the serial port and the time of each
+    # command, in arrays allocated once. Nothing is formatted until a dump (timeout, +CME ERROR, SIGUSR1),
+    # so it can stay on in production while DEBUG logging stays off.
+
+    Size = 256              # lines kept
+    DumpDelay = 60.0        # seconds between two automatic dumps of the same modem
+    LineMax = 120           # bytes of a line shown in a dump
+    TX, RX, NOTIFY, DONE, FAILED = range(5)
+    KindNames = ("tx ", "rx ", "rx2", "ok ", "err")
+    Secret = re.compile(rb'\+(?:CPIN|CLCK|CPWD)=[^;\r\n]*')     # arguments holding pin or puk codes
+    Digits = re.compile(rb'\d{4,}')
+
+    def __init__(self, name: str, size: int = Size, mqtt_client=None, topic: str = ""):
+        self.Name = name
+        self.Size = max(1, size)
+        self.MQTTClient = mqtt_client
+        self.Topic = topic              # dumps are published there too when set
+        self.RecorderSem = Lock()
+        self.Times = array('d', bytes(8 * self.Size))   # monotonic time of each entry
+        self.Seconds = array('d', bytes(8 * self.Size)) # duration of completed commands
+        self.Kinds = bytearray(self.Size)
+        self.Lines = [None] * self.Size                 # bytes as read or written, not copied
+        self.Next = 0                                   # entries recorded so far
+        self.DumpedAt = None
+
+    def record(self, kind: int, line: bytes, seconds: float = 0.0):
+        with self.RecorderSem:
+            slot = self.Next % self.Size
+            self.Next += 1
+            self.Times[slot] = time.monotonic()
+            self.Kinds[slot] = kind
+            self.Lines[slot] = line
+            self.Seconds[slot] = seconds
+
+    @staticmethod
+    def mask(data: bytes) -> bytes:
+        # AT+CPIN="1234" shown as AT+CPIN="****", traces and captures are published and shared
+        return gsm_recorder.Secret.sub(lambda secret: gsm_recorder.Digits.sub(b'****', secret.group(0)), data)
+
+    @staticmethod
+    def text(line: bytes) -> str:
+        # control characters (cr, ctrl-z) shown escaped, long pdus cut, pin masked
+        shown = gsm_recorder.mask(line[:gsm_recorder.LineMax]).decode('latin-1').encode('unicode_escape').decode('ascii')
+        return shown + "..." if len(line) > gsm_recorder.LineMax else shown
+
+    def lines(self):
+        # oldest first, times in seconds before now
+        now = time.monotonic()
+        with self.RecorderSem:
+            count = min(self.Next, self.Size)
+            slots = [(self.Next - count + i) % self.Size for i in range(count)]
+            entries = [(self.Times[slot], self.Kinds[slot], self.Lines[slot], self.Seconds[slot]) for slot in slots]
+        result = []
+        for at, kind, line, seconds in entries:
+            text = self.text(line)
+            if kind in (gsm_recorder.DONE, gsm_recorder.FAILED):
+                text = f"{text} {seconds * 1000:.1f} ms"
+            result.append(f"{at - now:+9.3f} {gsm_recorder.KindNames[kind]} {text}")
+        return result
+
+    def dump(self, reason: str, force: bool = False) -> bool:
+        # automatic dumps are spaced by DumpDelay, a timeout is usually followed by a few others
+        now = time.monotonic()
+        with self.RecorderSem:
+            if not force and self.DumpedAt is not None and now - self.DumpedAt < gsm_recorder.DumpDelay:
+                return False
+            self.DumpedAt = now
+        lines = self.lines()
+        logging.warning(f"... %s flight recorder (%s), last %d lines:", self.Name, reason, len(lines))
+        for line in lines:
+            logging.warning(f"...... %s", line)
+        if self.MQTTClient is not None and self.Topic:
+            self.MQTTClient.publish(self.Topic, json.dumps({"modem": self.Name, "reason": reason, "lines": lines}))
+        return True
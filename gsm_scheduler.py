@@ -0,0 +1,200 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024  Helios  helios14_75@hotmail.fr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import time
+
+from collections    import deque, OrderedDict
+from itertools      import islice
+from threading      import Condition
+from queue          import Empty, Full
+
+PRIORITIES = ("high", "normal", "low")     # served in this order
+
+
+class token_bucket:
+    # rate per minute, bursts of up to 10 seconds of rate (at least one sms)
+
+    def __init__(self, rate: float):
+        self.Rate = rate / 60.0
+        self.Burst = max(1.0, rate / 6.0)
+        self.Tokens = self.Burst
+        self.Updated = time.monotonic()
+
+    def delay(self, now: float) -> float:
+        # seconds before one token is available, now may be older than a bucket made during select
+        if now > self.Updated:
+            self.Tokens = min(self.Burst, self.Tokens + (now - self.Updated) * self.Rate)
+            self.Updated = now
+        return 0.0 if self.Tokens >= 1.0 else (1.0 - self.Tokens) / self.Rate
+
+    def take(self):
+        self.Tokens -= 1.0
+
+
+class gsm_scheduler:
+    # Send queue of a modem: one FIFO per priority, token buckets per modem and per recipient,
+    # identical texts to the same number within the coalescing window are sent once.
+    # Waiting sms are (number, message, sms_id, priority, queued at).
+
+    ScanDepth = 32          # sms looked at in each priority for a recipient not rate limited
+    NumbersMax = 4096       # recipients buckets kept
+    WaitSmoothing = 0.2     # weight of last wait in the mean wait per priority
+
+    def __init__(self, size: int = 100, rate: float = 0, rate_number: float = 0, coalesce: float = 0):
+        self.Size = size
+        self.Sem = Condition()
+        self.Queues = {priority: deque() for priority in PRIORITIES}
+        self.Count = 0
+        self.ModemBucket = token_bucket(rate) if rate else None
+        self.NumberRate = rate_number
+        self.NumberBuckets = OrderedDict()      # number -> token_bucket, least recently used first
+        self.Coalesce = coalesce                # seconds
+        self.Recent = OrderedDict()             # (number, message) -> time queued, oldest first
+        self.Coalesced = 0
+        self.Wait = {priority: 0.0 for priority in PRIORITIES}     # mean seconds in queue
+
+    def qsize(self) -> int:
+        return self.Count
+
+    def put(self, number, message: str, sms_id=None, priority: str = "normal", bounded: bool = True) -> bool:
+        # False when coalesced with an identical sms, raises Full unless not bounded
+        now = time.monotonic()
+        priority = priority if priority in self.Queues else "normal"
+        with self.Sem:
+            if self.Coalesce:
+                key = (tuple(number) if isinstance(number, list) else number, message)
+                while self.Recent and next(iter(self.Recent.values())) < now - self.Coalesce:
+                    self.Recent.popitem(last=False)
+                if key in self.Recent:
+                    self.Coalesced += 1
+                    return False
+            if bounded and self.Count >= self.Size:
+                raise Full
+            if self.Coalesce:
+                self.Recent[key] = now
+            self.Queues[priority].append((number, message, sms_id, priority, now))
+            self.Count += 1
+            self.Sem.notify()
+        return True
+
+    def requeue(self, number, message: str, sms_id=None, priority: str = "normal"):
+        # sms taken but not sent (device lost) goes back first in its priority, even when queue is full
+        with self.Sem:
+            self.Queues[priority].appendleft((number, message, sms_id, priority, time.monotonic()))
+            self.Count += 1
+            self.Sem.notify()
+
+    def numberBucket(self, number: str):
+        bucket = self.NumberBuckets.get(number)
+        if bucket is None:
+            bucket = self.NumberBuckets[number] = token_bucket(self.NumberRate)
+            if len(self.NumberBuckets) > gsm_scheduler.NumbersMax:
+                self.NumberBuckets.popitem(last=False)
+        else:
+            self.NumberBuckets.move_to_end(number)
+        return bucket
+
+    def select(self, now: float, take: bool = True):
+        # (sms, 0) for the next sms allowed, removed from queue when taken,
+        # else (None, seconds before one may be sent), Sem must be held
+        if self.Count == 0:
+            return None, None
+        if self.ModemBucket is not None:
+            delay = self.ModemBucket.delay(now)
+            if delay > 0:
+                return None, delay
+        wait = None
+        for priority in PRIORITIES:
+            queue = self.Queues[priority]
+            for i, sms in enumerate(islice(queue, gsm_scheduler.ScanDepth)):
+                buckets = []
+                if self.NumberRate:
+                    numbers = sms[0] if isinstance(sms[0], list) else [sms[0]]
+                    buckets = [self.numberBucket(number) for number in numbers]
+                    delay = max(bucket.delay(now) for bucket in buckets)
+                    if delay > 0:
+                        wait = delay if wait is None else min(wait, delay)
+                        continue
+                if not take:
+                    return sms, 0.0
+                del queue[i]
+                self.Count -= 1
+                for bucket in buckets:
+                    bucket.take()
+                if self.ModemBucket is not None:
+                    self.ModemBucket.take()
+                waited = now - sms[4]
+                self.Wait[priority] += (waited - self.Wait[priority]) * gsm_scheduler.WaitSmoothing
+                return sms, 0.0
+        return None, wait
+
+    def get(self, timeout: float = None):
+        # next sms to send, waits for one allowed by rate limits, raises Empty
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self.Sem:
+            while True:
+                now = time.monotonic()
+                sms, delay = self.select(now)
+                if sms is not None:
+                    return sms
+                remaining = deadline - now if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    raise Empty
+                self.Sem.wait(min(value for value in (delay, remaining, 1.0) if value is not None))
+
+    def get_nowait(self):
+        with self.Sem:
+            sms, delay = self.select(time.monotonic())
+        if sms is None:
+            raise Empty
+        return sms
+
+    def nextDelay(self):
+        # seconds before an sms may be sent, None when queue is empty
+        with self.Sem:
+            sms, delay = self.select(time.monotonic(), take=False)
+        return 0.0 if sms is not None else delay
+
+    def dropOldest(self):
+        # oldest sms of lowest priority, raises Empty
+        with self.Sem:
+            for priority in reversed(PRIORITIES):
+                if self.Queues[priority]:
+                    self.Count -= 1
+                    return self.Queues[priority].popleft()
+        raise Empty
+
+    def drain(self):
+        # every waiting sms, rate limits ignored, by priority
+        with self.Sem:
+            result = [sms for priority in PRIORITIES for sms in self.Queues[priority]]
+            for queue in self.Queues.values():
+                queue.clear()
+            self.Count = 0
+        return result
+
+    def stats(self):
+        with self.Sem:
+            return {priority: {"queued": len(self.Queues[priority]), "wait": round(self.Wait[priority], 1)}
+                    for priority in PRIORITIES}
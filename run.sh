@@ -4,6 +4,17 @@ mode=$(bashio::config 'GSM_Mode')
 device=$(bashio::config 'GSM_Device')
 pin=$(bashio::config 'GSM_PIN')
 auth=$(bashio::config 'GSM_AUTH')
+auth_file=$(bashio::config 'GSM_AUTH_File')
+country=$(bashio::config 'GSM_Country')
+engine=$(bashio::config 'GSM_Engine')
+pdu=$(bashio::config 'GSM_PDU')
+reports=$(bashio::config 'GSM_Reports')
+warm=$(bashio::config 'GSM_Warm_Start')
+notify_device=$(bashio::config 'GSM_Notify_Device')
+telemetry=$(bashio::config 'GSM_Telemetry')
+trace=$(bashio::config 'GSM_Trace')
+capture=$(bashio::config 'GSM_Capture')
+sweep=$(bashio::config 'GSM_Sweep')
 
 host=$(bashio::config 'MQTT_Host')
 port=$(bashio::config 'MQTT_Port')
@@ -11,11 +22,28 @@ user=$(bashio::config 'MQTT_User')
 password=$(bashio::config 'MQTT_Password')
 send=$(bashio::config 'MQTT_Send')
 recv=$(bashio::config 'MQTT_Receive')
+recv_qos=$(bashio::config 'MQTT_Receive_QoS')
+recv_window=$(bashio::config 'MQTT_Receive_Window')
+status=$(bashio::config 'MQTT_Status')
+stats=$(bashio::config 'MQTT_Stats')
+
+queue=$(bashio::config 'SEND_Queue')
+overflow=$(bashio::config 'SEND_Overflow')
+workers=$(bashio::config 'SEND_Workers')
+schedule=$(bashio::config 'SEND_Schedule')
+journal=$(bashio::config 'SEND_Journal')
+rate=$(bashio::config 'SEND_Rate')
+rate_number=$(bashio::config 'SEND_Rate_Number')
+coalesce=$(bashio::config 'SEND_Coalesce')
 
 logging=$(bashio::config 'ADDON_Logging')
+metrics=$(bashio::config 'ADDON_Metrics')
+dedup=$(bashio::config 'ADDON_Dedup')
 
 echo "run.sh: launching sms_manager.py"
 python3 /sms_manager.py --mode $mode \
-  -d $device --pin $pin --auth $auth \
-  --host $host --port $port -u $user -s $password --send $send --recv $recv \
-  --log $logging
+  -d $device --pin $pin --auth $auth --auth-file "$auth_file" --country $country --engine $engine --pdu $pdu --reports $reports --warm $warm --notify-device "$notify_device" --telemetry $telemetry --trace $trace --capture "$capture" --sweep $sweep \
+  --host $host --port $port -u $user -s $password --send $send --recv $recv --recv-qos $recv_qos --recv-window $recv_window \
+  --status $status --queue $queue --overflow $overflow --workers $workers --schedule $schedule --journal "$journal" \
+  --rate $rate --rate-number $rate_number --coalesce $coalesce \
+  --stats "$stats" --metrics $metrics --dedup $dedup --log $logging
@@ -24,12 +24,17 @@ SOFTWARE.
 
 import paho.mqtt.client as mqtt
 import sys
+import time
 import signal
 import argparse
 import json
 import logging
 
-from gsm import gsm
+from threading import Thread
+
+from gsm_pool import gsm_pool
+from gsm_async import gsm_async
+from gsm_scheduler import PRIORITIES
 
 
 global  sms_gateway, mqtt_client
@@ -42,10 +47,44 @@ def signal_handler(sig, frame):
     logging.info('... Sms gateway stopped and closed under signal handler')
     sys.exit(0)
 
+def reload_handler(sig, frame):
+    global  sms_gateway
+
+    logging.info('Reloading authorized numbers under signal handler')
+    sms_gateway.reloadAuth()
+
+def trace_handler(sig, frame):
+    global  sms_gateway
+
+    # dumped by another thread: the signal may interrupt a thread holding the recorder or MQTT client lock
+    Thread(target=sms_gateway.dumpTrace, args=("SIGUSR1",), daemon=True).start()
+
 def print_response(data):
     for key, value in data["response"].items():
         logging.info(f"   {key}:  {value}")
 
+def on_connect(client, userdata, flags, reason_code, properties):
+    global sms_gateway
+
+    # paho reconnections: subscriptions are lost with the session
+    if reason_code.is_failure:
+        logging.error(f"MQTT connection refused: %s", reason_code)
+    elif sms_gateway.Ready:
+        logging.info('MQTT connected, subscribing on topic: '+userdata)
+        client.subscribe(userdata, qos=1)
+
+def connect_mqtt(options):
+    # broker may not be up yet
+    delay = 1
+    while True:
+        try:
+            mqtt_client.connect(options.host, int(options.port))
+            return
+        except OSError as error:
+            logging.error(f"... MQTT broker not reachable: %s, retrying in %d s", error, delay)
+            time.sleep(delay)
+            delay = min(delay * 2, 30)
+
 def on_message(client, userdata, msg):
     global sms_gateway, mqtt_client
 
@@ -53,9 +92,23 @@ def on_message(client, userdata, msg):
     logging.info(f"MQTT send message received")
     logging.debug(f"... JSON UTF-8 Message")
     logging.debug(msg.payload)
-    message = json.loads(msg.payload)
-    logging.info(f"... %s", message["txt"])
-    sms_gateway.sendSmsToNumber(message["to"], message["txt"])
+    try:
+        message = json.loads(msg.payload)
+        number = message["to"]
+        text = message["txt"]
+        sms_id = message.get("id")
+        priority = message.get("priority", "normal")
+        if not isinstance(number, (str, list)) or not isinstance(text, str) or not number:
+            raise TypeError
+        if sms_id is not None and not isinstance(sms_id, str):
+            raise TypeError
+        if priority not in PRIORITIES:
+            raise TypeError
+    except (ValueError, KeyError, TypeError):
+        logging.error(f"... invalid message: %s", msg.payload)
+        return
+    logging.info(f"... %s", text)
+    sms_gateway.queueSms(number, text, sms_id, priority)
 
 
 def main_modem(loglevel, options):
@@ -63,19 +116,44 @@ def main_modem(loglevel, options):
 
     # Start gateway
     logging.info('Starting SMS gateway')
-    sms_gateway = gsm(loglevel, "Huawei", options.mode, options.device, options.pin, options.auth, options.recv, mqtt_client)
+    # options by keyword, a missing or misspelled one fails here instead of shifting the others
+    sms_gateway = gsm_pool(loglevel, options.mode, options.device, options.pin, options.auth, options.recv, options.status,
+                           mqtt_client,
+                           sweep=int(options.sweep), queue_size=int(options.queue), overflow=options.overflow,
+                           workers=int(options.workers), schedule=options.schedule, pdu=options.pdu == "true",
+                           country=options.country, auth_file=options.auth_file, engine=options.engine,
+                           journal=options.journal, reports=options.reports == "true",
+                           metrics_port=int(options.metrics), metrics_topic=options.stats,
+                           rate=float(options.rate), rate_number=float(options.rate_number),
+                           coalesce=float(options.coalesce), warm=options.warm == "true", dedup=float(options.dedup),
+                           notify=options.notify_device, telemetry=float(options.telemetry),
+                           recv_qos=int(options.recv_qos), recv_window=int(options.recv_window),
+                           trace=int(options.trace), capture=options.capture)
+    # modems are initialized while MQTT connects, nothing is published before
+    opener = Thread(target=sms_gateway.open)
+    opener.start()
+    logging.info('Connecting to MQTT broker')
+    connect_mqtt(options)
+    logging.info('... Listening to MQTT broker: '+options.host+':'+options.port+' on topic: '+options.send)
+    opener.join()
     sms_gateway.start()
     while not sms_gateway.Ready:
-        pass
+        time.sleep(1)
 
     logging.info('Subscribing on topic: '+options.send)
-    mqtt_client.subscribe(options.send)
+    mqtt_client.subscribe(options.send, qos=1)
     logging.info('... Subscribing done')
 
     logging.info('')
-    logging.info('Entering MQTT endless loop')
-    mqtt_client.loop_forever()
-    logging.info('... Leaving MQTT endless loop')
+    if options.engine == "asyncio":
+        # modems and MQTT are all handled by the event loop thread
+        logging.info('Waiting on asyncio event loop')
+        gsm_async.LoopThread.join()
+        logging.info('... Leaving asyncio event loop')
+    else:
+        logging.info('Entering MQTT endless loop')
+        mqtt_client.loop_forever()
+        logging.info('... Leaving MQTT endless loop')
 
 
 def main(args=None):
@@ -84,15 +162,40 @@ def main(args=None):
     try:
         parser = argparse.ArgumentParser(description="Name Server command line launcher")
         parser.add_argument("--mode", dest="mode", help="modem or api", default="modem")
-        parser.add_argument("-d", "--device", dest="device", help="USB device name", default="/dev/serial/by-id/usb-HUAWEI_HUAWEI_Mobile-if00-port0")
-        parser.add_argument("--pin", dest="pin", help="code pin", default="-")
+        parser.add_argument("-d", "--device", dest="device", help="USB device names, comma separated", default="/dev/serial/by-id/usb-HUAWEI_HUAWEI_Mobile-if00-port0")
+        parser.add_argument("--pin", dest="pin", help="code pin, comma separated if different per device", default="-")
         parser.add_argument("--auth", dest="auth", help="authorized numbers", default="")
+        parser.add_argument("--auth-file", dest="auth_file", help="file of authorized numbers, reloaded on SIGHUP", default="")
+        parser.add_argument("--country", dest="country", help="country code of national numbers", default="33")
         parser.add_argument("-u", "--user", dest="user", help="mqtt user", default="mqtt")
         parser.add_argument("-s", "--secret", dest="secret", help="mqtt user password", default="mqtt")
         parser.add_argument("-r", "--host", dest="host", help="mqtt host", default="homeassistant.local")
         parser.add_argument("-p", "--port", dest="port", help="mqtt port", default="1883")
         parser.add_argument("--send", dest="send", help="mqtt send", default="send_sms")
         parser.add_argument("--recv", dest="recv", help="mqtt receive", default="sms_received")
+        parser.add_argument("--recv-qos", dest="recv_qos", help="mqtt QoS of received sms (0, 1 or 2)", default="1")
+        parser.add_argument("--recv-window", dest="recv_window", help="received sms published and not yet acknowledged by the broker", default="20")
+        parser.add_argument("--engine", dest="engine", help="thread or asyncio", default="thread")
+        parser.add_argument("--pdu", dest="pdu", help="true for PDU mode, false for text mode", default="false")
+        parser.add_argument("--reports", dest="reports", help="true to publish status reports of sent sms", default="false")
+        parser.add_argument("--notify-device", dest="notify_device", help="second tty of each modem read for notifications, none if empty", default="")
+        parser.add_argument("--warm", dest="warm", help="true to keep modem settings and stored sms on start", default="false")
+        parser.add_argument("--telemetry", dest="telemetry", help="seconds between two samples of signal, registration and storage, 0 for none", default="60")
+        parser.add_argument("--trace", dest="trace", help="serial lines kept by the flight recorder of each modem, 0 for none", default="256")
+        parser.add_argument("--capture", dest="capture", help="file of raw serial traffic (.modemN added with several modems), none if empty", default="")
+        parser.add_argument("--sweep", dest="sweep", help="seconds between two sweeps of modem storage", default="60")
+        parser.add_argument("--status", dest="status", help="mqtt send queue status", default="sms_status")
+        parser.add_argument("--queue", dest="queue", help="send queue size", default="100")
+        parser.add_argument("--overflow", dest="overflow", help="reject or oldest, when send queue is full", default="reject")
+        parser.add_argument("--workers", dest="workers", help="send worker threads", default="1")
+        parser.add_argument("--rate", dest="rate", help="sms per minute per modem, 0 for no limit", default="0")
+        parser.add_argument("--rate-number", dest="rate_number", help="sms per minute per recipient, 0 for no limit", default="0")
+        parser.add_argument("--coalesce", dest="coalesce", help="seconds an identical sms to the same number is sent once", default="0")
+        parser.add_argument("--schedule", dest="schedule", help="least or round, modem selection for sending", default="least")
+        parser.add_argument("--journal", dest="journal", help="file keeping sms across restarts, none if empty", default="")
+        parser.add_argument("--metrics", dest="metrics", help="HTTP port of /metrics, 0 for none", default="0")
+        parser.add_argument("--stats", dest="stats", help="mqtt topic of metrics, none if empty", default="")
+        parser.add_argument("--dedup", dest="dedup", help="seconds a repeated sms id or received sms is ignored, 0 for none", default="0")
         parser.add_argument("--log", dest="logging", help="addon logging level", default="INFO")
         options = parser.parse_args(args)
     except (Exception,):
@@ -121,12 +224,32 @@ def main(args=None):
     logging.info('... device is: '+options.device)
     logging.info('... pin is: '+options.pin)
     logging.info('... auth is: '+options.auth)
+    logging.info('... auth file is: '+options.auth_file)
+    logging.info('... country code is: '+options.country)
     logging.info('... mqtt user is: '+options.user)
     logging.info('... mqtt user secret is: '+options.secret)
     logging.info('... mqtt host is: '+options.host)
     logging.info('... mqtt port is: '+options.port)
     logging.info('... mqtt send is: '+options.send)
-    logging.info('... mqtt recv is: '+options.recv)
+    logging.info('... mqtt recv is: '+options.recv+' (QoS '+options.recv_qos+', window '+options.recv_window+')')
+    logging.info('... engine is: '+options.engine)
+    logging.info('... pdu mode is: '+options.pdu)
+    logging.info('... status reports are: '+options.reports)
+    logging.info('... notify device is: '+options.notify_device)
+    logging.info('... warm start is: '+options.warm)
+    logging.info('... telemetry interval is: '+options.telemetry)
+    logging.info('... flight recorder is: '+options.trace+' lines')
+    logging.info('... serial capture is: '+options.capture)
+    logging.info('... storage sweep is: '+options.sweep)
+    logging.info('... mqtt status is: '+options.status)
+    logging.info('... send queue is: '+options.queue+' ('+options.overflow+' when full, '+options.workers+' workers)')
+    logging.info('... modem schedule is: '+options.schedule)
+    logging.info('... send rate is: '+options.rate+' per modem, '+options.rate_number+' per recipient (per minute)')
+    logging.info('... coalescing window is: '+options.coalesce)
+    logging.info('... journal is: '+options.journal)
+    logging.info('... metrics port is: '+options.metrics)
+    logging.info('... mqtt stats is: '+options.stats)
+    logging.info('... dedup window is: '+options.dedup)
     logging.info('... addon logging is: '+options.logging)
 
     # Handle Interrupt and termination signals
@@ -134,24 +257,24 @@ def main(args=None):
     logging.info('Preparing signal handling for termination')
     signal.signal(signal.SIGINT, signal_handler)  # Handle CTRL-C signal
     signal.signal(signal.SIGTERM, signal_handler)  # Termination signal
+    signal.signal(signal.SIGHUP, reload_handler)  # Reload authorized numbers
+    signal.signal(signal.SIGUSR1, trace_handler)  # Dump flight recorder of modems
     logging.info('.... signal handling for termination done')
 
-    # Handle MQTT
-    logging.info('Connecting to MQTT broker')
-    broker = options.host
-    port = int(options.port)
+    # Handle MQTT, connected by main_modem
     user = options.user
     password = options.secret
-    topic = options.send        # "send_sms"
 
-    mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, userdata=options.send)
+    mqtt_client.on_connect = on_connect
     mqtt_client.on_message = on_message
+    mqtt_client.reconnect_delay_set(1, 30)
     mqtt_client.username_pw_set(user, password)  # see Mosquitto broker config
+    if options.engine == "asyncio":
+        gsm_async.attachMqtt(mqtt_client)
     # mqtt_client.tls_set()
-    mqtt_client.connect(broker)
-    logging.info('... Listening to MQTT broker: '+broker+':'+str(port)+' on topic: '+topic)
 
-    if options.mode == 'modem':
+    if options.mode in ('modem', 'api'):
         main_modem(log_level, options)
     else:
         logging.info('Error ! specify options "mode"')
@@ -0,0 +1,96 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024  Helios  helios14_75@hotmail.fr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# HiLink api mode against the simulated dongle (tools/fake_hilink.py): inbox polling, deletion, sending
+#   python3 -m pytest tests
+
+import os
+import sys
+import logging
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools'))
+
+from gsm_api import gsm_api         # noqa: E402
+from fake_hilink import fake_hilink  # noqa: E402
+
+
+def openApi(hilink, **options):
+    api = gsm_api(logging.CRITICAL, "dongle1", "api", hilink.Url, "", "*", "sms_received", None,
+                  telemetry=0, trace=0, **options)
+    api.open()
+    api.Ready = True
+    return api
+
+
+def test_inbox_polled_more_often_than_sweep():
+    hilink = fake_hilink()
+    try:
+        assert openApi(hilink, sweep=60).Sweep == gsm_api.InboxPoll
+        assert openApi(hilink, sweep=2).Sweep == 2
+    finally:
+        hilink.close()
+
+
+def test_read_then_delete():
+    hilink = fake_hilink(rotate=True)
+    api = openApi(hilink)
+    try:
+        for text in ("first", "second"):
+            hilink.deliver("+33612345678", text)
+        assert [sms['Msg'] for sms in api.readNewSms()] == ["first", "second"]
+        assert api.readNewSms() == []       # listed again, not published twice
+        api.deleteReadSms()
+        assert hilink.Inbox == {} and api.ApiRead == []
+    finally:
+        hilink.close()
+
+
+def test_failed_delete_keeps_indexes():
+    # regression: indexes were dropped when delete-sms failed, the sms stayed in the inbox for good
+    hilink = fake_hilink()
+    api = openApi(hilink)
+    post = hilink.post
+    try:
+        index = hilink.deliver("+33612345678", "hello")
+        assert len(api.readNewSms()) == 1
+        hilink.post = lambda path, headers, body: fake_hilink.error(100002)
+        api.deleteReadSms()
+        assert index in hilink.Inbox and api.ApiRead == [str(index)]
+        hilink.post = post
+        assert api.readNewSms() == []
+        api.deleteReadSms()
+        assert hilink.Inbox == {} and api.ApiRead == []
+    finally:
+        hilink.close()
+
+
+def test_send():
+    hilink = fake_hilink(rotate=True)
+    api = openApi(hilink)
+    try:
+        assert api.sendSms(["+33612345678", "+33687654321"], "hello")
+        assert hilink.Sent == [("+33612345678", "hello"), ("+33687654321", "hello")]
+    finally:
+        hilink.close()
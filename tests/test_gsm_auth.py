@@ -0,0 +1,88 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024  Helios  helios14_75@hotmail.fr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# Authorized numbers: normalization, exact numbers, prefix and deny rules
+#   python3 -m pytest tests
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from gsm_auth import gsm_auth   # noqa: E402
+
+
+def test_normalize():
+    auth = gsm_auth("", "33")
+    assert auth.normalize("0612345678") == "+33612345678"
+    assert auth.normalize("0033 6 12 34 56 78") == "+33612345678"
+    assert auth.normalize("33612345678") == "+33612345678"
+    assert auth.normalize("Free Mobile") == "Free Mobile"
+
+
+def test_exact_numbers_any_format():
+    auth = gsm_auth("0612345678, +33 6 22 22 22 22", "33")
+    assert auth.isAuthorized("+33612345678")
+    assert auth.isAuthorized("0033622222222")
+    assert not auth.isAuthorized("+33612345679")
+    assert not auth.isAuthorized("+3361234567")
+
+
+def test_prefix_rules():
+    auth = gsm_auth("+3361*,07*", "33")
+    assert auth.isAuthorized("+33611111111")
+    assert auth.isAuthorized("0611111111")
+    assert auth.isAuthorized("+33712345678")
+    assert not auth.isAuthorized("+33621111111")
+    assert not auth.isAuthorized("+336")
+
+
+def test_deny_rules_win():
+    auth = gsm_auth("*, !+33619*, !0600000000, +33619000000", "33")
+    assert auth.isAuthorized("+14155550100")
+    assert not auth.isAuthorized("+33619123456")
+    assert not auth.isAuthorized("+33619000000")          # allowed exactly, denied by prefix
+    assert not auth.isAuthorized("+33600000000")
+
+
+def test_nothing_authorized():
+    auth = gsm_auth("", "33")
+    assert not auth.isAuthorized("+33612345678")
+
+
+def test_file_rules_and_reload(tmp_path):
+    path = tmp_path / "auth.txt"
+    path.write_text("# family\n+33611111111  # me\n!+33611111112\n+44*\n", encoding='utf-8')
+    auth = gsm_auth("+33611111112", "33", str(path))
+    assert auth.isAuthorized("+33611111111")
+    assert not auth.isAuthorized("+33611111112")
+    assert auth.isAuthorized("+447700900123")
+    path.write_text("+33633333333\n", encoding='utf-8')
+    assert auth.reload()
+    assert not auth.isAuthorized("+33611111111")
+    assert auth.isAuthorized("+33611111112")
+    assert auth.isAuthorized("0633333333")
+    path.unlink()
+    assert not auth.reload()                                # rules kept when the file cannot be read
+    assert auth.isAuthorized("0633333333")
@@ -0,0 +1,82 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024  Helios  helios14_75@hotmail.fr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# GSM-7 codec: fixed vectors of GSM 03.38, text mode payloads without escape
+#   python3 -m pytest tests
+
+import os
+import sys
+import logging
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools'))
+
+from gsm_codec import encodeGSM7, encodeGSM7Text, decodeGSM7, lengthGSM7     # noqa: E402
+from gsm import gsm                                                         # noqa: E402
+from fake_modem import fake_modem                                           # noqa: E402
+
+EXTENSION = "€[]{}~\\^|"
+
+
+def test_alphabet_vectors():
+    assert encodeGSM7("@£$¥") == b'\x00\x01\x02\x03'
+    assert encodeGSM7("Hello") == b'Hello'
+    assert encodeGSM7("ÄÖÑÜ§¿äöñüà") == b'\x5b\x5c\x5d\x5e\x5f\x60\x7b\x7c\x7d\x7e\x7f'
+    assert encodeGSM7("Δ_ΦΓΛΩΠΨΣΘΞ") == bytes(range(0x10, 0x1b))
+
+
+def test_extension_escape_round_trip():
+    assert encodeGSM7("€") == b'\x1b\x65'
+    assert encodeGSM7(EXTENSION) == b'\x1b\x65\x1b\x3c\x1b\x3e\x1b\x28\x1b\x29\x1b\x3d\x1b\x2f\x1b\x14\x1b\x40'
+    assert decodeGSM7(encodeGSM7("a " + EXTENSION + " b")) == "a " + EXTENSION + " b"
+    assert lengthGSM7(EXTENSION) == 18
+
+
+def test_unknown_characters():
+    assert encodeGSM7("ç漢\x1b") == b'c??'
+    assert lengthGSM7("漢") is None
+    assert decodeGSM7(b'\x1b\x41') == "A"           # unknown extension shown as the default character
+
+
+def test_text_mode_has_no_escape():
+    # escape after the prompt cancels the sms on the modem
+    payload = encodeGSM7Text("price 5€ [x] {a}~\\^|")
+    assert b'\x1b' not in payload
+    assert decodeGSM7(payload) == "price 5EUR (x) (a)-/'/"
+    assert gsm.encodeUTF8toGSM7("price 5€ [x]") == b'price 5EUR (x)\x1a'
+
+
+def test_text_mode_send_with_extension_characters():
+    # regression: the escape made the modem cancel the sms and AT+CMGS time out
+    modem = fake_modem()
+    sender = gsm(logging.CRITICAL, "modem1", "modem", modem.Device, "0000", "*", "sms_received", None,
+                 telemetry=0, trace=0)
+    try:
+        sender.open()
+        sender.Ready = True
+        assert sender.sendSms("+33612345678", "price 5€ [x]")
+        assert modem.Sent == [("+33612345678", "price 5EUR (x)")]
+    finally:
+        sender.stop()
+        modem.close()
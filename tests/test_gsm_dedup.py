@@ -0,0 +1,121 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024  Helios  helios14_75@hotmail.fr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# Dedup cache: ttl, eviction of expired and least recently seen keys, journal copy
+#   python3 -m pytest tests
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import gsm_dedup as dedup_module        # noqa: E402
+from gsm_dedup import gsm_dedup         # noqa: E402
+
+
+class clock:
+    # time.time() of gsm_dedup, moved by the test
+    def __init__(self):
+        self.Now = 1000.0
+
+    def time(self):
+        return self.Now
+
+
+def test_repeat_within_ttl(monkeypatch):
+    now = clock()
+    monkeypatch.setattr(dedup_module, "time", now)
+    dedup = gsm_dedup(60)
+    assert not dedup.seen("out:a")
+    now.Now += 59
+    assert dedup.seen("out:a")
+    now.Now += 59                           # seen again: ttl starts over
+    assert dedup.seen("out:a")
+    now.Now += 61
+    assert not dedup.seen("out:a")
+    assert dedup.Repeats == 2
+
+
+def test_expired_keys_evicted(monkeypatch):
+    now = clock()
+    monkeypatch.setattr(dedup_module, "time", now)
+    dedup = gsm_dedup(60)
+    for key in ("a", "b", "c"):
+        dedup.seen(key)
+        now.Now += 10
+    now.Now += 45                           # a and b expired, c expires in 5 s
+    dedup.seen("d")
+    assert list(dedup.Keys) == ["c", "d"]
+
+
+def test_size_bound_evicts_least_recently_seen(monkeypatch):
+    now = clock()
+    monkeypatch.setattr(dedup_module, "time", now)
+    dedup = gsm_dedup(60, size=2)
+    dedup.seen("a")
+    dedup.seen("b")
+    dedup.seen("a")
+    dedup.seen("c")
+    assert list(dedup.Keys) == ["a", "c"]
+    assert not dedup.seen("b")
+
+
+def test_forget():
+    dedup = gsm_dedup(60)
+    dedup.seen("out:a")
+    dedup.forget("out:a")
+    assert not dedup.seen("out:a")
+
+
+def test_sms_key():
+    sms = {'Number': "+33612345678", 'Timestamp': "24/01/01,10:00:00+04", 'Msg': "hello", 'Id': "3"}
+    assert gsm_dedup.smsKey(sms) == gsm_dedup.smsKey(dict(sms, Id="7"))
+    assert gsm_dedup.smsKey(sms) != gsm_dedup.smsKey(dict(sms, Msg="hello!"))
+
+
+class journal:
+    def __init__(self):
+        self.Seen = {}
+
+    def seen(self):
+        return sorted(self.Seen.items(), key=lambda item: item[1])
+
+    def addSeen(self, key, expires, evicted=()):
+        if key is not None:
+            self.Seen[key] = expires
+        for old_key in evicted:
+            self.Seen.pop(old_key, None)
+
+
+def test_journal_copy(monkeypatch):
+    now = clock()
+    monkeypatch.setattr(dedup_module, "time", now)
+    keys = journal()
+    dedup = gsm_dedup(60, keys)
+    dedup.seen("a")
+    now.Now += 30
+    dedup.seen("b")
+    dedup.forget("b")
+    assert keys.Seen == {"a": 1060.0}
+    assert gsm_dedup(60, keys).seen("a")
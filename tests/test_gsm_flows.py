@@ -0,0 +1,100 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024  Helios  helios14_75@hotmail.fr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# AT command flows of gsm run against scripted modem responses, without a device
+#   python3 -m pytest tests
+
+import os
+import sys
+import logging
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from gsm import gsm                     # noqa: E402
+from gsm_io import at_command           # noqa: E402
+from gsm_dedup import gsm_dedup         # noqa: E402
+
+
+def modem(**options):
+    return gsm(logging.CRITICAL, "modem1", "modem", "/dev/null", "0000", "*", "sms_received", None,
+               telemetry=0, trace=0, **options)
+
+
+def runFlow(flow, responses):
+    # responses: frame prefix -> (intermediate lines, final result code), commands written are returned
+    frames = []
+    command = None
+    try:
+        while True:
+            frame, payload, timeout = flow.send(command)
+            frames.append(frame)
+            lines, result = next(value for prefix, value in responses.items() if frame.startswith(prefix))
+            command = at_command(frame, payload)
+            command.Lines = list(lines)
+            command.complete(result, None if result == b'OK' else result.decode('ascii'))
+    except StopIteration as stop:
+        return stop.value, frames
+
+
+def test_broadcast_without_cmgw_index():
+    # OK without +CMGW: line, the flow fails instead of raising in the sender
+    sender = modem()
+    sent, frames = runFlow(sender.sendSmsToNumbersFlow(["+33611111111", "+33622222222"], "hello"),
+                           {b'AT+CMGW': ([], b'OK')})
+    assert sent is False
+    assert frames == [b'AT+CMGW="+33611111111"']
+
+
+def test_broadcast():
+    sender = modem()
+    sent, frames = runFlow(sender.sendSmsToNumbersFlow(["+33611111111", "+33622222222"], "hello"),
+                           {b'AT+CMGW': ([b'+CMGW: 4'], b'OK'), b'AT+CMSS': ([b'+CMSS: 9'], b'OK'),
+                            b'AT+CMGD': ([], b'OK')})
+    assert sent is True
+    assert frames == [b'AT+CMGW="+33611111111"', b'AT+CMSS=4,"+33611111111"', b'AT+CMSS=4,"+33622222222"',
+                      b'AT+CMGD=4,0']
+
+
+def test_sweep_drops_announced_indexes():
+    # sms announced by +CMTI and listed by the sweep are not read again with CMGR
+    reader = modem()
+    for index in ("3", "7", "4"):
+        reader.NewSmsQueue.put(index)
+    listing = [b'+CMGL: 3,"REC UNREAD","+33611111111",,"24/01/01,10:00:00+04"', b'hello',
+               b'+CMGL: 4,"REC UNREAD","+33622222222",,"24/01/01,10:00:05+04"', b'world']
+    new_sms, frames = runFlow(reader.readNewSmsFlow(), {b'AT+CMGL': (listing, b'OK')})
+    assert [(sms['Id'], sms['Msg']) for sms in new_sms] == [("3", "hello"), ("4", "world")]
+    assert reader.NewSmsQueue.get_nowait() == "7"
+    assert reader.NewSmsQueue.empty()
+
+
+def test_failed_send_forgets_request_id():
+    # a request retried with the same id after a failed send is sent again, not ignored as a repeat
+    sender = modem()
+    sender.Dedup = gsm_dedup(60)
+    assert not sender.Dedup.seen("out:alarm-1")
+    sender.ackSms("alarm-1", False)
+    assert not sender.Dedup.seen("out:alarm-1")
+    sender.ackSms("alarm-1")
+    assert sender.Dedup.seen("out:alarm-1")
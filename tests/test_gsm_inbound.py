@@ -0,0 +1,93 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024  Helios  helios14_75@hotmail.fr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# Received sms read from the simulated modem (tools/fake_modem.py): storage sweep, +CMTI, texts that look like
+# final result codes
+#   python3 -m pytest tests
+
+import os
+import sys
+import time
+import logging
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools'))
+
+from gsm import gsm                 # noqa: E402
+from fake_modem import fake_modem   # noqa: E402
+
+
+def openModem(modem, **options):
+    reader = gsm(logging.CRITICAL, "modem1", "modem", modem.Device, "0000", "*", "sms_received", None,
+                 telemetry=0, trace=0, **options)
+    reader.open()
+    reader.Ready = True
+    return reader
+
+
+def test_sweep_texts_reading_ok_and_error():
+    # regression: a text "OK" ended the CMGL listing, the sms after it were deleted unread by CMGD=0,3
+    modem = fake_modem()
+    reader = openModem(modem)
+    try:
+        for text in ("first", "OK", "third", "ERROR", "", "last"):
+            modem.deliver("+33612345678", text, notify=False)
+        assert [sms['Msg'] for sms in reader.readNewSms()] == ["first", "OK", "third", "ERROR", "", "last"]
+        reader.deleteReadSms()
+        assert modem.Storage == {}
+    finally:
+        reader.stop()
+        modem.close()
+
+
+def test_read_by_index_text_reading_ok():
+    modem = fake_modem()
+    reader = openModem(modem)
+    try:
+        index = modem.deliver("+33612345678", "OK", notify=False)
+        sms = reader.readSmsByIndex(str(index))
+        assert (sms['Number'], sms['Msg']) == ("+33612345678", "OK")
+        assert reader.readSmsByIndex(str(index + 1)) is None
+    finally:
+        reader.stop()
+        modem.close()
+
+
+def test_cmti_read_at_once():
+    # announced sms read by index long before the next sweep
+    modem = fake_modem()
+    reader = openModem(modem, sweep=60)
+    received = []
+    reader.publishSms = lambda sms, replay=False: received.append(sms) if sms is not None else None
+    try:
+        reader.startGsmReader()
+        time.sleep(0.5)                 # first sweep done
+        started = time.monotonic()
+        modem.deliver("+33612345678", "hello")
+        while not received and time.monotonic() - started < 5:
+            time.sleep(0.05)
+        assert [(sms['Number'], sms['Msg']) for sms in received] == [("+33612345678", "hello")]
+    finally:
+        reader.stop()
+        modem.close()
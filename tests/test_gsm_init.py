@@ -0,0 +1,91 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024  Helios  helios14_75@hotmail.fr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# Modem set up against the simulated modem (tools/fake_modem.py): cold start, warm start
+#   python3 -m pytest tests
+
+import os
+import sys
+import logging
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools'))
+
+from gsm import gsm                 # noqa: E402
+from fake_modem import fake_modem   # noqa: E402
+
+
+def recordCommands(modem):
+    # command lines received by the simulated modem
+    commands = []
+    command = modem.command
+    modem.command = lambda line: (commands.append(line), command(line))
+    return commands
+
+
+def openModem(modem, **options):
+    device = gsm(logging.CRITICAL, "modem1", "modem", modem.Device, "0000", "*", "sms_received", None,
+                 telemetry=0, trace=0, **options)
+    device.open()                       # opened and set up
+    device.Ready = True
+    return device
+
+
+def test_cold_start_resets_and_wipes():
+    modem = fake_modem()
+    commands = recordCommands(modem)
+    modem.deliver("+33612345678", "stored", notify=False)
+    device = openModem(modem)
+    try:
+        assert commands[0] == gsm.ATZ and gsm.ATCMGD+"0,4" in commands
+        assert modem.Storage == {} and modem.Cnmi == gsm.ATCNMI[8:] and not modem.Pdu
+    finally:
+        device.stop()
+        modem.close()
+
+
+def test_warm_start_keeps_stored_sms():
+    modem = fake_modem()
+    commands = recordCommands(modem)
+    modem.deliver("+33612345678", "stored", notify=False)
+    device = openModem(modem, warm=True, pdu=True)
+    try:
+        assert gsm.ATZ not in commands and not any(line.startswith(gsm.ATCMGD) for line in commands)
+        assert len(modem.Storage) == 1 and modem.Cnmi == gsm.ATCNMI[8:] and modem.Pdu and modem.Cpms == "ME"
+        assert [sms['Msg'] for sms in device.readNewSms()] == ["stored"]
+    finally:
+        device.stop()
+        modem.close()
+
+
+def test_warm_start_sends_only_differing_settings():
+    modem = fake_modem()
+    openModem(modem, warm=True).stop()
+    commands = recordCommands(modem)
+    device = openModem(modem, warm=True)
+    try:
+        assert commands == [gsm.ATE0, gsm.ATSTATE, "AT" + ";".join(setting[2:] for setting in (gsm.ATCSCS, gsm.ATCSDH))]
+    finally:
+        device.stop()
+        modem.close()
@@ -0,0 +1,163 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024  Helios  helios14_75@hotmail.fr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# Serial reader and AT commands of gsm_io without a device: bytes fed as the reader thread would, written frames recorded
+#   python3 -m pytest tests
+
+import os
+import sys
+import logging
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from gsm_io import gsm_io       # noqa: E402
+
+
+def reader():
+    io = gsm_io(logging.CRITICAL, "/dev/null")
+    io.Written = []
+    io.writeData = io.Written.append
+    return io
+
+
+def test_lines_split_across_reads():
+    io = reader()
+    lines = []
+    io.GsmIoHandlers[b'+CMTI:'] = lines.append
+    for data in (b'\r\n+CMTI: "SM",', b'3\r', b'\n\r\n+CMTI: "SM",4\r\n+CM', b'TI: "SM",5\r\n'):
+        io.feedGsmIoData(data)
+    assert lines == [b'+CMTI: "SM",3', b'+CMTI: "SM",4', b'+CMTI: "SM",5']
+    assert io.GsmIoBuffer == b''
+
+
+def test_unhandled_lines_without_command_ignored():
+    io = reader()
+    io.feedGsmIoData(b'\r\n^RSSI: 12\r\nRING\r\n')
+    assert io.GsmIoBuffer == b'' and io.GsmIoNextLine is None
+
+
+def test_handler_chains_next_line():
+    # +CDS: <length> announces its pdu on the next line, whatever it reads
+    io = reader()
+    pdus = []
+
+    def onPdu(line):
+        pdus.append(line)
+
+    io.GsmIoHandlers[b'+CDS:'] = lambda line: onPdu
+    io.feedGsmIoData(b'\r\n+CDS: 25\r\nOK\r\n+CDS: 25\r\n0791\r\n')
+    assert pdus == [b'OK', b'0791']
+
+
+def test_prompt_writes_payload():
+    io = reader()
+    command = io.writeCommand(b'AT+CMGS="+33612345678"', b'hello\x1a')
+    io.feedGsmIoData(b'\r\n> ')
+    assert io.Written == [b'AT+CMGS="+33612345678"\r', b'hello\x1a']
+    io.feedGsmIoData(b'\r\n+CMGS: 7\r\n\r\nOK\r\n')
+    assert command.ok and command.value(b'+CMGS:') == b'7'
+
+
+def test_unexpected_prompt_escaped():
+    io = reader()
+    io.feedGsmIoData(b'> ')
+    assert io.Written == [b'\x1b']
+
+
+def test_command_lines_and_echo():
+    io = reader()
+    command = io.writeCommand(b'AT+CMGW="+33612345678"')
+    io.feedGsmIoData(b'AT+CMGW="+33612345678"\r\r\n+CMGW: 3\r\n\r\nOK\r\n')
+    assert command.ok and command.Result == b'OK'
+    assert command.Lines == [b'+CMGW: 3'] and command.value(b'+CMGW:') == b'3'
+    assert command.value(b'+CMGS:') is None
+
+
+def test_command_error():
+    io = reader()
+    command = io.writeCommand(b'AT+CMGR=9')
+    io.feedGsmIoData(b'\r\n+CMS ERROR: 321\r\n')
+    assert command.Done.is_set() and not command.ok
+    assert command.Result == b'+CMS ERROR: 321' and command.Error == '+CMS ERROR: 321'
+
+
+def test_commands_written_one_at_a_time():
+    io = reader()
+    first, second = io.writeCommand(b'AT'), io.writeCommand(b'AT+CSQ')
+    assert io.Written == [b'AT\r']
+    io.feedGsmIoData(b'\r\nOK\r\n')
+    assert first.ok and not second.Done.is_set() and io.Written == [b'AT\r', b'AT+CSQ\r']
+    io.feedGsmIoData(b'\r\n+CSQ: 18,99\r\n\r\nOK\r\n')
+    assert second.ok and second.value(b'+CSQ:') == b'18,99'
+
+
+def test_timeout_then_device_lost():
+    io = reader()
+    commands = []
+    for n in range(gsm_io.TimeoutsMax):
+        commands.append(io.writeCommand(b'AT', timeout=0.01))
+        io.GsmIoCommand.Deadline -= 1.0
+        io.checkCommandDeadline()
+    assert [command.Error for command in commands] == ['timeout'] * gsm_io.TimeoutsMax
+    assert io.GsmIoLost.is_set()
+    assert io.writeCommand(b'AT').Error == 'device lost'
+
+
+def test_answer_resets_timeouts():
+    io = reader()
+    io.writeCommand(b'AT', timeout=0.01)
+    io.GsmIoCommand.Deadline -= 1.0
+    io.checkCommandDeadline()
+    io.writeCommand(b'AT')
+    io.feedGsmIoData(b'\r\nOK\r\n')
+    assert io.GsmIoTimeouts == 0 and not io.GsmIoLost.is_set()
+
+
+def test_cancelled_command_skipped():
+    io = reader()
+    first, second, third = io.writeCommand(b'AT'), io.writeCommand(b'AT+CSQ'), io.writeCommand(b'AT+CREG?')
+    second.cancel()
+    io.feedGsmIoData(b'\r\nOK\r\n')
+    assert second.Error == 'cancelled' and io.Written == [b'AT\r', b'AT+CREG?\r']
+    io.feedGsmIoData(b'\r\nOK\r\n')
+    assert first.ok and third.ok
+
+
+def test_done_callbacks():
+    io = reader()
+    done = []
+    command = io.writeCommand(b'AT')
+    command.addDoneCallback(done.append)
+    assert done == [] and not command.wait(0.01)
+    io.feedGsmIoData(b'\r\nOK\r\n')
+    command.addDoneCallback(done.append)
+    assert done == [command, command] and command.wait()
+
+
+def test_device_lost_fails_commands():
+    io = reader()
+    first, second = io.writeCommand(b'AT'), io.writeCommand(b'AT+CSQ')
+    io.setGsmIoLost("test")
+    io.failGsmIoCommands()
+    assert first.Error == second.Error == 'device lost'
@@ -0,0 +1,89 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024  Helios  helios14_75@hotmail.fr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# Journal: outbox and inbox kept across restarts, batched writes, dedup keys
+#   python3 -m pytest tests
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from gsm_journal import gsm_journal     # noqa: E402
+
+
+def test_outbox_across_restart(tmp_path):
+    path = str(tmp_path / "journal.db")
+    journal = gsm_journal(path, flush=0.01)
+    assert journal.addOutbox("a", "+33611111111", "first")
+    assert journal.addOutbox("b", ["+33611111111", "+33622222222"], "second", "high")
+    assert not journal.addOutbox("a", "+33611111111", "first again")
+    journal.addOutbox("c", "+33633333333", "third")
+    journal.ackOutbox("c")
+    journal.close()
+    journal = gsm_journal(path, flush=0.01)
+    assert journal.outbox() == [("a", "+33611111111", "first", "normal"),
+                                ("b", ["+33611111111", "+33622222222"], "second", "high")]
+    assert not journal.addOutbox("b", "+33611111111", "second")
+    journal.close()
+
+
+def test_inbox_by_modem(tmp_path):
+    path = str(tmp_path / "journal.db")
+    journal = gsm_journal(path, flush=0.01)
+    sms = {'Number': "+33611111111", 'Timestamp': "24/01/01,10:00:00+04", 'Msg': "hello"}
+    sms_id = journal.addInbox("modem1", sms)
+    assert sms_id == gsm_journal.smsId("modem1", dict(sms))
+    assert journal.addInbox("modem1", sms) is None              # same sms read twice
+    assert journal.addInbox("modem2", sms) not in (None, sms_id)
+    journal.ackInbox(journal.smsId("modem2", sms))
+    journal.close()
+    journal = gsm_journal(path, flush=0.01)
+    assert journal.inbox("modem1") == [dict(sms, Journal=[sms_id])]
+    assert journal.inbox("modem2") == []
+    journal.close()
+
+
+def test_seen_keys_expire(tmp_path):
+    path = str(tmp_path / "journal.db")
+    journal = gsm_journal(path, flush=0.01)
+    journal.addSeen("old", 1.0)
+    journal.addSeen("kept", 4e9)
+    journal.addSeen("gone", 4e9)
+    journal.addSeen(None, 0, ["gone"])
+    journal.flush()
+    assert journal.seen() == [("kept", 4e9)]
+    journal.close()
+
+
+def test_writes_batched(tmp_path):
+    # nothing in the database before the flush thread commits, everything after
+    path = str(tmp_path / "journal.db")
+    journal = gsm_journal(path, flush=2)
+    for i in range(100):
+        journal.addOutbox(str(i), "+33611111111", "text %d" % i)
+    assert journal.outbox() == []
+    journal.flush()
+    assert len(journal.outbox()) == 100
+    journal.close()
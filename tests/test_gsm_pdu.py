@@ -0,0 +1,135 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024  Helios  helios14_75@hotmail.fr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# PDU codec against fixed vectors, not against the simulated modem (it uses the same codec).
+# Lengths given to AT+CMGS do not count the SMSC octet (00)
+#   python3 -m pytest tests
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from gsm_pdu import encodeSubmit, decodeDeliver, decodeStatusReport, pdu_parts, packSeptets  # noqa: E402
+from gsm_pdu import PDU_GSM7_PART, PDU_UCS2_PART                                             # noqa: E402
+
+
+def submitFields(pdu: str):
+    # first octet, user data length and user data of an SMS-SUBMIT with empty SMSC and no validity period
+    data = bytes.fromhex(pdu)
+    destination = 2 + (data[3] + 1) // 2
+    position = 3 + destination + 2
+    return data[1], data[position], data[position+1:]
+
+
+def test_pack_hellohello():
+    # 23.038 example: "hellohello" packed in 9 octets
+    assert packSeptets(b'hellohello').hex().upper() == "E8329BFD4697D9EC37"
+
+
+def test_submit_gsm7():
+    # SMS-SUBMIT, no validity period, to +46708251358, "hellohello"
+    assert encodeSubmit("+46708251358", "hellohello") == \
+        [(22, "0001000B916407281553F800000AE8329BFD4697D9EC37")]
+
+
+def test_submit_national_number_and_report():
+    # unknown numbering for a number without '+', TP-SRR asked (0x21)
+    assert encodeSubmit("0612345678", "hi", reference=0, status_report=True) == \
+        [(14, "0021000A816021436587000002E834")]
+
+
+def test_submit_ucs2():
+    # "你好" in UCS-2 (dcs 08), 4 octets
+    assert encodeSubmit("+33612345678", "你好") == [(17, "0001000B913316325476F8000804" + "4F60597D")]
+
+
+def test_deliver_gsm7():
+    # SMS-DELIVER from 27838890001 with SMSC +27381000015, 99/03/29 15:16:59 +2h
+    sms = decodeDeliver("07917283010010F5040BC87238880900F10000993092516195800AE8329BFD4697D9EC37")
+    assert sms == {'Number': "27838890001", 'Timestamp': "99/03/29,15:16:59+08", 'Msg': "hellohello",
+                   'Reference': 0, 'Parts': 1, 'Part': 1}
+
+
+def test_deliver_international_ucs2():
+    sms = decodeDeliver("00040B913316325476F800082440101234568004" + "4F60597D")
+    assert (sms['Number'], sms['Timestamp'], sms['Msg']) == ("+33612345678", "42/04/01,21:43:65+08", "你好")
+
+
+def test_deliver_concatenated_gsm7():
+    # UDH 05 00 03 <ref 0x2A> <2 parts> <part 1>, text after one fill bit: 'a' (0x61) gives C2 E1 ...
+    sms = decodeDeliver("0044" + "0B913316325476F8" + "0000" + "24401012345680" + "09" + "0500032A0201" + "C2E100")
+    assert (sms['Reference'], sms['Parts'], sms['Part'], sms['Msg']) == (0x2A, 2, 1, "aa")
+
+
+def test_deliver_not_a_deliver():
+    assert decodeDeliver("0006" + "2A" + "0B913316325476F8" + "24401012345680" * 2 + "00") is None
+
+
+def test_status_report():
+    # SMS-STATUS-REPORT (06), TP-MR 0x2A, recipient +33612345678, TP-ST 00 delivered
+    report = decodeStatusReport("0006" + "2A" + "0B913316325476F8" + "24401012345680" + "24401012355680" + "00")
+    assert report == {'Reference': 0x2A, 'Number': "+33612345678", 'Timestamp': "42/04/01,21:43:65+08",
+                      'Discharge': "42/04/01,21:53:65+08", 'Status': 0}
+    assert decodeStatusReport("00040B913316325476F8000024401012345680024F60") is None
+
+
+def test_concatenated_gsm7_header_and_fill_bit():
+    pdus = encodeSubmit("+33612345678", "a" * 200, reference=0x2A)
+    assert len(pdus) == 2
+    first, length, user_data = submitFields(pdus[0][1])
+    assert first == 0x41                                    # SMS-SUBMIT with user data header
+    assert length == 7 + PDU_GSM7_PART                      # 6 octets of header take 7 septets
+    assert user_data[:8] == bytes.fromhex("0500032A0201C2E1")
+    first, length, user_data = submitFields(pdus[1][1])
+    assert (length, user_data[:6]) == (7 + 200 - PDU_GSM7_PART, bytes.fromhex("0500032A0202"))
+
+
+def test_concatenated_gsm7_escape_not_split():
+    # '€' is 1B 65: its escape would be the last septet of part 1, it starts part 2
+    text = "a" * (PDU_GSM7_PART - 1) + "€" + "b" * 10
+    pdus = encodeSubmit("+33612345678", text, reference=1)
+    lengths = [submitFields(pdu)[1] - 7 for length, pdu in pdus]
+    assert lengths == [PDU_GSM7_PART - 1, 2 + 10]
+
+
+def test_concatenated_ucs2_surrogate_not_split():
+    # U+1F600 is D83D DE00: the pair would straddle the end of part 1 (134 octets), it starts part 2
+    text = "ж" * 66 + "\U0001F600" + "ж" * 10
+    pdus = encodeSubmit("+33612345678", text, reference=7)
+    parts = []
+    for length, pdu in pdus:
+        first, length, user_data = submitFields(pdu)
+        assert user_data[:5] == bytes.fromhex("0500030702")
+        parts.append(user_data[6:length].decode('utf-16-be'))
+    assert len(parts[0].encode('utf-16-be')) == 132 <= PDU_UCS2_PART
+    assert parts == ["ж" * 66, "\U0001F600" + "ж" * 10]
+
+
+def test_parts_joined_in_order():
+    parts = pdu_parts()
+    second = {'Number': "+33612345678", 'Reference': 9, 'Parts': 2, 'Part': 2, 'Msg': "world"}
+    first = dict(second, Part=1, Msg="hello ")
+    assert parts.add(second) is None
+    assert parts.add(first)['Msg'] == "hello world"
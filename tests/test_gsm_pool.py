@@ -0,0 +1,115 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024  Helios  helios14_75@hotmail.fr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# Pool of modems without devices: journal replay into the send queues, failover between modems
+#   python3 -m pytest tests
+
+import os
+import sys
+import time
+import logging
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from gsm_pool import gsm_pool           # noqa: E402
+from gsm import gsm                     # noqa: E402
+from gsm_journal import gsm_journal     # noqa: E402
+
+
+class client:
+    # MQTT stand-in, status messages dropped
+    on_publish = None
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        pass
+
+
+def pool(devices="/dev/null", **options):
+    gateway = gsm_pool(logging.CRITICAL, "modem", devices, "0000", "*", "sms_received", "sms_status", client(),
+                       telemetry=0, trace=0, **options)
+    for modem in gateway.Modems:
+        modem.Ready = True
+        modem.DeviceUp.set()
+    return gateway
+
+
+def test_journal_replay_past_queue_bound(tmp_path):
+    # sms accepted by the previous run are all queued again and stay journaled until sent
+    path = str(tmp_path / "journal.db")
+    journal = gsm_journal(path, flush=0.01)
+    for i in range(5):
+        journal.addOutbox("sms-%d" % i, "+33611111111", "text %d" % i)
+    journal.close()
+    gateway = pool(journal=path, queue_size=2)
+    gateway.replaySms()
+    modem = gateway.Modems[0]
+    assert [sms[1] for sms in modem.SendQueue.drain()] == ["text %d" % i for i in range(5)]
+    gateway.Journal.flush()
+    assert len(gateway.Journal.outbox()) == 5
+    # new requests are still bounded
+    assert gateway.queueSms("+33622222222", "a") and gateway.queueSms("+33622222222", "b")
+    assert not gateway.queueSms("+33622222222", "c")
+    gateway.Journal.close()
+
+
+def queued(modem):
+    return [sms[1] for sms in modem.SendQueue.drain()]
+
+
+def test_least_queued_modem():
+    gateway = pool("/dev/null,/dev/null")
+    first, second = gateway.Modems
+    first.queueSms("+33611111111", "early")
+    for text in ("a", "b", "c"):
+        assert gateway.queueSms("+33622222222", text)
+    assert queued(first) == ["early", "b"] and queued(second) == ["a", "c"]
+
+
+def test_round_robin():
+    gateway = pool("/dev/null,/dev/null,/dev/null", schedule="round")
+    for text in "abcdef":
+        gateway.queueSms("+33622222222", text)
+    assert sorted(queued(modem) for modem in gateway.Modems) == [["a", "d"], ["b", "e"], ["c", "f"]]
+
+
+def test_unhealthy_modem_avoided():
+    gateway = pool("/dev/null,/dev/null")
+    first, second = gateway.Modems
+    first.DeviceUp.clear()
+    assert gateway.selectModem() is second
+    second.Ready = False
+    assert gateway.selectModem() is first       # the only one left
+    first.Ready = False
+    assert gateway.selectModem() is None and not gateway.queueSms("+33622222222", "a")
+
+
+def test_failover_moves_waiting_sms():
+    gateway = pool("/dev/null,/dev/null")
+    first, second = gateway.Modems
+    assert first.SendFailover == gateway.failover
+    for text in ("b", "c"):
+        first.queueSms("+33611111111", text)
+    first.SendFailures, first.SendFailedAt = gsm.FailuresMax, time.monotonic()
+    assert gateway.failover(first, "+33611111111", "a", "sms-a")
+    assert queued(first) == [] and queued(second) == ["a", "b", "c"]
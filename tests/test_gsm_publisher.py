@@ -0,0 +1,144 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024  Helios  helios14_75@hotmail.fr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# Publish stage of received sms: window of unacknowledged messages, done() on acknowledgement, retries
+#   python3 -m pytest tests
+
+import os
+import sys
+import time
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import paho.mqtt.client as mqtt             # noqa: E402
+from gsm_publisher import gsm_publisher     # noqa: E402
+
+
+class publish_info:
+    def __init__(self, rc, mid):
+        self.rc = rc
+        self.mid = mid
+
+
+class client:
+    # paho stand-in: messages kept with their mid, acknowledged by the test or at once (ack_now)
+    def __init__(self, rc=mqtt.MQTT_ERR_SUCCESS, ack_now=False):
+        self.Rc = rc
+        self.AckNow = ack_now
+        self.Messages = []
+        self.Sem = threading.Lock()
+        self.on_publish = None
+
+    def publish(self, topic, payload, qos=0):
+        with self.Sem:
+            self.Messages.append((topic, payload, qos))
+            mid = len(self.Messages)
+        if self.AckNow:
+            self.on_publish(self, None, mid)
+        return publish_info(self.Rc, mid)
+
+    def ack(self, mid):
+        self.on_publish(self, None, mid)
+
+
+def waitFor(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_window_of_unacknowledged_messages():
+    mqtt_client = client()
+    publisher = gsm_publisher(mqtt_client, qos=1, window=2)
+    done = []
+    for i in range(5):
+        publisher.put("sms_received", str(i), lambda i=i: done.append(i))
+    publisher.start()
+    waitFor(lambda: publisher.Published == 2)
+    time.sleep(0.05)
+    assert publisher.Published == 2 and done == []
+    mqtt_client.ack(2)
+    waitFor(lambda: publisher.Published == 3)
+    assert done == [1]
+    for mid in (1, 3, 4, 5):
+        waitFor(lambda: len(mqtt_client.Messages) >= mid)
+        mqtt_client.ack(mid)
+    publisher.stop()
+    assert sorted(done) == [0, 1, 2, 3, 4]
+    assert [payload for topic, payload, qos in mqtt_client.Messages] == ["0", "1", "2", "3", "4"]
+    assert all(qos == 1 for topic, payload, qos in mqtt_client.Messages)
+
+
+def test_acknowledged_before_publish_returns():
+    # QoS 0: paho calls on_publish as soon as the message is written, before publish() returns
+    mqtt_client = client(ack_now=True)
+    publisher = gsm_publisher(mqtt_client, qos=0)
+    done = []
+    publisher.start()
+    for i in range(3):
+        publisher.put("sms_received", str(i), lambda i=i: done.append(i))
+    waitFor(lambda: len(done) == 3)
+    assert publisher.idle() and not publisher.Unacked
+    publisher.stop()
+    assert done == [0, 1, 2]
+
+
+def test_not_connected(monkeypatch):
+    # QoS 0 message not taken is published again, QoS 1 is kept by the client until connected
+    monkeypatch.setattr(gsm_publisher, "RetryDelay", 0.01)
+    mqtt_client = client(rc=mqtt.MQTT_ERR_NO_CONN)
+    publisher = gsm_publisher(mqtt_client, qos=0)
+    publisher.put("sms_received", "lost", lambda: None)
+    publisher.start()
+    waitFor(lambda: len(mqtt_client.Messages) >= 3)
+    assert publisher.Published == 0
+    mqtt_client.Rc, mqtt_client.AckNow = mqtt.MQTT_ERR_SUCCESS, True
+    waitFor(publisher.idle)
+    publisher.stop()
+
+    mqtt_client = client(rc=mqtt.MQTT_ERR_NO_CONN)
+    publisher = gsm_publisher(mqtt_client, qos=1)
+    publisher.put("sms_received", "kept", lambda: None)
+    publisher.start()
+    waitFor(lambda: publisher.Published == 1)
+    assert len(mqtt_client.Messages) == 1 and list(publisher.Unacked) == [1]
+    mqtt_client.ack(1)
+    waitFor(publisher.idle)
+    publisher.stop()
+
+
+def test_full_and_stop_timeout(monkeypatch):
+    monkeypatch.setattr(gsm_publisher, "DrainTimeout", 0.1)
+    publisher = gsm_publisher(client(), qos=1, window=1, size=2)
+    publisher.put("sms_received", "0", lambda: None)
+    assert not publisher.full()
+    publisher.put("sms_received", "1", lambda: None)
+    assert publisher.full()
+    publisher.start()
+    started = time.monotonic()
+    publisher.stop()                    # never acknowledged: given up after DrainTimeout
+    assert time.monotonic() - started < 1.0
+    assert not publisher.idle()
@@ -0,0 +1,70 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024  Helios  helios14_75@hotmail.fr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# Flight recorder and serial capture, pin codes kept out of what they publish
+#   python3 -m pytest tests
+
+import os
+import sys
+import logging
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from gsm import gsm                     # noqa: E402
+from gsm_recorder import gsm_recorder   # noqa: E402
+from gsm_capture import gsm_capture     # noqa: E402
+
+
+def test_pin_masked_in_dump():
+    recorder = gsm_recorder("modem1", 4)
+    for frame in (b'AT+CPIN="1234"\r', b'AT+CLCK="SC",1,"1234"\r', b'AT+CMGR=1234\r'):
+        recorder.record(gsm_recorder.TX, frame)
+    lines = recorder.lines()
+    assert not any("1234\"" in line for line in lines)
+    assert lines[0].endswith('tx  AT+CPIN="****"\\r')
+    assert lines[1].endswith('tx  AT+CLCK="SC",1,"****"\\r')
+    assert lines[2].endswith('tx  AT+CMGR=1234\\r')
+
+
+def test_pin_masked_in_capture(tmp_path):
+    path = str(tmp_path / "capture.txt")
+    capture = gsm_capture(path)
+    capture.record("tx", b'AT+CPIN="87654321"\r')
+    capture.record("rx", b'\r\nAT+CPIN="87654321"\r\r\nOK\r\n')
+    capture.close()
+    chunks = [data for seconds, direction, data in gsm_capture.read(path)]
+    assert chunks == [b'AT+CPIN="****"\r', b'\r\nAT+CPIN="****"\r\r\nOK\r\n']
+
+
+def test_pin_masked_in_failed_command_log(caplog):
+    # AT+CPIN answered by +CME ERROR: the error log shows the command without the pin
+    modem = gsm(logging.CRITICAL, "modem1", "modem", "/dev/null", "1234", "*", "sms_received", None,
+                telemetry=0, trace=0)
+    modem.writeData = lambda frame: None
+    threading.Timer(0.05, modem.feedGsmIoData, (b'\r\n+CME ERROR: 16\r\n',)).start()
+    with caplog.at_level(logging.ERROR):
+        command = modem.writeCommandAndWaitOK(bytes(modem.ATCPIN, 'ascii'), timeout=2)
+    assert command.Error == "+CME ERROR: 16"
+    assert 'AT+CPIN="****" failed' in caplog.text and "1234" not in caplog.text
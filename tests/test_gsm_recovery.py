@@ -0,0 +1,102 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024  Helios  helios14_75@hotmail.fr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# Recovery of a lost dongle, simulated modem unplugged and plugged back (tools/fake_modem.py), both engines
+#   python3 -m pytest tests
+
+import os
+import sys
+import time
+import logging
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools'))
+
+from gsm import gsm                 # noqa: E402
+from gsm_async import gsm_async     # noqa: E402
+from fake_modem import fake_modem   # noqa: E402
+
+
+class client:
+    # MQTT stand-in, published messages dropped
+    on_publish = None
+
+    class info:
+        rc = 0
+        mid = 1
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        return client.info()
+
+
+def waitFor(condition, seconds=10.0):
+    limit = time.monotonic() + seconds
+    while not condition() and time.monotonic() < limit:
+        time.sleep(0.05)
+    return condition()
+
+
+@pytest.fixture(autouse=True)
+def fastRecovery(monkeypatch):
+    monkeypatch.setattr(gsm, "SupervisorPoll", 0.1)
+    monkeypatch.setattr(gsm, "RecoverDelay", 0.1)
+
+
+@pytest.mark.parametrize("engine", [gsm, gsm_async])
+def test_sms_queued_while_unplugged_sent_after_recovery(tmp_path, engine):
+    link = str(tmp_path / "ttyUSB-by-id")
+    modem = fake_modem(link=link)
+    device = engine(logging.CRITICAL, "modem1", "modem", link, "0000", "*", "sms_received", client(),
+                    telemetry=0, trace=0)
+    try:
+        device.start()
+        assert device.Ready
+        modem.unplug()
+        assert waitFor(lambda: not device.DeviceUp.is_set())
+        assert device.queueSms("+33611111111", "queued while unplugged")
+        modem.plug()
+        assert waitFor(lambda: device.Recoveries == 1)
+        assert waitFor(lambda: modem.Sent == [("+33611111111", "queued while unplugged")])
+    finally:
+        device.stop()
+        modem.close()
+
+
+@pytest.mark.parametrize("engine", [gsm, gsm_async])
+def test_stop_while_recovering(tmp_path, engine):
+    link = str(tmp_path / "ttyUSB-by-id")
+    modem = fake_modem(link=link)
+    device = engine(logging.CRITICAL, "modem1", "modem", link, "0000", "*", "sms_received", client(),
+                    telemetry=0, trace=0)
+    try:
+        device.start()
+        modem.unplug()
+        assert waitFor(lambda: not device.DeviceUp.is_set())
+        started = time.monotonic()
+        device.stop()
+        assert time.monotonic() - started < 2.0
+    finally:
+        modem.close()
@@ -0,0 +1,69 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024  Helios  helios14_75@hotmail.fr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# Serial transcripts of tools/corpus replayed into the reader (tools/replay_serial.py): decoded events checked
+# against the expected ones, as captured and with reads split at random boundaries
+#   python3 -m pytest tests
+
+import os
+import sys
+import glob
+import json
+import random
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools'))
+
+from gsm_capture import gsm_capture                                     # noqa: E402
+from replay_serial import CORPUS, replay, rechunk, firstDifference      # noqa: E402
+
+TRANSCRIPTS = sorted(glob.glob(os.path.join(CORPUS, "*.txt")))
+
+
+def expected(transcript):
+    with open(os.path.splitext(transcript)[0] + ".json", encoding="utf-8") as events:
+        return json.load(events)
+
+
+def test_corpus_not_empty():
+    assert TRANSCRIPTS
+
+
+@pytest.mark.parametrize("transcript", TRANSCRIPTS, ids=os.path.basename)
+def test_replay(transcript):
+    wanted = expected(transcript)
+    events = json.loads(json.dumps(replay(list(gsm_capture.read(transcript)))))     # tuples as lists
+    assert events == wanted, firstDifference(events, wanted)
+
+
+@pytest.mark.parametrize("transcript", TRANSCRIPTS, ids=os.path.basename)
+def test_replay_fuzzed(transcript):
+    wanted = expected(transcript)
+    chunks = list(gsm_capture.read(transcript))
+    rng = random.Random(1)
+    for run in range(10):
+        events = json.loads(json.dumps(replay(rechunk(chunks, rng))))
+        assert events == wanted, f"fuzz run {run}: {firstDifference(events, wanted)}"
@@ -0,0 +1,102 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024  Helios  helios14_75@hotmail.fr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# Send queue: token bucket timing, rate limits, priorities and coalescing
+#   python3 -m pytest tests
+
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from queue import Empty, Full                           # noqa: E402
+from gsm_scheduler import token_bucket, gsm_scheduler   # noqa: E402
+
+
+def test_token_bucket_burst_then_rate():
+    # 60 per minute: one token a second, bursts of 10
+    bucket = token_bucket(60)
+    now = bucket.Updated
+    for i in range(10):
+        assert bucket.delay(now) == 0.0
+        bucket.take()
+    assert bucket.delay(now) == pytest.approx(1.0)
+    assert bucket.delay(now + 0.25) == pytest.approx(0.75)
+    assert bucket.delay(now + 1.0) == 0.0
+    bucket.take()
+    assert bucket.delay(now + 1.5) == pytest.approx(0.5)
+
+
+def test_token_bucket_slow_rate_and_cap():
+    # 6 per minute: burst of one sms, then one every 10 seconds, tokens capped when idle
+    bucket = token_bucket(6)
+    now = bucket.Updated
+    bucket.take()
+    assert bucket.delay(now + 4.0) == pytest.approx(6.0)
+    assert bucket.delay(now + 10.0) == 0.0
+    assert bucket.delay(now + 3600.0) == 0.0
+    bucket.take()
+    assert bucket.delay(now + 3600.0) == pytest.approx(10.0)
+
+
+def test_modem_rate_limit():
+    queue = gsm_scheduler(rate=6)
+    queue.put("+33611111111", "one")
+    queue.put("+33622222222", "two")
+    assert queue.get_nowait()[1] == "one"
+    with pytest.raises(Empty):
+        queue.get_nowait()
+    assert queue.nextDelay() == pytest.approx(10.0, abs=0.1)
+
+
+def test_number_rate_limit_lets_others_pass():
+    queue = gsm_scheduler(rate_number=6)
+    queue.put("+33611111111", "one")
+    queue.put("+33611111111", "again")
+    queue.put("+33622222222", "other")
+    assert [queue.get_nowait()[1] for i in range(2)] == ["one", "other"]
+    with pytest.raises(Empty):
+        queue.get_nowait()
+
+
+def test_priorities_and_requeue():
+    queue = gsm_scheduler()
+    queue.put("+33611111111", "low", priority="low")
+    queue.put("+33611111111", "normal")
+    queue.put("+33611111111", "high", priority="high")
+    queue.put("+33611111111", "unknown", priority="urgent")
+    assert queue.get_nowait()[1] == "high"
+    queue.requeue("+33611111111", "back", priority="normal")
+    assert [queue.get_nowait()[1] for i in range(4)] == ["back", "normal", "unknown", "low"]
+
+
+def test_coalesce_and_full():
+    queue = gsm_scheduler(size=2, coalesce=60)
+    assert queue.put("+33611111111", "alarm")
+    assert not queue.put("+33611111111", "alarm")
+    assert queue.put(["+33611111111", "+33622222222"], "alarm")
+    with pytest.raises(Full):
+        queue.put("+33633333333", "alarm")
+    assert queue.qsize() == 2 and queue.Coalesced == 1
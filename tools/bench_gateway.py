@@ -0,0 +1,224 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024  Helios  helios14_75@hotmail.fr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# Gateway benchmark on the simulated modem, with an in-process MQTT stand-in
+#   python3 tools/bench_gateway.py [--engine thread|asyncio] [--pdu] [--latency 0.005] [--count 200] [--journal file]
+#                                  [--metrics] [--api]
+# CPU is the process time of the whole benchmark, simulated modem included
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import statistics
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from gsm_pool import gsm_pool                           # noqa: E402
+from fake_modem import fake_modem                       # noqa: E402
+from fake_hilink import fake_hilink                     # noqa: E402
+
+NUMBER = "+33612345678"
+
+
+class bench_mqtt:
+    # records publishes as paho would send them, on_message is fed by hand,
+    # on_publish is called as the broker acknowledges them, after rtt seconds for QoS 1/2
+
+    class message:
+        def __init__(self, topic, payload):
+            self.topic = topic
+            self.payload = payload
+
+    class info:
+        def __init__(self, mid):
+            self.mid = mid
+            self.rc = 0
+
+    def __init__(self, rtt: float = 0.0):
+        self.Published = {}
+        self.Sem = threading.Condition()
+        self.Rtt = rtt
+        self.Mid = 0
+        self.on_publish = None
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        with self.Sem:
+            self.Mid += 1
+            mid = self.Mid
+            self.Published.setdefault(topic, []).append((time.monotonic(), payload))
+            self.Sem.notify_all()
+        if self.on_publish is not None:
+            if qos and self.Rtt:
+                threading.Timer(self.Rtt, self.on_publish, (self, None, mid)).start()
+            else:
+                self.on_publish(self, None, mid)
+        return bench_mqtt.info(mid)
+
+    def subscribe(self, topic, qos=0):
+        pass
+
+    def count(self, topic):
+        with self.Sem:
+            return len(self.Published.get(topic, []))
+
+    def waitCount(self, topic, count, timeout=60.0):
+        deadline = time.monotonic() + timeout
+        with self.Sem:
+            while len(self.Published.get(topic, [])) < count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.Sem.wait(remaining)
+        return True
+
+    def last(self, topic):
+        with self.Sem:
+            return self.Published[topic][-1][0]
+
+
+def waitFor(predicate, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.001)
+    return True
+
+
+def report(name, count, elapsed, cpu):
+    print(f"{name:<10} {count:>6} sms {elapsed:8.3f} s {count / elapsed:9.1f} sms/s {cpu / count * 1000:8.3f} ms cpu/sms")
+
+
+def benchSend(gateway, client, modem, count):
+    # MQTT payloads to the queue, until the gateway has sent or given up on them all
+    def done():
+        return sum(sender.SendCount + sender.SendFailed for sender in gateway.Modems)
+    sent = done()
+    start, cpu = time.monotonic(), time.process_time()
+    for i in range(count):
+        message = json.loads(json.dumps({"to": NUMBER, "txt": "Benchmark message %d" % i}))
+        while not gateway.queueSms(message["to"], message["txt"]):
+            time.sleep(0.001)       # queue full, as a publisher retrying
+    waitFor(lambda: done() >= sent + count)
+    report("send", count, time.monotonic() - start, time.process_time() - cpu)
+    print(f"{'':<10} {sum(sender.SendFailed for sender in gateway.Modems)} failed")
+
+
+def benchInbound(gateway, client, modem, count):
+    # one sms at a time, +CMTI to publish on receive topic
+    latencies = []
+    cpu = time.process_time()
+    start = time.monotonic()
+    for i in range(count):
+        received = client.count("sms_received")
+        delivered = time.monotonic()
+        modem.deliver(NUMBER, "Inbound message %d" % i)
+        client.waitCount("sms_received", received + 1)
+        latencies.append(client.last("sms_received") - delivered)
+    report("inbound", count, time.monotonic() - start, time.process_time() - cpu)
+    latencies.sort()
+    print(f"{'':<10} latency median {statistics.median(latencies) * 1000:.2f} ms, "
+          f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.2f} ms, max {latencies[-1] * 1000:.2f} ms")
+
+
+def benchBurst(gateway, client, modem, count):
+    # many sms announced at once, as after a network outage
+    received = client.count("sms_received")
+    start, cpu = time.monotonic(), time.process_time()
+    for i in range(count):
+        modem.deliver(NUMBER, "Burst message %d" % i)
+    client.waitCount("sms_received", received + count)
+    report("burst", count, time.monotonic() - start, time.process_time() - cpu)
+
+
+def printMetrics(metrics):
+    # mean and total time per AT command, and time the modem was held by an exchange
+    totals = {}
+    for name, labels, value, family, metric_type in metrics.collect():
+        if name.endswith(("_sum", "_count")):
+            labels = dict(labels)
+            key = labels.get("command", family)
+            totals.setdefault(key, {})[name.rsplit('_', 1)[1]] = value
+    for key, total in sorted(totals.items(), key=lambda item: -item[1]["sum"]):
+        print(f"{key:<24} {total['count']:>6} x {total['sum'] / total['count'] * 1000:8.3f} ms = {total['sum']:8.3f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SMS gateway benchmark on a simulated modem")
+    parser.add_argument("--engine", dest="engine", help="thread or asyncio", default="thread")
+    parser.add_argument("--pdu", dest="pdu", help="sms in PDU mode", action="store_true")
+    parser.add_argument("--latency", dest="latency", help="modem seconds before each response", default="0.002")
+    parser.add_argument("--count", dest="count", help="sms per scenario", default="200")
+    parser.add_argument("--workers", dest="workers", help="sender workers", default="1")
+    parser.add_argument("--journal", dest="journal", help="journal file, none if empty", default="")
+    parser.add_argument("--metrics", dest="metrics", help="print time per AT command", action="store_true")
+    parser.add_argument("--api", dest="api", help="HiLink API instead of AT commands", action="store_true")
+    parser.add_argument("--warm", dest="warm", help="warm start, modem state queried instead of reset", action="store_true")
+    parser.add_argument("--rtt", dest="rtt", help="seconds before the broker acknowledges a received sms", default="0")
+    parser.add_argument("--notify", dest="notify", help="notifications on a second tty", action="store_true")
+    parser.add_argument("--rssi", dest="rssi", help="seconds between two ^RSSI reports of the modem, 0 for none", default="0")
+    parser.add_argument("--trace", dest="trace", help="serial lines kept by the flight recorder, 0 for none", default="256")
+    parser.add_argument("--error", dest="error", help="probability of +CMS ERROR on AT+CMGS", default="0")
+    options = parser.parse_args()
+    count = int(options.count)
+
+    if options.api:
+        # inbox is polled, no +CMTI
+        modem = fake_hilink(latency=float(options.latency))
+        device, mode, sweep = modem.Url, "api", 0.1
+    else:
+        modem = fake_modem(float(options.latency), errors={"AT+CMGS": float(options.error)},
+                           pcui=options.notify, rssi=float(options.rssi))
+        device, mode, sweep = modem.Device, "modem", 3600
+    client = bench_mqtt(float(options.rtt))
+    gateway = gsm_pool(logging.WARNING, mode, device, "0000", NUMBER, "sms_received", "sms_status", client,
+                       sweep=sweep, queue_size=count, workers=int(options.workers), pdu=options.pdu,
+                       engine=options.engine, journal=options.journal, warm=options.warm,
+                       notify=modem.PcuiDevice if options.notify else "",
+                       metrics_topic="bench_stats" if options.metrics else "", trace=int(options.trace))
+    start = time.monotonic()
+    gateway.start()
+    print(f"{options.engine} engine, {mode} {'PDU' if options.pdu else 'text'} mode, {device}, "
+          f"started in {time.monotonic() - start:.3f} s")
+    try:
+        benchSend(gateway, client, modem, count)
+        benchInbound(gateway, client, modem, min(count, 100))
+        benchBurst(gateway, client, modem, count)
+        if options.api:
+            print(f"{modem.Requests} HTTP requests, {modem.Connections} connection(s), {modem.TokenRequests} token(s)")
+        else:
+            print(f"{modem.Commands} AT commands")
+        if options.metrics:
+            printMetrics(gateway.Metrics)
+    finally:
+        gateway.stop()
+        modem.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024  Helios  helios14_75@hotmail.fr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# Micro-benchmark of GSM-7 codec against the former if/elif implementation
+#   python3 tools/bench_gsm7.py [length]
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from gsm_codec import sms_alpha, encodeGSM7, decodeGSM7, lengthGSM7     # noqa: E402
+
+
+def legacyDecodeGSM7toUTF8(bytes_message):
+    result = []
+    for b in bytes_message:         # b is code value of character
+        result.append(sms_alpha[b])
+    return ''.join(result)
+
+
+def legacyEncodeUTF8toGSM7(message):
+    # UTF-8 double byte character will be replaced by specific
+    # GSM alphabet code
+    message_list = list(bytes(message, 'utf-8'))
+    waitCode195 = False
+    waitCode194 = False
+    waitCode206 = False
+    result = bytes("", 'utf-8')
+    for c in message_list:
+        if waitCode195 is True:
+            waitCode195 = False
+            if c == 132:
+                result += b'\x5b'   # --> Ä
+            elif c == 133:
+                result += b'\x0e'   # --> Å
+            elif c == 135:
+                result += b'\x09'   # --> Ç
+            elif c == 137:
+                result += b'\x1f'   # --> É
+            elif c == 145:
+                result += b'\x5d'   # --> Ñ
+            elif c == 150:
+                result += b'\x5c'   # --> Ö
+            elif c == 152:
+                result += b'\x0b'   # --> Ø
+            elif c == 156:
+                result += b'\x5e'   # --> Ü
+            elif c == 159:
+                result += b'\x1e'   # --> ß
+            elif c == 160:
+                result += b'\x7f'   # --> à
+            elif c == 164:
+                result += b'\x7b'   # --> ä
+            elif c == 165:
+                result += b'\x0f'   # --> å
+            elif c == 166:
+                result += b'\x1d'   # --> æ
+            elif c == 167:
+                result += b'\x63'   # --> c pour ç
+            elif c == 168:
+                result += b'\x04'   # --> è
+            elif c == 169:
+                result += b'\x05'   # --> é
+            elif c == 172:
+                result += b'\x07'   # --> ì
+            elif c == 177:
+                result += b'\x7d'   # --> ñ
+            elif c == 178:
+                result += b'\x08'   # --> ò
+            elif c == 182:
+                result += b'\x7c'   # --> ö
+            elif c == 184:
+                result += b'\x0c'   # --> ø
+            elif c == 185:
+                result += b'\x06'   # --> ù
+            else:
+                pass
+        elif waitCode194 is True:
+            waitCode194 = False
+            if c == 161:
+                result += b'\x40'  # --> ¡
+            elif c == 163:
+                result += b'\x01'  # --> £
+            elif c == 164:
+                result += b'\x24'  # --> ¤
+            elif c == 165:
+                result += b'\x03'  # --> §
+            elif c == 167:
+                result += b'\x5f'  # --> §
+            elif c == 191:
+                result += b'\x60'  # --> ¿
+            else:
+                pass
+        elif waitCode206 is True:
+            waitCode206 = False
+            if c == 147:
+                result += b'\x13'  # --> Γ
+            elif c == 148:
+                result += b'\x10'  # --> Δ
+            elif c == 152:
+                result += b'\x19'  # --> Θ
+            elif c == 155:
+                result += b'\x14'  # --> Λ
+            elif c == 158:
+                result += b'\x1a'  # --> Ξ
+            elif c == 160:
+                result += b'\x16'  # --> Π
+            elif c == 163:
+                result += b'\x18'  # --> Σ
+            elif c == 166:
+                result += b'\x12'  # --> Φ
+            elif c == 168:
+                result += b'\x17'  # --> Ψ
+            elif c == 169:
+                result += b'\x15'  # --> Ω
+            else:
+                pass
+        else:
+            if c == 195:
+                waitCode195 = True
+            elif c == 194:
+                waitCode194 = True
+            elif c == 206:
+                waitCode206 = True
+            else:
+                if c == 64:
+                    result += b'\x00'   # --> @
+                elif c == 36:
+                    result += b'\x02'   # --> $
+                elif c == 95:
+                    result += b'\x11'   # --> _
+                else:
+                    result += bytes([c])
+    sms = result + b'\x1A'
+    return sms
+
+
+def bench(name, function, argument, number):
+    seconds = timeit.timeit(lambda: function(argument), number=number)
+    print(f"{name:<28}{seconds / number * 1e6:12.1f} us")
+    return seconds
+
+
+def main():
+    length = int(sys.argv[1]) if len(sys.argv) > 1 else 1600
+    sample = "Alerte: température élevée à 35°C, vérifiez ÄÖÑÜ ß Δ Σ £ $ @ "
+    text = (sample * (length // len(sample) + 1))[:length]
+    gsm7 = encodeGSM7(text)
+    number = max(1, 200000 // length)
+    print(f"text of {length} characters, {number} runs")
+    old = bench("legacy encode", legacyEncodeUTF8toGSM7, text, number)
+    new = bench("table encode", encodeGSM7, text, number)
+    print(f"{'':<28}{old / new:12.1f} x")
+    old = bench("legacy decode", legacyDecodeGSM7toUTF8, gsm7, number)
+    new = bench("table decode", decodeGSM7, gsm7, number)
+    print(f"{'':<28}{old / new:12.1f} x")
+    bench("length check", lengthGSM7, text, number)
+    assert legacyDecodeGSM7toUTF8(gsm7) == decodeGSM7(gsm7)
+    assert legacyDecodeGSM7toUTF8(bytes(range(0x1b))) == sms_alpha[:0x1b]
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024  Helios  helios14_75@hotmail.fr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# Simulated Huawei HiLink dongle HTTP API, for tests and benchmarks of --mode api without a dongle
+#   python3 tools/fake_hilink.py [--port 8080] [--rotate]      then sms_manager.py --mode api -d http://127.0.0.1:8080
+
+import time
+import uuid
+import argparse
+import threading
+import xmltodict
+
+from http.server    import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class fake_hilink:
+    # SesTokInfo, sms-count, sms-list, delete-sms, send-sms and device/signal,
+    # session token checked on POST, rotated on each POST when rotate is set
+
+    def __init__(self, port: int = 0, rotate: bool = False, latency: float = 0.0):
+        self.Rotate = rotate
+        self.Latency = latency
+        self.Sem = threading.Lock()
+        self.Inbox = {}                 # index -> message dict
+        self.NextIndex = 40000
+        self.Sent = []                  # (number, text)
+        self.Tokens = set()
+        self.Session = uuid.uuid4().hex
+        self.Requests = 0
+        self.TokenRequests = 0
+        self.Connections = 0
+        hilink = self
+
+        class handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"       # keep-alive
+            disable_nagle_algorithm = True      # headers and body are two writes
+
+            def setup(self):
+                BaseHTTPRequestHandler.setup(self)
+                with hilink.Sem:
+                    hilink.Connections += 1
+
+            def do_GET(self):
+                self.reply(hilink.get(self.path, self.headers))
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                self.reply(hilink.post(self.path, self.headers, body))
+
+            def reply(self, answer):
+                content, token = answer
+                body = xmltodict.unparse(content).encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html")
+                self.send_header("Content-Length", str(len(body)))
+                if token:
+                    self.send_header("__RequestVerificationToken", token)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.Server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self.Server.daemon_threads = True
+        self.Url = "http://127.0.0.1:%d" % self.Server.server_address[1]
+        threading.Thread(target=self.Server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.Server.shutdown()
+        self.Server.server_close()
+
+    def deliver(self, number: str, text: str):
+        with self.Sem:
+            self.NextIndex += 1
+            self.Inbox[self.NextIndex] = {'Smstat': 0, 'Index': self.NextIndex, 'Phone': number, 'Content': text,
+                                          'Date': time.strftime("%Y-%m-%d %H:%M:%S"), 'Sca': '', 'SaveType': 4,
+                                          'Priority': 0, 'SmsType': 1}
+        return self.NextIndex
+
+    def newToken(self):
+        token = uuid.uuid4().hex
+        self.Tokens.add(token)
+        return token
+
+    @staticmethod
+    def error(code):
+        return {'error': {'code': code, 'message': ''}}, None
+
+    def get(self, path, headers):
+        if self.Latency:
+            time.sleep(self.Latency)
+        with self.Sem:
+            self.Requests += 1
+            if path == "/api/webserver/SesTokInfo":
+                self.TokenRequests += 1
+                return {'response': {'SesInfo': "SessionID="+self.Session, 'TokInfo': self.newToken()}}, None
+            if path == "/api/sms/sms-count":
+                unread = sum(1 for sms in self.Inbox.values() if sms['Smstat'] == 0)
+                return {'response': {'LocalUnread': unread, 'LocalInbox': len(self.Inbox), 'LocalOutbox': 0,
+                                     'LocalDraft': 0, 'LocalMax': 500}}, None
+            if path == "/api/device/signal":
+                return {'response': {'rssi': "-73dBm", 'rsrp': '', 'sinr': ''}}, None
+        return self.error(100002)
+
+    def post(self, path, headers, body):
+        if self.Latency:
+            time.sleep(self.Latency)
+        with self.Sem:
+            self.Requests += 1
+            token = headers.get("__RequestVerificationToken")
+            if token not in self.Tokens or "SessionID="+self.Session not in headers.get("Cookie", ""):
+                return self.error(125002)
+            next_token = None
+            if self.Rotate:
+                self.Tokens.discard(token)
+                next_token = self.newToken()
+            request = xmltodict.parse(body)['request']
+            if path == "/api/sms/sms-list":
+                page, count = int(request['PageIndex']), int(request['ReadCount'])
+                messages = sorted(self.Inbox.values(), key=lambda sms: (sms['Smstat'], sms['Index']))
+                messages = messages[(page - 1) * count:page * count]
+                return {'response': {'Count': len(messages), 'Messages': {'Message': messages}}}, next_token
+            if path == "/api/sms/delete-sms":
+                indexes = request['Index'] if isinstance(request['Index'], list) else [request['Index']]
+                for index in indexes:
+                    self.Inbox.pop(int(index), None)
+                return {'response': 'OK'}, next_token
+            if path == "/api/sms/send-sms":
+                phones = request['Phones']['Phone']
+                for phone in phones if isinstance(phones, list) else [phones]:
+                    self.Sent.append((phone, request['Content']))
+                return {'response': 'OK'}, next_token
+        return self.error(100002)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated HiLink dongle API")
+    parser.add_argument("--port", dest="port", help="HTTP port", default="8080")
+    parser.add_argument("--rotate", dest="rotate", help="new token after each POST", action="store_true")
+    options = parser.parse_args()
+    hilink = fake_hilink(int(options.port), options.rotate)
+    print(hilink.Url, flush=True)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        hilink.close()
+
+
+if __name__ == '__main__':
+    main()
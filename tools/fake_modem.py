@@ -0,0 +1,361 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024  Helios  helios14_75@hotmail.fr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# Simulated Huawei modem on a pseudo-terminal, for tests and benchmarks without a dongle
+#   python3 tools/fake_modem.py [--latency 0.01] [--pcui]      prints the tty to give to sms_manager.py -d
+#   (and the one to give to --notify-device)
+
+import os
+import sys
+import pty
+import tty
+import time
+import random
+import select
+import argparse
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from gsm_codec import encodeGSM7, decodeGSM7           # noqa: E402
+from gsm_pdu import encodeSubmit, decodeDeliver, encodeNumber   # noqa: E402
+
+CTRL_Z = 0x1a
+ESCAPE = 0x1b
+
+
+def submitToDeliver(pdu: str, timestamp: str = "42105121000040") -> str:
+    # SMS-SUBMIT pdu (as sent by gateway) turned into the SMS-DELIVER pdu the recipient gets
+    data = bytes.fromhex(pdu)
+    data = data[data[0] + 1:]                           # skip SMSC
+    first = data[0]
+    length = (data[2] + 1) // 2
+    address = data[2:4 + length]
+    pid, dcs = data[4 + length], data[5 + length]
+    vp = {0x10: 1, 0x08: 7, 0x18: 7}.get(first & 0x18, 0)   # validity period
+    user_data = data[6 + length + vp:]
+    deliver = bytes([0x00, first & 0x40]) + address + bytes([pid, dcs]) + bytes.fromhex(timestamp) + user_data
+    return deliver.hex().upper()
+
+
+class fake_modem:
+    # AT subset used by the gateway: ATZ ATE0/1 CPIN CMGF CNMI CSCS CPMS CLIP CSDH CMEE CSQ CREG
+    # CMGW/CMSS/CMGS CMGL/CMGR/CMGD CSMP, +CMTI when an sms is delivered, +CDS when a report is asked,
+    # CMGF? CNMI? CPMS? queries and command lines concatenated with ';'
+    # with pcui, a second tty gets the unsolicited result codes once AT^PORTSEL=1 is sent, as Huawei dongles
+
+    def __init__(self, latency: float = 0.0, latencies=None, errors=None, report_delay: float = 0.05,
+                 link: str = None, pcui: bool = False, rssi: float = 0):
+        self.Latency = latency                  # seconds before each response
+        self.Latencies = latencies or {}        # command prefix -> seconds, e.g. {'AT+CMGS': 0.5}
+        self.Errors = errors or {}              # command prefix -> probability to answer +CMS ERROR: 500
+        self.Link = link                        # symlink to the tty, as /dev/serial/by-id/...
+        self.Master = self.Slave = None
+        self.Pcui = pcui                        # second tty for unsolicited result codes
+        self.PcuiMaster = self.PcuiSlave = None
+        self.PcuiDevice = None
+        self.Rssi = rssi                        # seconds between two ^RSSI reports, 0 for none
+        self.Sem = threading.Lock()
+        self.Storage = {}                       # index -> [status, number, text, timestamp]
+        self.Sent = []                          # (number, text) sent on network
+        self.Commands = 0
+        self.Echo = True
+        self.Pdu = False
+        self.Reference = 0
+        self.Smp = 17                           # first octet of text mode sms, 0x20 asks for a status report
+        self.Cnmi = "0,0,0,0,0"                 # AT+CNMI setting, <ds> 1 for +CDS
+        self.Cpms = "SM"                        # storage
+        self.Creg = 1                           # registration status, 1 home, 3 denied
+        self.ReportDelay = report_delay
+        self.Prompt = None                      # command waiting for text after '> '
+        self.plug()
+
+    def plug(self):
+        # dongle (back) on a new tty, settings reset, storage kept
+        self.Master, self.Slave = pty.openpty()
+        tty.setraw(self.Slave)
+        self.Device = os.ttyname(self.Slave)
+        if self.Pcui:
+            self.PcuiMaster, self.PcuiSlave = pty.openpty()
+            tty.setraw(self.PcuiSlave)
+            self.PcuiDevice = os.ttyname(self.PcuiSlave)
+        self.Portsel = 0
+        if self.Link is not None:
+            if os.path.lexists(self.Link):
+                os.remove(self.Link)
+            os.symlink(self.Device, self.Link)
+        self.Echo = True
+        self.Pdu = False
+        self.Cnmi = "0,0,0,0,0"
+        self.Prompt = None
+        self.Buffer = b''
+        self.Running = True
+        self.Thread = threading.Thread(target=self.run, daemon=True)
+        self.Thread.start()
+
+    def unplug(self):
+        # dongle reset or removed: its tty and link disappear, reads of the gateway fail
+        if self.Master is None:
+            return
+        self.Running = False
+        self.Thread.join()
+        if self.Link is not None and os.path.lexists(self.Link):
+            os.remove(self.Link)
+        os.close(self.Master)
+        os.close(self.Slave)
+        self.Master = self.Slave = None
+        if self.PcuiMaster is not None:
+            os.close(self.PcuiMaster)
+            os.close(self.PcuiSlave)
+            self.PcuiMaster = self.PcuiSlave = None
+
+    def close(self):
+        self.unplug()
+
+    def write(self, data: bytes):
+        try:
+            os.write(self.Master, data)
+        except (OSError, TypeError):
+            pass                                # unplugged
+
+    def notify(self, data: bytes):
+        # unsolicited result code, on the PC UI port when selected
+        if self.Portsel and self.PcuiMaster is not None:
+            try:
+                os.write(self.PcuiMaster, data)
+            except OSError:
+                pass
+        else:
+            self.write(data)
+
+    def deliver(self, number: str, text: str, notify: bool = True):
+        # an sms arrives from network, stored then announced with +CMTI
+        with self.Sem:
+            index = self.store("REC UNREAD", number, text)
+        if notify:
+            self.notify(b'\r\n+CMTI: "ME",%d\r\n' % index)
+        return index
+
+    def store(self, status, number, text):
+        index = 1
+        while index in self.Storage:
+            index += 1
+        self.Storage[index] = [status, number, text, time.strftime("%y/%m/%d,%H:%M:%S+08")]
+        return index
+
+    def run(self):
+        next_rssi = time.monotonic() + self.Rssi
+        while self.Running:
+            if self.Rssi and time.monotonic() >= next_rssi:
+                self.notify(b'\r\n^RSSI: 20\r\n')
+                next_rssi += self.Rssi
+            ready = select.select([self.Master], [], [], 0.05)[0]
+            if not ready:
+                continue
+            try:
+                self.Buffer += os.read(self.Master, 4096)
+            except OSError:
+                break
+            self.parse()
+
+    def parse(self):
+        while self.Buffer:
+            if self.Prompt is not None:
+                end = min((i for i in (self.Buffer.find(bytes([CTRL_Z])), self.Buffer.find(bytes([ESCAPE])))
+                           if i >= 0), default=-1)
+                if end < 0:
+                    return
+                text, terminator = self.Buffer[:end], self.Buffer[end]
+                self.Buffer = self.Buffer[end+1:]
+                command, self.Prompt = self.Prompt, None
+                if terminator == CTRL_Z:
+                    self.respond(command, text)
+                continue
+            end = self.Buffer.find(b'\r')
+            if end < 0:
+                return
+            line, self.Buffer = self.Buffer[:end].strip(b'\n'), self.Buffer[end+1:]
+            if line:
+                if self.Echo:
+                    self.write(line + b'\r\r\n')
+                self.command(line.decode('ascii', 'replace'))
+
+    def delay(self, command):
+        latency = self.Latency
+        for prefix, seconds in self.Latencies.items():
+            if command.startswith(prefix):
+                latency = seconds
+        if latency:
+            time.sleep(latency)
+
+    def failed(self, command):
+        for prefix, probability in self.Errors.items():
+            if command.startswith(prefix) and random.random() < probability:
+                self.write(b'\r\n+CMS ERROR: 500\r\n')
+                return True
+        return False
+
+    def command(self, command: str):
+        self.Commands += 1
+        self.delay(command)
+        if self.failed(command):
+            return
+        if command.startswith(("AT+CMGW", "AT+CMGS=")):
+            self.Prompt = command
+            self.write(b'\r\n> ')
+            return
+        with self.Sem:
+            response = []
+            for part in command.split(';'):
+                lines = self.execute(part if part.startswith("AT") else "AT" + part)
+                if lines is None:
+                    response = None
+                    break
+                response += lines
+        if response is None:
+            self.write(b'\r\nERROR\r\n')
+        else:
+            self.write(b''.join(b'\r\n' + line for line in response) + b'\r\n\r\nOK\r\n')
+
+    def execute(self, command: str):
+        # response lines before OK, None for ERROR
+        if command == "ATZ":
+            self.Echo = True
+            self.Pdu = False
+            self.Cnmi = "0,0,0,0,0"
+        elif command.startswith("AT^PORTSEL="):
+            self.Portsel = int(command[11:])
+        elif command in ("ATE0", "ATE1"):
+            self.Echo = command == "ATE1"
+        elif command.startswith("AT+CMGF="):
+            self.Pdu = command.endswith("0")
+        elif command.startswith("AT+CSMP="):
+            self.Smp = int(command[8:].split(',')[0])
+        elif command.startswith("AT+CNMI="):
+            self.Cnmi = command[8:]
+        elif command.startswith("AT+CPMS="):
+            self.Cpms = command[8:].split(',')[0].strip('"')
+        elif command == "AT+CMGF?":
+            return [b'+CMGF: %d' % (0 if self.Pdu else 1)]
+        elif command == "AT+CNMI?":
+            return [b'+CNMI: ' + bytes(self.Cnmi, 'ascii')]
+        elif command == "AT+CPMS?":
+            return [bytes(('+CPMS: ' + ','.join(['"%s",%d,50' % (self.Cpms, len(self.Storage))] * 3)), 'ascii')]
+        elif command == "AT+CSQ":
+            return [b'+CSQ: 20,99']
+        elif command == "AT+CREG?":
+            return [b'+CREG: 0,%d' % self.Creg]
+        elif command == "AT+CPIN?":
+            return [b'+CPIN: READY']
+        elif command.startswith("AT+CMSS="):
+            fields = command[8:].split(',')
+            index = int(fields[0])
+            if index not in self.Storage:
+                return None
+            number = fields[1].strip('"') if len(fields) > 1 else self.Storage[index][1]
+            self.Storage[index][0] = "STO SENT"
+            return [b'+CMSS: %d' % self.send(number, self.Storage[index][2], self.Smp & 0x20)]
+        elif command.startswith("AT+CMGL="):
+            return [line for index in sorted(self.Storage) for line in self.listing(index, "+CMGL: %d," % index)]
+        elif command.startswith("AT+CMGR="):
+            index = int(command[8:])
+            if index not in self.Storage:
+                return None
+            return self.listing(index, "+CMGR: ")
+        elif command.startswith("AT+CMGD="):
+            fields = command[8:].split(',')
+            index, flag = int(fields[0]), int(fields[1]) if len(fields) > 1 else 0
+            deleted = {0: (), 1: ("REC READ",), 2: ("REC READ", "STO SENT"),
+                       3: ("REC READ", "STO SENT", "STO UNSENT")}.get(flag)
+            if deleted is None:
+                self.Storage.clear()
+            elif flag == 0:
+                self.Storage.pop(index, None)
+            else:
+                for index in [index for index, sms in self.Storage.items() if sms[0] in deleted]:
+                    del self.Storage[index]
+        return []
+
+    def listing(self, index, header):
+        sms = self.Storage[index]
+        status = sms[0]
+        if sms[0] == "REC UNREAD":
+            sms[0] = "REC READ"
+        if self.Pdu:
+            stat = ["REC UNREAD", "REC READ", "STO UNSENT", "STO SENT"].index(status)
+            pdu = submitToDeliver(encodeSubmit(sms[1], sms[2])[0][1])
+            return [bytes(header + "%d,,%d" % (stat, len(pdu) // 2 - 1), 'ascii'), bytes(pdu, 'ascii')]
+        text = encodeGSM7(sms[2])
+        return [bytes(header + '"%s","%s",,"%s",145,%d' % (status, sms[1], sms[3], len(text)), 'ascii'), text]
+
+    def send(self, number, message, report):
+        # sms sent on network, returns its message reference
+        self.Sent.append((number, message))
+        self.Reference = (self.Reference + 1) & 0xff
+        if report and self.Cnmi.split(',')[3] == '1':
+            threading.Timer(self.ReportDelay, self.statusReport, (self.Reference, number)).start()
+        return self.Reference
+
+    def statusReport(self, reference, number, status=0):
+        timestamp = "42105121000040"
+        if self.Pdu:
+            pdu = "0006%02X" % reference + encodeNumber(number).hex().upper() + timestamp * 2 + "%02X" % status
+            self.notify(b'\r\n+CDS: %d\r\n%s\r\n' % (len(pdu) // 2 - 1, bytes(pdu, 'ascii')))
+        else:
+            self.notify(b'\r\n+CDS: 6,%d,"%s",145,"24/01/15,12:00:00+04","24/01/15,12:00:00+04",%d\r\n'
+                       % (reference, bytes(number, 'ascii'), status))
+
+    def respond(self, command: str, text: bytes):
+        # text received after '> ' prompt
+        with self.Sem:
+            if self.Pdu:
+                sms = decodeDeliver(submitToDeliver(text.decode('ascii')))
+                number, message, report = sms['Number'], sms['Msg'], int(text[2:4], 16) & 0x20
+            else:
+                number, message, report = command.split('=', 1)[1].strip('"'), decodeGSM7(text), self.Smp & 0x20
+            if command.startswith("AT+CMGW"):
+                response = b'+CMGW: %d' % self.store("STO UNSENT", number, message)
+            else:
+                response = b'+CMGS: %d' % self.send(number, message, report)
+        self.write(b'\r\n' + response + b'\r\n\r\nOK\r\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated modem on a pseudo-terminal")
+    parser.add_argument("--latency", dest="latency", help="seconds before each response", default="0")
+    parser.add_argument("--pcui", dest="pcui", help="second tty for notifications, printed after the first", action="store_true")
+    options = parser.parse_args()
+    modem = fake_modem(float(options.latency), pcui=options.pcui)
+    print(modem.Device, flush=True)
+    if options.pcui:
+        print(modem.PcuiDevice, flush=True)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        modem.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024  Helios  helios14_75@hotmail.fr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# Replay of serial transcripts (sms_manager.py --capture, tools/corpus) into the reader of the gateway, without a modem
+#   python3 tools/replay_serial.py [transcript ...]          decoded events checked against <transcript>.json,
+#                                                            lines per second and memory of the reader
+#   python3 tools/replay_serial.py --update [transcript ...] expected events written from the current reader
+#   python3 tools/replay_serial.py --realtime [--speed 10]   chunks fed at the pace they were captured
+#   python3 tools/replay_serial.py --fuzz 200 [--seed 1]     received bytes split again at random boundaries
+# Transcripts default to tools/corpus/*.txt
+
+import os
+import sys
+import json
+import glob
+import time
+import random
+import logging
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from gsm import gsm                                     # noqa: E402
+from gsm_capture import gsm_capture                     # noqa: E402
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+
+
+class replay_modem(gsm):
+    # gsm without device: written bytes are dropped, a written command line starts the command whose response
+    # is in the transcript, received bytes go to the reader as they would from the tty.
+    # Events are what the gateway gets out of the bytes: commands with their result and decoded lines,
+    # +CMTI indexes and status reports.
+
+    def __init__(self):
+        gsm.__init__(self, logging.CRITICAL, "replay", "modem", "replay", "0000", "*", "sms_received", None,
+                     notify="replay-notify", telemetry=0, trace=0)
+        self.Events = []
+
+    def writeData(self, frame: bytes):
+        pass
+
+    def startCommand(self, frame: bytes):
+        if self.GsmIoCommand is not None:
+            # no final result code in the transcript, as when the deadline passes
+            self.finishCommand(None, 'timeout')
+            self.GsmIoTimeouts = 0
+        self.writeCommand(frame).addDoneCallback(self.onCommandDone)
+
+    def onCommandDone(self, command):
+        frame = command.Frame.decode('ascii', 'replace')
+        lines = command.Lines
+        if command.ok and (b'+CMGF=0' in command.Frame or b'+CMGF: 0' in lines):
+            self.Pdu = True
+        elif command.ok and (b'+CMGF=1' in command.Frame or b'+CMGF: 1' in lines):
+            self.Pdu = False
+        if not command.ok:
+            decoded = [line.decode('latin-1') for line in lines]
+        elif frame.startswith("AT+CMGL"):
+            if self.Pdu:
+                messages = [self.parsePdu(*fields) for fields in self.parseCMGLPdu(lines)]
+            else:
+                messages = self.parseCMGL(lines)
+            decoded = [self.smsEvent(sms) for sms in messages]
+        elif frame.startswith("AT+CMGR") and lines and lines[0].startswith(b'+CMGR:'):
+            report = self.parseReport(lines)
+            if report is not None:
+                decoded = list(report)
+            elif self.Pdu:
+                status = lines[0][6:].decode('ascii').split(',')[0].strip()
+                decoded = self.smsEvent(self.parsePdu(frame[8:], status, lines[1].decode('ascii')))
+            else:
+                decoded = self.smsEvent(self.parseCMGR(frame[8:], lines))
+        elif frame.startswith(("AT+CMGS", "AT+CMGW", "AT+CMSS")):
+            decoded = [line.decode('latin-1') for line in lines if line[:6] in (b'+CMGS:', b'+CMGW:', b'+CMSS:')]
+        else:
+            decoded = [line.decode('latin-1') for line in lines]
+        self.Events.append(["command", frame, command.Error or "OK", decoded])
+
+    @staticmethod
+    def smsEvent(sms):
+        if sms is None:
+            return None
+        return [sms['Id'], sms['Number'], sms['Status'], sms['Msg']] + \
+               ([sms['Part'], sms['Parts']] if 'Parts' in sms else [])
+
+    def onGsmCMTI(self, line: bytes):
+        self.Events.append(["cmti", line.split(b',')[-1].strip().decode('ascii')])
+
+    def onStatusReport(self, reference: int, status: int):
+        self.Events.append(["report", reference, status])
+
+    def feed(self, direction: str, data: bytes):
+        if direction == "tx":
+            if data.endswith(b'\r'):
+                self.startCommand(data[:-1])
+            # sms text or pdu after the prompt, escape: not a command
+        elif direction == "rx2":
+            self.Notify.feedGsmIoData(data)
+        else:
+            self.feedGsmIoData(data)
+
+
+def replay(chunks, realtime: bool = False, speed: float = 1.0):
+    modem = replay_modem()
+    start = time.monotonic()
+    for seconds, direction, data in chunks:
+        if realtime:
+            delay = start + seconds / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        modem.feed(direction, data)
+    return modem.Events
+
+
+def rechunk(chunks, rng):
+    # consecutive chunks read on the same port joined, then split at random boundaries (inside crlf, prompts, ...),
+    # nothing moves across a written command
+    result = []
+    i = 0
+    while i < len(chunks):
+        seconds, direction, data = chunks[i]
+        i += 1
+        if direction == "tx":
+            result.append((seconds, direction, data))
+            continue
+        while i < len(chunks) and chunks[i][1] == direction:
+            data += chunks[i][2]
+            i += 1
+        position = 0
+        while position < len(data):
+            size = rng.choice((1, 1, 2, 3, 5, 8, 16, 64, len(data)))
+            result.append((seconds, direction, data[position:position + size]))
+            position += size
+    return result
+
+
+def firstDifference(events, expected):
+    for i, (event, wanted) in enumerate(zip(events, expected)):
+        if event != wanted:
+            return f"event {i}: {json.dumps(event)} instead of {json.dumps(wanted)}"
+    return f"{len(events)} events instead of {len(expected)}"
+
+
+def measure(chunks, repeat: int):
+    # reader throughput on the whole transcript, memory of one replay
+    lines = sum(data.count(b'\r\n') for seconds, direction, data in chunks if direction != "tx")
+    size = sum(len(data) for seconds, direction, data in chunks if direction != "tx")
+    modems = [replay_modem() for i in range(repeat)]
+    start = time.perf_counter()
+    for modem in modems:
+        for seconds, direction, data in chunks:
+            modem.feed(direction, data)
+    elapsed = time.perf_counter() - start
+    modem = replay_modem()
+    tracemalloc.start()
+    for seconds, direction, data in chunks:
+        modem.feed(direction, data)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return lines, lines * repeat / elapsed, size * repeat / elapsed / 1e6, peak / 1024, current / max(1, lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay of serial transcripts into the gateway reader")
+    parser.add_argument("transcripts", nargs="*", help="transcript files, tools/corpus/*.txt if none")
+    parser.add_argument("--update", dest="update", help="write expected events", action="store_true")
+    parser.add_argument("--realtime", dest="realtime", help="feed chunks at their captured time", action="store_true")
+    parser.add_argument("--speed", dest="speed", help="time factor of --realtime", default="1")
+    parser.add_argument("--fuzz", dest="fuzz", help="replays with chunks split at random", default="0")
+    parser.add_argument("--seed", dest="seed", help="seed of --fuzz", default="1")
+    parser.add_argument("--repeat", dest="repeat", help="replays measured per transcript", default="20")
+    options = parser.parse_args()
+    transcripts = options.transcripts or sorted(glob.glob(os.path.join(CORPUS, "*.txt")))
+    rng = random.Random(int(options.seed))
+    failed = 0
+
+    for transcript in transcripts:
+        name = os.path.basename(transcript)
+        chunks = list(gsm_capture.read(transcript))
+        events = replay(chunks, options.realtime, float(options.speed))
+        expected_file = os.path.splitext(transcript)[0] + ".json"
+        if options.update:
+            with open(expected_file, "w", encoding="utf-8") as expected:
+                # one event per line, readable diffs when the reader changes
+                expected.write("[\n" + ",\n".join(json.dumps(event, ensure_ascii=False) for event in events) + "\n]\n")
+            print(f"{name:<24} {len(events)} events written")
+            continue
+        try:
+            with open(expected_file, encoding="utf-8") as expected:
+                wanted = json.load(expected)
+        except OSError:
+            print(f"{name:<24} no expected events, run with --update")
+            failed += 1
+            continue
+        events = json.loads(json.dumps(events))     # tuples as lists
+        if events != wanted:
+            print(f"{name:<24} FAILED {firstDifference(events, wanted)}")
+            failed += 1
+            continue
+        for run in range(int(options.fuzz)):
+            fuzzed = json.loads(json.dumps(replay(rechunk(chunks, rng))))
+            if fuzzed != wanted:
+                print(f"{name:<24} FAILED fuzz run {run}: {firstDifference(fuzzed, wanted)}")
+                failed += 1
+                break
+        lines, rate, throughput, peak, retained = measure(chunks, int(options.repeat))
+        print(f"{name:<24} ok {len(events):>4} events {lines:>6} lines {rate:>10.0f} lines/s {throughput:7.2f} MB/s "
+              f"peak {peak:7.1f} KB, {retained:5.0f} B kept/line")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()